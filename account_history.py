@@ -0,0 +1,162 @@
+"""账户权益历史
+
+账户推送按固定间隔采样写入 account_history，近期数据保留原始精度；
+超过保留期的采样汇总为1分钟权益K线，1分钟K线超过保留期后再汇总为1小时K线，
+存储量和查询量不随运行时间无限增长。
+"""
+import logging
+from typing import Dict, List, Optional
+
+from database import now_ms
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+RESOLUTIONS = {'raw': 0, '1m': MINUTE_MS, '1h': HOUR_MS}
+
+DEFAULT_SAMPLE_INTERVAL = 5   # 采样间隔（秒）
+DEFAULT_RAW_HOURS = 24        # 原始采样保留时长（小时）
+DEFAULT_MINUTE_DAYS = 30      # 1分钟K线保留时长（天），1小时K线一直保留
+
+MAX_POINTS = 5000  # 单次查询最多返回的数据点
+
+
+class AccountSampler:
+    """账户采样节流，两次采样至少间隔 interval 秒"""
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.last_sample_ms: Optional[int] = None
+
+    def due(self, timestamp_ms: int) -> bool:
+        if self.last_sample_ms is not None and timestamp_ms - self.last_sample_ms < self.interval * 1000:
+            return False
+        self.last_sample_ms = timestamp_ms
+        return True
+
+
+def record_sample(c, snapshot: Dict, timestamp_ms: int):
+    c.execute('''
+        INSERT OR REPLACE INTO account_history (timestamp_ms, balance, equity, available, position_profit)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (timestamp_ms, snapshot['balance'], snapshot['equity'],
+          snapshot['available'], snapshot['position_profit']))
+
+
+def _bucket_bars(points, period_ms: int) -> List[List]:
+    """把按时间排序的 (时间, 开, 高, 低, 收, 余额, 采样数) 合并为 period_ms 周期的K线"""
+    bars = []
+    for timestamp_ms, open_, high, low, close, balance, samples in points:
+        start = timestamp_ms - timestamp_ms % period_ms
+        if bars and bars[-1][0] == start:
+            bar = bars[-1]
+            bar[2] = max(bar[2], high)
+            bar[3] = min(bar[3], low)
+            bar[4] = close
+            bar[5] = balance
+            bar[6] += samples
+        else:
+            bars.append([start, open_, high, low, close, balance, samples])
+    return bars
+
+
+def _upsert_bars(c, resolution_ms: int, bars: List[List]):
+    c.executemany('''
+        INSERT INTO account_bars (resolution_ms, start_ms, open, high, low, close, balance, samples)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (resolution_ms, start_ms) DO UPDATE SET
+            high = MAX(high, excluded.high),
+            low = MIN(low, excluded.low),
+            close = excluded.close,
+            balance = excluded.balance,
+            samples = samples + excluded.samples
+    ''', [(resolution_ms, *bar) for bar in bars])
+
+
+def _raw_points(c, start_ms: int, end_ms: int):
+    c.execute('''
+        SELECT timestamp_ms, equity, equity, equity, equity, balance, 1
+        FROM account_history
+        WHERE timestamp_ms >= ? AND timestamp_ms < ?
+        ORDER BY timestamp_ms
+    ''', (start_ms, end_ms))
+    return c.fetchall()
+
+
+def _bar_points(c, resolution_ms: int, start_ms: int, end_ms: int):
+    c.execute('''
+        SELECT start_ms, open, high, low, close, balance, samples
+        FROM account_bars
+        WHERE resolution_ms = ? AND start_ms >= ? AND start_ms < ?
+        ORDER BY start_ms
+    ''', (resolution_ms, start_ms, end_ms))
+    return c.fetchall()
+
+
+def rollup(c, raw_hours: float = DEFAULT_RAW_HOURS, minute_days: float = DEFAULT_MINUTE_DAYS,
+           now: Optional[int] = None) -> Dict[str, int]:
+    """把超过保留期的采样汇总为1分钟K线、1分钟K线汇总为1小时K线，返回各级删除的行数
+
+    截止时间按周期对齐，只汇总完整的周期。
+    """
+    now = now if now is not None else now_ms()
+
+    raw_cutoff = now - int(raw_hours * HOUR_MS)
+    raw_cutoff -= raw_cutoff % MINUTE_MS
+    points = _raw_points(c, 0, raw_cutoff)
+    if points:
+        _upsert_bars(c, MINUTE_MS, _bucket_bars(points, MINUTE_MS))
+        c.execute('DELETE FROM account_history WHERE timestamp_ms < ?', (raw_cutoff,))
+
+    minute_cutoff = now - int(minute_days * 24 * HOUR_MS)
+    minute_cutoff -= minute_cutoff % HOUR_MS
+    minutes = _bar_points(c, MINUTE_MS, 0, minute_cutoff)
+    if minutes:
+        _upsert_bars(c, HOUR_MS, _bucket_bars(minutes, HOUR_MS))
+        c.execute('DELETE FROM account_bars WHERE resolution_ms = ? AND start_ms < ?',
+                  (MINUTE_MS, minute_cutoff))
+
+    return {'raw': len(points), '1m': len(minutes)}
+
+
+def choose_resolution(start_ms: int, end_ms: int) -> str:
+    """按查询跨度选择精度，返回的数据点数不超过几千个"""
+    span = end_ms - start_ms
+    if span <= 6 * HOUR_MS:
+        return 'raw'
+    if span <= 3 * 24 * HOUR_MS:
+        return '1m'
+    return '1h'
+
+
+def query_equity(c, start_ms: int, end_ms: int, resolution: str = 'auto') -> List[Dict]:
+    """查询权益曲线
+
+    resolution 为 raw/1m/1h/auto。各级数据按时间分段存储，三级数据一起读出，
+    比要求精度细的数据现场汇总，已汇总为更粗周期的时间段按原周期返回，
+    曲线在保留期边界处连续。
+    """
+    if resolution == 'auto':
+        resolution = choose_resolution(start_ms, end_ms)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of: auto, {', '.join(RESOLUTIONS)}")
+    period = RESOLUTIONS[resolution]
+
+    points = (_bar_points(c, HOUR_MS, start_ms, end_ms)
+              + _bar_points(c, MINUTE_MS, start_ms, end_ms)
+              + _raw_points(c, start_ms, end_ms))
+    points.sort(key=lambda point: point[0])
+
+    bars = _bucket_bars(points, period) if period else [list(point) for point in points]
+    if len(bars) > MAX_POINTS:
+        bars = bars[-MAX_POINTS:]
+    return [{
+        'timestamp_ms': bar[0],
+        'open': bar[1],
+        'high': bar[2],
+        'low': bar[3],
+        'close': bar[4],
+        'balance': bar[5],
+        'samples': bar[6],
+    } for bar in bars]
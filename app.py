@@ -1,9 +1,19 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import sqlite3
+import hashlib
 import json
+import math
+import time
 from datetime import datetime
 import logging
+from signal_notifier import notify_signal
+from database import get_database, now_ms
+from pnl_ledger import query_round_trips
+from account_history import query_equity
+from latency_tracer import day_range, query_latency, query_slowest
+from log_tail import tail_lines, follow_lines, level_marker
+from event_bus import EVENT_SIGNAL, EVENT_TYPES, publish_events, follow_events
+from idempotency import DedupWindow, IDEMPOTENCY_HEADER, resolve_key
 
 app = Flask(__name__)
 
@@ -14,63 +24,146 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 写入与查询分别使用读写连接池和只读连接池
+db = get_database()
+read_db = get_database(read_only=True)
+
 def init_db():
-    conn = sqlite3.connect('signals.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS trading_signals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            action TEXT NOT NULL,
-            price REAL NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            volume INTEGER DEFAULT 1,
-            strategy TEXT,
-            processed BOOLEAN DEFAULT FALSE,
-            process_time DATETIME,
-            order_id TEXT,
-            status TEXT DEFAULT 'pending',
-            message TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    db.init_database()
 
 @app.after_request
 def apply_cors_headers(response):
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Last-Event-ID, Idempotency-Key"
     return response
 
+SIGNAL_REQUIRED_FIELDS = ['symbol', 'action', 'price', 'strategy']
+MAX_BATCH_SIZE = 500  # 单次批量请求的最大信号数
+
+# 最近写入信号的幂等键
+dedup_window = DedupWindow()
+
+INSERT_SIGNAL_SQL = '''
+    INSERT INTO trading_signals (symbol, action, price, volume, strategy, processed, status, timestamp_ms, idem_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def build_signal_row(data, idempotency_key=None):
+    """校验信号并转换为入库参数，校验失败抛出ValueError"""
+    if not isinstance(data, dict) or not all(field in data for field in SIGNAL_REQUIRED_FIELDS):
+        raise ValueError('Missing required fields')
+    if not isinstance(data['symbol'], str) or not data['symbol'].strip():
+        raise ValueError('Invalid symbol')
+    if not isinstance(data['action'], str):
+        raise ValueError('Invalid action')
+    if not isinstance(data['strategy'], str):
+        raise ValueError('Invalid strategy')
+    # 价格可以是数字或数字字符串，null、布尔值和非数字在入库前拒绝，不触发约束错误
+    if isinstance(data['price'], bool):
+        raise ValueError('Invalid price')
+    try:
+        price = float(data['price'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid price')
+    if not math.isfinite(price):
+        raise ValueError('Invalid price')
+    return (
+        data['symbol'],
+        data['action'].upper(),
+        price,
+        1,
+        data['strategy'],
+        False,
+        'pending',
+        now_ms(),
+        resolve_key(data, idempotency_key)
+    )
+
+def signal_events(rows, signal_ids):
+    """生成与入库信号对应的推送事件"""
+    return [(EVENT_SIGNAL, {
+        'id': signal_id,
+        'symbol': row[0],
+        'action': row[1],
+        'price': row[2],
+        'volume': row[3],
+        'strategy': row[4],
+        'status': row[6],
+        'timestamp_ms': row[7]
+    }) for row, signal_id in zip(rows, signal_ids)]
+
+def find_duplicates(c, rows):
+    """判断每条信号是否重复
+
+    先查内存窗口，未命中的键再通过唯一索引批量查询，同一批内的重复也会被识别。
+    """
+    keys = [row[8] for row in rows]
+    duplicates = [key in dedup_window for key in keys]
+    unknown = list({key for key, duplicate in zip(keys, duplicates) if not duplicate})
+    existing = set()
+    if unknown:
+        c.execute(f"SELECT idem_key FROM trading_signals WHERE idem_key IN ({', '.join('?' * len(unknown))})",
+                  unknown)
+        existing = {row[0] for row in c.fetchall()}
+    seen = set()
+    for index, key in enumerate(keys):
+        if not duplicates[index]:
+            duplicates[index] = key in existing or key in seen
+        seen.add(key)
+    return duplicates
+
+def insert_signals(c, rows):
+    """在调用方的写事务内写入信号，返回与rows对应的ID，重复信号为None"""
+    duplicates = find_duplicates(c, rows)
+    fresh = [row for row, duplicate in zip(rows, duplicates) if not duplicate]
+    fresh_ids = []
+    if fresh:
+        c.executemany(INSERT_SIGNAL_SQL, fresh)
+        # 写锁内AUTOINCREMENT连续分配，据此回填每条信号的ID
+        last_id = c.execute('SELECT last_insert_rowid()').fetchone()[0]
+        fresh_ids = range(last_id - len(fresh) + 1, last_id + 1)
+        publish_events(c, signal_events(fresh, fresh_ids))
+    fresh_ids = iter(fresh_ids)
+    return [None if duplicate else next(fresh_ids) for duplicate in duplicates]
+
+def record_inserted(rows, signal_ids):
+    """提交成功后更新幂等窗口和重复计数"""
+    suppressed = 0
+    for row, signal_id in zip(rows, signal_ids):
+        if signal_id is None:
+            suppressed += 1
+        else:
+            dedup_window.add(row[8])
+    if suppressed:
+        dedup_window.record_suppressed(suppressed)
+        logger.info(f"Suppressed {suppressed} duplicate signals")
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
+    # 延迟统计的起点，与执行器使用同一单调时钟
+    received_ns = time.monotonic_ns()
     try:
         data = request.json
         
         # 验证必要字段
-        required_fields = ['symbol', 'action', 'price', 'strategy']
-        if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
+        try:
+            row = build_signal_row(data, request.headers.get(IDEMPOTENCY_HEADER))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        conn = sqlite3.connect('signals.db')
-        c = conn.cursor()
+        with db.get_cursor() as c:
+            # 查重与写入在同一个写事务内，避免并发请求同时通过检查
+            c.execute('BEGIN IMMEDIATE')
+            signal_id, = insert_signals(c, [row])
+        committed_ns = time.monotonic_ns()
+        record_inserted([row], [signal_id])
         
-        c.execute('''
-            INSERT INTO trading_signals (symbol, action, price, volume, strategy, processed, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['symbol'],
-            data['action'].upper(),
-            data['price'],
-            1,
-            data['strategy'],
-            False,
-            'pending'
-        ))
+        if signal_id is None:
+            return jsonify({'success': True, 'duplicate': True, 'message': 'Duplicate signal ignored'})
         
-        conn.commit()
-        conn.close()
+        # 提交后立即唤醒交易执行器
+        notify_signal(signal_id, traces=[(signal_id, signal_id, received_ns, committed_ns)])
         
         logger.info(f"Received signal: {json.dumps(data)}")
         return jsonify({'success': True, 'message': 'Signal received'})
@@ -79,59 +172,262 @@ def webhook():
         logger.error(f"Error processing webhook: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def parse_batch(data):
+    """拆分批量请求，返回(逐条结果, 合法信号的入库参数)"""
+    items = data.get('signals') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty array of signals')
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f'Batch too large, max {MAX_BATCH_SIZE} signals')
+    
+    results = []
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(build_signal_row(item))
+            results.append({'index': index, 'success': True})
+        except ValueError as e:
+            results.append({'index': index, 'success': False, 'error': str(e)})
+    return results, rows
+
+def batch_response(results, signal_ids):
+    """按顺序把信号ID回填到逐条结果中，重复信号标记duplicate"""
+    signal_ids = iter(signal_ids)
+    for result in results:
+        if result['success']:
+            signal_id = next(signal_ids)
+            if signal_id is None:
+                result['duplicate'] = True
+            else:
+                result['id'] = signal_id
+    valid = sum(1 for result in results if result['success'])
+    duplicates = sum(1 for result in results if result.get('duplicate'))
+    return {
+        'success': valid == len(results),
+        'accepted': valid - duplicates,
+        'duplicates': duplicates,
+        'rejected': len(results) - valid,
+        'results': results
+    }
+
+@app.route('/webhook/batch', methods=['POST'])
+def webhook_batch():
+    """批量接收信号，所有合法信号在同一个事务内写入"""
+    received_ns = time.monotonic_ns()
+    try:
+        try:
+            results, rows = parse_batch(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        signal_ids = []
+        if rows:
+            with db.get_cursor() as c:
+                c.execute('BEGIN IMMEDIATE')
+                signal_ids = insert_signals(c, rows)
+            committed_ns = time.monotonic_ns()
+            record_inserted(rows, signal_ids)
+            
+            inserted = [signal_id for signal_id in signal_ids if signal_id is not None]
+            if inserted:
+                # 同一事务内新写入的信号ID连续
+                notify_signal(inserted[-1], traces=[(inserted[0], inserted[-1], received_ns, committed_ns)])
+        
+        logger.info(f"Received signal batch: {len(rows)} valid, {len(results) - len(rows)} rejected")
+        return jsonify(batch_response(results, signal_ids))
+        
+    except Exception as e:
+        logger.error(f"Error processing webhook batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# /api/signals 可选的返回字段
+SIGNAL_FIELDS = ['id', 'symbol', 'action', 'price', 'timestamp', 'timestamp_ms', 'volume',
+                 'strategy', 'processed', 'status', 'process_time', 'order_id', 'message']
+DEFAULT_SIGNAL_FIELDS = ['id', 'symbol', 'action', 'price', 'timestamp', 'volume',
+                         'strategy', 'processed', 'status']
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def build_signals_query(args):
+    """根据查询参数生成分页SQL，参数不合法时抛出ValueError"""
+    fields = DEFAULT_SIGNAL_FIELDS
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in SIGNAL_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields = ['id'] + fields  # 游标分页依赖id
+
+    limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    conditions = []
+    params = []
+    if args.get('since_id') is not None and args.get('before_id') is not None:
+        raise ValueError('since_id and before_id are mutually exclusive')
+    if args.get('since_id') is not None:
+        # 增量拉取：按id升序返回游标之后的新信号
+        conditions.append('id > ?')
+        params.append(int(args['since_id']))
+        order = 'ASC'
+    else:
+        # 默认从最新信号开始向前翻页
+        if args.get('before_id') is not None:
+            conditions.append('id < ?')
+            params.append(int(args['before_id']))
+        order = 'DESC'
+    if args.get('symbol'):
+        conditions.append('symbol = ?')
+        params.append(args['symbol'])
+    if args.get('status'):
+        conditions.append('status = ?')
+        params.append(args['status'])
+    if args.get('start') is not None:
+        conditions.append('timestamp_ms >= ?')
+        params.append(int(args['start']))
+    if args.get('end') is not None:
+        conditions.append('timestamp_ms < ?')
+        params.append(int(args['end']))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    sql = f"SELECT {', '.join(fields)} FROM trading_signals {where} ORDER BY id {order} LIMIT ?"
+    params.append(limit)
+    return sql, params, fields, limit
+
+def signals_etag(c, args):
+    """由信号表变更计数、最大id和查询参数生成ETag，无需执行分页查询"""
+    version, max_id = c.execute('''
+        SELECT version, (SELECT MAX(id) FROM trading_signals) FROM signal_version
+    ''').fetchone()
+    key = '&'.join(f'{k}={v}' for k, v in sorted(args.items(multi=True)))
+    return hashlib.sha1(f'{version}:{max_id}:{key}'.encode()).hexdigest()
+
 @app.route('/api/signals', methods=['GET'])
 def get_signals():
     try:
-        conn = sqlite3.connect('signals.db')
-        c = conn.cursor()
+        try:
+            sql, params, fields, limit = build_signals_query(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        c.execute('SELECT id, symbol, action, price, timestamp, volume, strategy, processed, status FROM trading_signals ORDER BY timestamp DESC')
-        rows = c.fetchall()
+        with read_db.get_cursor() as c:
+            # 先于分页查询读取，期间有新写入时ETag只会偏旧，下次请求照常返回新内容
+            etag = signals_etag(c, request.args)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            c.execute(sql, params)
+            rows = c.fetchall()
         
-        signals = []
-        for row in rows:
-            signals.append({
-                'id': row[0],
-                'symbol': row[1], 
-                'action': row[2],
-                'price': row[3],
-                'timestamp': row[4],
-                'volume': row[5],
-                'strategy': row[6],
-                'processed': bool(row[7]),
-                'status': row[8]
-            })
+        signals = [dict(zip(fields, row)) for row in rows]
+        if 'processed' in fields:
+            for signal in signals:
+                signal['processed'] = bool(signal['processed'])
         
-        return jsonify({'success': True, 'data': signals})
+        ids = [signal['id'] for signal in signals]
+        response = jsonify({
+            'success': True,
+            'data': signals,
+            # 下一页游标，取满一页时才可能还有更多数据
+            'next_before_id': min(ids) if len(ids) == limit and 'since_id' not in request.args else None,
+            'latest_id': max(ids) if ids else None
+        })
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching signals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+LOG_FILE = 'trading.log'
+MAX_LOG_LINES = 5000
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
     try:
-        # 读取最后100行日志
-        with open('trading.log', 'r') as f:
-            logs = f.readlines()[-100:]
+        # 从文件末尾读取最后若干行日志，默认100行，可按级别过滤
+        try:
+            lines = min(int(request.args.get('lines', 100)), MAX_LOG_LINES)
+            level_marker(request.args.get('level'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        logs = tail_lines(LOG_FILE, lines=lines, level=request.args.get('level'))
         return jsonify({'logs': logs})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/logs/stream', methods=['GET'])
+def stream_logs():
+    """以Server-Sent Events推送新追加的日志行"""
+    level = request.args.get('level')
+    try:
+        level_marker(level)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        for line in follow_lines(LOG_FILE, level=level, idle_timeout=15):
+            if line is None:
+                yield ': keep-alive\n\n'  # 心跳，防止代理断开空闲连接
+            else:
+                yield f"data: {line.rstrip()}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/events/stream', methods=['GET'])
+def stream_events():
+    """以Server-Sent Events推送信号、订单、成交和账户变更
+
+    每个事件的id为递增序号，断线重连时浏览器会通过Last-Event-ID自动续传；
+    也可用since参数指定起始序号，未指定时只推送连接之后的新事件。
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()]
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'since must be an event sequence number'}), 400
+    unknown = [t for t in types if t not in EVENT_TYPES]
+    if unknown:
+        return jsonify({'error': f"Unknown event types: {', '.join(unknown)}"}), 400
+    
+    def generate():
+        # 独占一个只读连接，PRAGMA data_version只在本连接上反映其他连接的提交
+        conn = read_db.connect()
+        try:
+            for event in follow_events(conn, since_seq=since, types=types, idle_timeout=15):
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    seq, event_type, _, payload = event
+                    yield f"id: {seq}\nevent: {event_type}\ndata: {payload}\n\n"
+        finally:
+            conn.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/stats/dedup', methods=['GET'])
+def get_dedup_stats():
+    """本进程拦截的重复信号数和幂等窗口大小"""
+    return jsonify({'success': True, 'data': dedup_window.stats()})
+
 @app.route('/api/account', methods=['GET'])
 def get_account():
     try:
-        conn = sqlite3.connect('signals.db')
-        c = conn.cursor()
-        
         # 获取最新的账户数据
-        c.execute('''
-            SELECT balance, equity, available, position_profit, timestamp
-            FROM account_info
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
-        row = c.fetchone()
+        with read_db.get_cursor() as c:
+            c.execute('''
+                SELECT balance, equity, available, position_profit, timestamp
+                FROM account_info
+                ORDER BY timestamp DESC
+                LIMIT 1
+            ''')
+            row = c.fetchone()
         
         if row:
             account_data = {
@@ -149,128 +445,79 @@ def get_account():
         logger.error(f"Error fetching account data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/profits', methods=['GET'])
-def get_profits():
+@app.route('/api/account/history', methods=['GET'])
+def get_account_history():
+    """权益曲线，默认最近24小时，精度按时间跨度自动选择"""
     try:
-        conn = sqlite3.connect('signals.db')
-        c = conn.cursor()
+        try:
+            end = int(request.args['end']) if request.args.get('end') else now_ms()
+            start = int(request.args['start']) if request.args.get('start') else end - 24 * 3600 * 1000
+        except ValueError:
+            return jsonify({'error': 'start and end must be epoch milliseconds'}), 400
         
-        # 加载合约规格
-        contract_specs = {
-            # 中金所
-            'IF': {'size': 300, 'fee': {'open': 0, 'close': 0}},   # 沪深300股指
-            'IC': {'size': 200, 'fee': {'open': 0, 'close': 0}},   # 中证500股指
-            'IH': {'size': 300, 'fee': {'open': 0, 'close': 0}},   # 上证50股指
-            'IM': {'size': 200, 'fee': {'open': 0, 'close': 0}},   # 中证1000股指
-            
-            # 上期所
-            'AU': {'size': 1000, 'fee': {'open': 0, 'close': 0}},  # 黄金
-            'AG': {'size': 15, 'fee': {'open': 0, 'close': 0}},    # 白银
-            'CU': {'size': 5, 'fee': {'open': 0, 'close': 0}},     # 铜
-            'AL': {'size': 5, 'fee': {'open': 0, 'close': 0}},     # 铝
-            'ZN': {'size': 5, 'fee': {'open': 0, 'close': 0}},     # 锌
-            'AO': {'size': 5, 'fee': {'open': 24.17, 'close': 23.99}},     # 氧化铝
-            'RB': {'size': 10, 'fee': {'open': 3.35, 'close': 3.36}},    # 螺纹钢，按手数收费
-            'BU': {'size': 10, 'fee': {'open': 1.67, 'close': 0.01}},    # 沥青，按手数收费
-            'SP': {'size': 20, 'fee': {'open': 2.92, 'close': 0.01}},    # 纸浆，按手数收费
-            'HC': {'size': 10, 'fee': {'open': 0, 'close': 0}},    # 热卷
-            
-            # 大商所
-            'M': {'size': 10},     # 豆粕
-            'Y': {'size': 10},     # 豆油
-            'C': {'size': 10},     # 玉米
-            'I': {'size': 100},    # 铁矿石
-            'PP': {'size': 5},     # 聚丙烯
-            
-            # 郑商所
-            'SR': {'size': 10},    # 白糖
-            'MA': {'size': 10},    # 甲醇
-            'TA': {'size': 5},     # PTA
-            'AP': {'size': 10},    # 苹果
-            'CF': {'size': 5},     # 棉花
-        }
+        with read_db.get_cursor() as c:
+            try:
+                bars = query_equity(c, start, end, request.args.get('resolution', 'auto'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
-        # 按时间顺序获取所有交易信号
-        c.execute('''
-            SELECT id, symbol, action, price, timestamp, strategy, status, volume
-            FROM trading_signals 
-            WHERE status = 'filled'  -- 只查询已成交的订单
-            ORDER BY timestamp ASC
-        ''')
-        rows = c.fetchall()
+        return jsonify({'success': True, 'data': bars})
         
-        profits = []
-        open_positions = {}  # 用于跟踪开仓状态: {symbol: {direction, price, time, volume}}
+    except Exception as e:
+        logger.error(f"Error fetching account history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/latency', methods=['GET'])
+def get_latency():
+    """信号各阶段延迟分位数(微秒)，默认当天全部合约"""
+    try:
+        try:
+            days = int(request.args.get('days', 1))
+        except ValueError:
+            return jsonify({'error': 'days must be an integer'}), 400
+        start_day, end_day = day_range(days)
+
+        with read_db.get_cursor() as c:
+            data = query_latency(c, start_day, end_day, request.args.get('symbol'))
+
+        return jsonify({'success': True, 'start_day': start_day, 'end_day': end_day, 'data': data})
+
+    except Exception as e:
+        logger.error(f"Error fetching latency stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/latency/traces', methods=['GET'])
+def get_latency_traces():
+    """最慢信号的各阶段时间(相对最早阶段的微秒数)"""
+    try:
+        try:
+            days = int(request.args.get('days', 1))
+            limit = min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'days and limit must be integers'}), 400
+        start_day, end_day = day_range(days)
+
+        with read_db.get_cursor() as c:
+            traces = query_slowest(c, start_day, end_day, limit, request.args.get('symbol'))
+
+        return jsonify({'success': True, 'data': traces})
+
+    except Exception as e:
+        logger.error(f"Error fetching latency traces: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/profits', methods=['GET'])
+def get_profits():
+    try:
+        # 可选按平仓时间(毫秒时间戳)和品种筛选
+        try:
+            start = int(request.args['start']) if request.args.get('start') else None
+            end = int(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return jsonify({'error': 'start and end must be epoch milliseconds'}), 400
         
-        for row in rows:
-            id, symbol, action, price, timestamp, strategy, status, volume = row
-            
-            # 获取合约基础代码（去除月份）
-            base_symbol = ''.join(filter(str.isalpha, symbol.upper()))
-            contract_info = contract_specs.get(base_symbol, {'size': 1, 'fee': {'open': 0, 'close': 0}})
-            contract_size = contract_info['size']
-            
-            if action.upper() in ['BUY', 'LONG']:
-                if symbol not in open_positions:
-                    # 开多仓
-                    fee = contract_info['fee']['open'] * volume  # 计算开仓手续费
-                    open_positions[symbol] = {
-                        'direction': 'LONG',
-                        'price': price,
-                        'time': timestamp,
-                        'id': id,
-                        'volume': volume,
-                        'open_fee': fee
-                    }
-                    
-            elif action.upper() in ['SELL', 'SHORT']:
-                if symbol not in open_positions:
-                    # 开空仓
-                    fee = contract_info['fee']['open'] * volume  # 计算开仓手续费
-                    open_positions[symbol] = {
-                        'direction': 'SHORT',
-                        'price': price,
-                        'time': timestamp,
-                        'id': id,
-                        'volume': volume,
-                        'open_fee': fee
-                    }
-                    
-            elif action.upper() in ['CLOSE_LONG', 'CLOSE_SHORT', 'SELL_CLOSE', 'BUY_CLOSE']:
-                if symbol in open_positions:
-                    # 计算盈亏
-                    open_pos = open_positions[symbol]
-                    point_profit = 0
-                    
-                    if open_pos['direction'] == 'LONG':
-                        point_profit = price - open_pos['price']
-                    else:  # SHORT
-                        point_profit = open_pos['price'] - price
-                    
-                    # 计算平仓手续费
-                    close_fee = contract_info['fee']['close'] * open_pos['volume']
-                    total_fee = open_pos['open_fee'] + close_fee
-                    
-                    # 计算实际盈亏 = 点数 * 合约规模 * 手数 - 总手续费
-                    actual_profit = (point_profit * contract_size * open_pos['volume']) - total_fee
-                        
-                    # 添加到盈亏列表
-                    profits.append({
-                        'id': open_pos['id'],
-                        'symbol': symbol,
-                        'direction': open_pos['direction'],
-                        'openTime': open_pos['time'],
-                        'closeTime': timestamp,
-                        'openPrice': open_pos['price'],
-                        'closePrice': price,
-                        'volume': open_pos['volume'],
-                        'pointProfit': round(point_profit, 2),
-                        'fee': round(total_fee, 2),
-                        'profit': round(actual_profit, 2)
-                    })
-                    
-                    # 清除开仓记录
-                    del open_positions[symbol]
+        with read_db.get_cursor() as c:
+            profits = query_round_trips(c, start=start, end=end, symbol=request.args.get('symbol'))
         
         return jsonify({
             'success': True,
@@ -0,0 +1,257 @@
+"""webhook 高吞吐接入模式 (ASGI)
+
+/webhook 与 /webhook/batch 在事件循环中解析, 由单个写入任务把同一时刻到达的
+信号合并到一个事务提交; 其余接口挂载原 Flask 应用, 返回格式保持一致。
+
+启动: uvicorn async_app:app --host 0.0.0.0 --port 80
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+from app import (
+    app as flask_app,
+    init_db,
+    build_signal_row,
+    parse_batch,
+    batch_response,
+    insert_signals,
+    record_inserted,
+)
+from idempotency import IDEMPOTENCY_HEADER
+from signal_notifier import notify_signal
+from database import get_database
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:  # 未安装orjson时退回标准库
+    import json
+
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, Last-Event-ID, Idempotency-Key",
+}
+
+
+def json_response(data, status_code: int = 200) -> Response:
+    return Response(json_dumps(data), status_code=status_code,
+                    media_type='application/json', headers=CORS_HEADERS)
+
+
+class GroupCommitWriter:
+    """信号组提交写入器
+
+    所有写请求进入同一个队列, 写入任务每次取空队列并在一个事务内提交,
+    提交期间到达的请求自动并入下一组。
+    """
+    def __init__(self, max_batch: int = 1000):
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._conn = None
+        self._task = None
+
+    def start(self):
+        # 独占一个按统一配置初始化的连接，手动控制事务
+        self._conn = get_database().connect()
+        self._conn.isolation_level = None
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 尚未取出的请求不再写入, 让等待中的请求返回失败
+        stopped = RuntimeError('Signal writer stopped')
+        while not self.queue.empty():
+            _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(stopped)
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    async def submit(self, rows: List[Tuple], received_ns: int) -> List[int]:
+        """提交一组信号, 返回入库后的信号ID, 重复信号为None
+
+        received_ns 为收到请求时的 time.monotonic_ns(), 随唤醒通知发给执行器用于延迟统计。
+        """
+        if self._task is None:
+            raise RuntimeError('Signal writer is not running')
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, future, received_ns))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            row_count = len(batch[0][0])
+            while row_count < self.max_batch and not self.queue.empty():
+                item = self.queue.get_nowait()
+                batch.append(item)
+                row_count += len(item[0])
+
+            # 任何异常都要让本组的请求返回, 写入任务继续处理后续请求
+            try:
+                await self._process(batch, row_count)
+            except asyncio.CancelledError:
+                self._fail(batch, RuntimeError('Signal writer stopped'))
+                raise
+            except Exception as e:
+                logger.exception(f"Signal writer error: {str(e)}")
+                self._fail(batch, e)
+
+    @staticmethod
+    def _fail(batch, error: Exception):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _process(self, batch, row_count: int):
+        """提交一组请求并返回结果, 提交后的记录和通知失败不影响已入库的请求"""
+        try:
+            id_groups = await asyncio.to_thread(self._commit, [rows for rows, _, _ in batch])
+        except Exception as e:
+            # 整组回滚后逐个请求单独提交，只有出错的请求返回失败
+            logger.error(f"Group commit failed, retrying {len(batch)} requests separately: {str(e)}")
+            id_groups = await asyncio.to_thread(self._commit_each, [rows for rows, _, _ in batch])
+        committed_ns = time.monotonic_ns()
+
+        # 先返回结果, 之后的记录和通知出错时已提交的请求仍然成功
+        for (_, future, _), signal_ids in zip(batch, id_groups):
+            if future.done():
+                continue
+            if isinstance(signal_ids, Exception):
+                future.set_exception(signal_ids)
+            else:
+                future.set_result(signal_ids)
+
+        traces = []
+        for (rows, _, received_ns), signal_ids in zip(batch, id_groups):
+            if isinstance(signal_ids, Exception):
+                continue
+            record_inserted(rows, signal_ids)
+            # 每个请求中新写入的信号ID连续
+            inserted = [signal_id for signal_id in signal_ids if signal_id is not None]
+            if inserted:
+                traces.append((inserted[0], inserted[-1], received_ns, committed_ns))
+        if traces:
+            notify_signal(traces[-1][1], traces=traces)
+        failed = sum(1 for signal_ids in id_groups if isinstance(signal_ids, Exception))
+        if failed:
+            logger.info(f"Committed {len(batch) - failed} of {len(batch)} requests separately")
+        else:
+            logger.info(f"Committed {row_count} signals from {len(batch)} requests in one transaction")
+
+    def _commit(self, row_groups: List[List[Tuple]]) -> List[List[int]]:
+        c = self._conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            id_groups = []
+            for rows in row_groups:
+                # 查重在写锁内进行，先提交的组中的信号也会被后面的组识别为重复
+                id_groups.append(insert_signals(c, rows))
+            c.execute('COMMIT')
+            return id_groups
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+
+    def _commit_each(self, row_groups: List[List[Tuple]]) -> List:
+        """每组单独一个事务提交，失败的组返回异常"""
+        results = []
+        for rows in row_groups:
+            try:
+                results.append(self._commit([rows])[0])
+            except Exception as e:
+                logger.error(f"Commit of {len(rows)} signals failed: {str(e)}")
+                results.append(e)
+        return results
+
+
+writer = GroupCommitWriter()
+
+
+async def webhook(request):
+    if request.method == 'OPTIONS':
+        return Response(status_code=200, headers=CORS_HEADERS)
+    received_ns = time.monotonic_ns()
+    try:
+        try:
+            row = build_signal_row(json_loads(await request.body()),
+                                   request.headers.get(IDEMPOTENCY_HEADER))
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        signal_id, = await writer.submit([row], received_ns)
+        if signal_id is None:
+            return json_response({'success': True, 'duplicate': True, 'message': 'Duplicate signal ignored'})
+        return json_response({'success': True, 'message': 'Signal received'})
+
+    except Exception as e:
+        logger.error(f"Error processing webhook: {str(e)}")
+        return json_response({'error': str(e)}, 500)
+
+
+async def webhook_batch(request):
+    if request.method == 'OPTIONS':
+        return Response(status_code=200, headers=CORS_HEADERS)
+    received_ns = time.monotonic_ns()
+    try:
+        try:
+            results, rows = parse_batch(json_loads(await request.body()))
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        signal_ids = await writer.submit(rows, received_ns) if rows else []
+        return json_response(batch_response(results, signal_ids))
+
+    except Exception as e:
+        logger.error(f"Error processing webhook batch: {str(e)}")
+        return json_response({'error': str(e)}, 500)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    init_db()
+    writer.start()
+    yield
+    await writer.stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/webhook', webhook, methods=['POST', 'OPTIONS']),
+        Route('/webhook/batch', webhook_batch, methods=['POST', 'OPTIONS']),
+        # 查询类接口沿用Flask实现
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=80, log_level="warning")
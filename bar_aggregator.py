@@ -0,0 +1,329 @@
+"""TICK合成K线
+
+收到TICK时增量更新各周期的当前K线，K线按自然时间对齐(1分钟、5分钟及配置的周期)，
+但不会跨越交易所的休市时段：10:15-10:30、11:30-13:30 和夜盘收盘处的K线提前结束。
+集合竞价的TICK并入开盘后的第一根K线，收盘后片刻到达的TICK并入最后一根K线。
+
+K线在下一周期的TICK到达、或定时检查发现结束时间已过时完成，完成后通知监听者，
+并由定时任务批量写入 bars 表，不在每个TICK上写库。定时检查以该合约最新TICK的时间
+加上此后经过的时间为准，不直接用本机时间，回放历史行情时K线不会被提前结束。
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from contract_registry import product_code
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERIODS = (1, 5)     # K线周期（分钟）
+DEFAULT_FLUSH_INTERVAL = 5   # 完成的K线写库间隔（秒）
+
+# 交易时段，以当日分钟数表示，跨夜的夜盘结束时间大于1440
+DAY_SESSIONS = [(9 * 60, 10 * 60 + 15), (10 * 60 + 30, 11 * 60 + 30), (13 * 60 + 30, 15 * 60)]
+CFFEX_INDEX_SESSIONS = [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)]
+CFFEX_BOND_SESSIONS = [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60 + 15)]
+CFFEX_BONDS = {'T', 'TF', 'TS', 'TL'}
+NIGHT_START = 21 * 60
+NIGHT_END = 23 * 60
+# 夜盘收盘晚于23:00的品种
+NIGHT_END_BY_PRODUCT = {
+    **{code: 25 * 60 for code in ('CU', 'AL', 'ZN', 'PB', 'NI', 'SN', 'SS', 'BC', 'AO')},
+    **{code: 26 * 60 + 30 for code in ('AU', 'AG', 'SC')},
+}
+DAY_ONLY_EXCHANGES = {'CFFEX', 'GFEX'}
+
+AUCTION_MINUTES = 5  # 开盘前集合竞价的TICK并入第一根K线
+CLOSE_GRACE_SECONDS = 60  # 收盘后该时间内到达的TICK并入最后一根K线
+TIMER_GRACE_SECONDS = 3   # 定时检查时，K线结束后再等待的时间，留给迟到的TICK
+
+
+@lru_cache(maxsize=None)
+def trading_sessions(exchange: str, code: str) -> Tuple[Tuple[int, int], ...]:
+    """合约所在交易所和品种的交易时段"""
+    if exchange == 'CFFEX':
+        return tuple(CFFEX_BOND_SESSIONS if code in CFFEX_BONDS else CFFEX_INDEX_SESSIONS)
+    sessions = list(DAY_SESSIONS)
+    if exchange not in DAY_ONLY_EXCHANGES:
+        sessions.insert(0, (NIGHT_START, NIGHT_END_BY_PRODUCT.get(code, NIGHT_END)))
+    return tuple(sessions)
+
+
+def locate(sessions: Sequence[Tuple[int, int]], dt: datetime) -> Optional[Tuple[int, int, int, int]]:
+    """返回 (时段内的分钟数, 时段开始, 时段结束, 日期偏移分钟数)，不在任何时段内时返回None
+
+    返回的分钟数已按集合竞价和收盘宽限调整到时段之内；
+    跨夜时段凌晨部分的日期偏移为1440，即时段从前一天开始计。
+    """
+    minute = dt.hour * 60 + dt.minute + dt.second / 60 + dt.microsecond / 60e6
+    for start, end in sessions:
+        for offset in (0, 1440):
+            m = minute + offset
+            if start - AUCTION_MINUTES <= m < start:
+                return start, start, end, offset
+            if start <= m < end:
+                return int(m), start, end, offset
+            if end <= m <= end + CLOSE_GRACE_SECONDS / 60:
+                return end - 1, start, end, offset
+    return None
+
+
+class Bar:
+    """一根K线，start/end 为本地时间"""
+    __slots__ = ('symbol', 'period', 'start', 'end', 'open', 'high', 'low', 'close',
+                 'volume', 'open_interest', 'ticks')
+
+    def __init__(self, symbol: str, period: int, start: datetime, end: datetime, price: float):
+        self.symbol = symbol
+        self.period = period
+        self.start = start
+        self.end = end
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0.0
+        self.open_interest = 0.0
+        self.ticks = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'symbol': self.symbol,
+            'period': self.period,
+            'start_ms': int(self.start.timestamp() * 1000),
+            'end_ms': int(self.end.timestamp() * 1000),
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume,
+            'open_interest': self.open_interest,
+        }
+
+    def __repr__(self):
+        return (f"Bar({self.symbol} {self.period}m {self.start:%H:%M}-{self.end:%H:%M} "
+                f"O:{self.open} H:{self.high} L:{self.low} C:{self.close} V:{self.volume})")
+
+
+class _SymbolState:
+    __slots__ = ('sessions', 'last_volume', 'last_session', 'last_tick', 'last_tick_at',
+                 'bars', 'closed')
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.last_volume: Optional[float] = None
+        self.last_session: Optional[Tuple[datetime, int]] = None  # 最近计入K线的TICK所在 (日期, 时段开始)
+        self.last_tick: Optional[datetime] = None  # 最新TICK的时间
+        self.last_tick_at = 0.0                    # 收到最新TICK时的 time.monotonic()
+        self.bars: Dict[int, Bar] = {}  # 周期 -> 当前K线
+        self.closed: Dict[int, datetime] = {}  # 周期 -> 最近完成的K线开始时间
+
+    def now(self) -> Optional[datetime]:
+        """该合约的行情时间: 最新TICK的时间加上此后经过的时间"""
+        if self.last_tick is None:
+            return None
+        return self.last_tick + timedelta(seconds=time.monotonic() - self.last_tick_at)
+
+    def volume_delta(self, session: Tuple[datetime, int], volume: float) -> float:
+        """TICK累计成交量相对上一条的增量
+
+        成交量是当日累计值，只有跨时段或跨日时变小才视为重新计；
+        同一时段内变小的是乱序的旧TICK，不计增量。
+        """
+        last_volume, last_session = self.last_volume, self.last_session
+        self.last_session = session
+        if last_volume is None:
+            self.last_volume = volume
+            return 0.0
+        if volume >= last_volume:
+            self.last_volume = volume
+            return volume - last_volume
+        if session != last_session:
+            self.last_volume = volume
+            return volume
+        return 0.0
+
+
+class BarAggregator:
+    """各合约多周期K线的增量合成"""
+    def __init__(self, periods: Sequence[int] = DEFAULT_PERIODS):
+        self.periods = periods
+        self._states: Dict[str, _SymbolState] = {}
+        self._listeners: List[Callable[[Bar], None]] = []
+        self._completed: List[Bar] = []  # 等待写库的K线
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def periods(self) -> Tuple[int, ...]:
+        return self._periods
+
+    @periods.setter
+    def periods(self, periods: Sequence[int]):
+        self._periods = tuple(sorted(set(int(period) for period in periods)))
+
+    def add_listener(self, callback: Callable[[Bar], None]):
+        """订阅K线完成事件"""
+        self._listeners.append(callback)
+
+    def on_tick(self, tick):
+        exchange = getattr(tick.exchange, 'value', tick.exchange)
+        self.update(tick.symbol, exchange, tick.datetime, tick.last_price,
+                    tick.volume, tick.open_interest)
+
+    def update(self, symbol: str, exchange: str, dt: datetime, price: float,
+               volume: float, open_interest: float):
+        """用一条TICK更新该合约各周期的K线，不在交易时段内的TICK忽略"""
+        if not price or dt is None:
+            return
+        closed = []
+        with self._lock:
+            state = self._states.get(symbol)
+            if state is None:
+                state = self._states[symbol] = _SymbolState(trading_sessions(exchange, product_code(symbol)))
+
+            if state.last_tick is None or dt > state.last_tick:
+                state.last_tick = dt
+                state.last_tick_at = time.monotonic()
+
+            located = locate(state.sessions, dt)
+            if located is None:
+                return
+            minute, session_start, session_end, offset = located
+            day = dt.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(minutes=offset)
+            bars = []
+            for period in self.periods:
+                # 按自然时间对齐，并截断在所在交易时段之内
+                aligned = minute - minute % period
+                start = max(aligned, session_start)
+                end = min(aligned + period, session_end)
+                bar_start = day + timedelta(minutes=start)
+
+                last_closed = state.closed.get(period)
+                if last_closed is not None and bar_start <= last_closed:
+                    # K线已完成后才到达的TICK
+                    continue
+                bar = state.bars.get(period)
+                if bar is not None and bar.start != bar_start:
+                    if bar_start < bar.start:
+                        # 乱序到达的旧TICK
+                        continue
+                    closed.append(bar)
+                    state.closed[period] = bar.start
+                    bar = None
+                if bar is None:
+                    bar = state.bars[period] = Bar(symbol, period, bar_start,
+                                                   bar_start + timedelta(minutes=end - start), price)
+                bars.append(bar)
+
+            # 成交量增量只对计入K线的TICK计算，迟到和乱序的TICK不影响累计值
+            if bars:
+                delta = state.volume_delta((day, session_start), volume)
+                for bar in bars:
+                    bar.high = max(bar.high, price)
+                    bar.low = min(bar.low, price)
+                    bar.close = price
+                    bar.volume += delta
+                    bar.open_interest = open_interest
+                    bar.ticks += 1
+            self._completed.extend(closed)
+        self._emit(closed)
+
+    def close_expired(self, now: Optional[datetime] = None) -> List[Bar]:
+        """结束时间已过的K线直接完成，用于休市前最后一根K线和行情稀疏的合约
+
+        未指定 now 时按各合约自己的行情时间判断，见 _SymbolState.now。
+        """
+        grace = timedelta(seconds=TIMER_GRACE_SECONDS)
+        closed = []
+        with self._lock:
+            for state in self._states.values():
+                current = now or state.now()
+                if current is None:
+                    continue
+                deadline = current - grace
+                for period, bar in list(state.bars.items()):
+                    if bar.end <= deadline:
+                        closed.append(bar)
+                        state.closed[period] = bar.start
+                        del state.bars[period]
+            self._completed.extend(closed)
+        self._emit(closed)
+        return closed
+
+    def _emit(self, bars: List[Bar]):
+        for bar in bars:
+            for callback in self._listeners:
+                try:
+                    callback(bar)
+                except Exception as e:
+                    logger.error(f"K线回调处理失败: {str(e)}")
+                    logger.exception("详细错误信息:")
+
+    def current(self, symbol: str, period: int) -> Optional[Bar]:
+        """正在合成中的K线"""
+        state = self._states.get(symbol)
+        return state.bars.get(period) if state is not None else None
+
+    def drain(self) -> List[Bar]:
+        """取出已完成、尚未写库的K线"""
+        with self._lock:
+            completed, self._completed = self._completed, []
+        return completed
+
+    def start(self, flush: Callable[[List[Bar]], None], interval: float = DEFAULT_FLUSH_INTERVAL):
+        """启动定时任务: 完成过期K线，并把已完成的K线交给 flush 批量写入"""
+        if self._timer is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self._flush(flush)
+            self._flush(flush)
+
+        self._timer = threading.Thread(target=run, name='bar-flush', daemon=True)
+        self._timer.start()
+
+    def _flush(self, flush: Callable[[List[Bar]], None]):
+        try:
+            self.close_expired()
+            bars = self.drain()
+            if bars:
+                flush(bars)
+        except Exception as e:
+            logger.error(f"K线写库失败: {str(e)}")
+            logger.exception("详细错误信息:")
+
+    def stop(self):
+        """停止定时任务，写入剩余已完成的K线"""
+        if self._timer is None:
+            return
+        self._stop.set()
+        self._timer.join()
+        self._timer = None
+
+
+def save_bars(c, bars: List[Bar]):
+    """批量写入K线，同一根K线重复写入时覆盖"""
+    c.executemany('''
+        INSERT OR REPLACE INTO bars (symbol, period, start_ms, end_ms, open, high, low, close,
+                                     volume, open_interest)
+        VALUES (:symbol, :period, :start_ms, :end_ms, :open, :high, :low, :close,
+                :volume, :open_interest)
+    ''', [bar.to_dict() for bar in bars])
+
+
+def query_bars(c, symbol: str, period: int, start_ms: Optional[int] = None,
+               end_ms: Optional[int] = None, limit: int = 1000) -> List[Dict]:
+    """按时间顺序返回K线，未指定范围时返回最近 limit 根"""
+    c.execute('''
+        SELECT symbol, period, start_ms, end_ms, open, high, low, close, volume, open_interest
+        FROM bars
+        WHERE symbol = ? AND period = ? AND start_ms >= ? AND start_ms < ?
+        ORDER BY start_ms DESC
+        LIMIT ?
+    ''', (symbol, period, start_ms or 0, end_ms or 2 ** 62, limit))
+    fields = [column[0] for column in c.description]
+    return [dict(zip(fields, row)) for row in reversed(c.fetchall())]
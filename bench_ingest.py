@@ -0,0 +1,108 @@
+"""webhook 接入延迟压测
+
+对一个或多个服务地址并发发送信号, 统计单请求延迟的p50/p99与吞吐。
+
+    python app.py                                   # Flask, 端口80
+    uvicorn async_app:app --port 8080               # ASGI接入模式
+    python bench_ingest.py http://127.0.0.1:80 http://127.0.0.1:8080 -n 2000 -c 200
+
+压测会向数据库写入真实信号, 请在测试库上运行并停止交易执行器。
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_worker(url, count, latencies, errors, lock, start_event):
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+    body = json.dumps({
+        'symbol': 'bench2501',
+        'action': 'BUY',
+        'price': 1000,
+        'strategy': 'flat',
+    })
+    headers = {'Content-Type': 'application/json'}
+    local_latencies = []
+    local_errors = 0
+    start_event.wait()
+    for _ in range(count):
+        # 每个请求使用不同的幂等键，避免被当作重复信号
+        headers['Idempotency-Key'] = uuid.uuid4().hex
+        begin = time.perf_counter()
+        try:
+            conn.request('POST', '/webhook', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+            continue
+        local_latencies.append(time.perf_counter() - begin)
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def bench(url, total, concurrency):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_event = threading.Event()
+    per_worker = max(1, total // concurrency)
+    threads = [
+        threading.Thread(target=run_worker, args=(url, per_worker, latencies, errors, lock, start_event))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    begin = time.perf_counter()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+
+    latencies.sort()
+    return {
+        'url': url,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='webhook 接入延迟压测')
+    parser.add_argument('urls', nargs='+', help='服务地址, 如 http://127.0.0.1:80')
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='每个地址的请求总数')
+    parser.add_argument('-c', '--concurrency', type=int, default=50, help='并发连接数')
+    args = parser.parse_args()
+
+    print(f"{'url':<32}{'requests':>10}{'errors':>8}{'p50(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}{'req/s':>10}")
+    for url in args.urls:
+        result = bench(url, args.requests, args.concurrency)
+        print(f"{result['url']:<32}{result['requests']:>10}{result['errors']:>8}"
+              f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['mean_ms']:>10.2f}{result['rps']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""合约注册表
+
+合约乘数、交易所等信息以CTP合约查询结果为准，查询结果缓存到本地文件，
+下次启动时先从缓存加载，无需等待登录即可查询。
+
+查询按合约代码精确索引，同时兼容大小写和郑商所合约的4位年份写法
+(如 MA2505 与 CTP 的 MA505)；按品种查询时使用该品种任一期货合约的规格。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_CACHE_PATH = 'contracts_cache.json'
+
+CZCE = 'CZCE'
+FUTURES = '期货'  # ctpbee Product.FUTURES 的取值
+
+_SYMBOL_PATTERN = re.compile(r'^([A-Za-z]+)(\d+)(.*)$')
+
+
+def product_code(symbol: str) -> str:
+    """合约代码中的品种代码，如 rb2505 -> RB"""
+    match = _SYMBOL_PATTERN.match(symbol)
+    return match.group(1).upper() if match else symbol.upper()
+
+
+def czce_full_year(symbol: str, now: Optional[float] = None) -> Optional[str]:
+    """郑商所3位年月合约补全为4位年份，如 MA505 -> MA2505
+
+    年份个位按距离当前最近的未来十年推算，已到期一年以上的合约不会再出现在合约列表中。
+    """
+    match = _SYMBOL_PATTERN.match(symbol)
+    if not match or len(match.group(2)) != 3:
+        return None
+    year = time.localtime(now).tm_year
+    digit = int(match.group(2)[0])
+    full_year = year - year % 10 + digit
+    if full_year < year - 1:
+        full_year += 10
+    return f"{match.group(1)}{full_year % 100:02d}{match.group(2)[1:]}{match.group(3)}"
+
+
+class ContractSpec:
+    """合约规格"""
+    __slots__ = ('symbol', 'exchange', 'name', 'size', 'pricetick', 'product', 'product_code')
+
+    FIELDS = ('symbol', 'exchange', 'name', 'size', 'pricetick', 'product')
+
+    def __init__(self, symbol: str, exchange: str, name: str = '', size: float = 1,
+                 pricetick: float = 0, product: str = FUTURES):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.name = name
+        self.size = size
+        self.pricetick = pricetick
+        self.product = product
+        self.product_code = product_code(symbol)
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"ContractSpec({self.symbol}.{self.exchange} 乘数:{self.size})"
+
+
+class ContractRegistry:
+    """合约注册表，由合约查询回报填充并缓存到本地文件"""
+    def __init__(self, cache_path: str = CONTRACT_CACHE_PATH):
+        self.cache_path = cache_path
+        self._contracts: Dict[str, ContractSpec] = {}  # CTP合约代码 -> 规格
+        self._aliases: Dict[str, ContractSpec] = {}    # 其他写法 -> 规格
+        self._products: Dict[str, ContractSpec] = {}   # 品种代码 -> 该品种的期货合约
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._contracts)
+
+    def add(self, spec: ContractSpec):
+        with self._lock:
+            self._contracts[spec.symbol] = spec
+            self._aliases[spec.symbol.upper()] = spec
+            if spec.exchange == CZCE:
+                full = czce_full_year(spec.symbol)
+                if full:
+                    self._aliases[full.upper()] = spec
+            if spec.product == FUTURES:
+                self._products[spec.product_code] = spec
+
+    def on_contract(self, contract):
+        """合约查询回报"""
+        self.add(ContractSpec(
+            symbol=contract.symbol,
+            exchange=getattr(contract.exchange, 'value', contract.exchange),
+            name=contract.name,
+            size=contract.size,
+            pricetick=contract.pricetick,
+            product=getattr(contract.product, 'value', contract.product),
+        ))
+
+    def get(self, symbol: str) -> Optional[ContractSpec]:
+        """按合约代码精确查询，兼容大小写和郑商所4位年份"""
+        spec = self._contracts.get(symbol)
+        if spec is None:
+            spec = self._aliases.get(symbol.upper())
+        return spec
+
+    def product(self, code: str) -> Optional[ContractSpec]:
+        """按品种代码查询该品种的任一期货合约"""
+        return self._products.get(code.upper())
+
+    def lookup(self, symbol: str) -> Optional[ContractSpec]:
+        """先按合约代码查询，未找到时按品种查询(同一品种合约乘数相同)"""
+        return self.get(symbol) or self.product(product_code(symbol))
+
+    def specs(self) -> Iterable[ContractSpec]:
+        with self._lock:
+            return list(self._contracts.values())
+
+    def load(self) -> int:
+        """从缓存文件加载，返回加载的合约数"""
+        if not os.path.exists(self.cache_path):
+            return 0
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            for record in records:
+                self.add(ContractSpec(**record))
+            logger.info(f"从缓存加载合约 {len(records)} 个")
+            return len(records)
+        except Exception as e:
+            logger.error(f"加载合约缓存失败: {str(e)}")
+            return 0
+
+    def save(self):
+        """写入缓存文件，先写临时文件再替换，避免读到半个文件"""
+        records = [spec.to_dict() for spec in self.specs()]
+        if not records:
+            return
+        tmp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+        logger.info(f"合约缓存已更新: {len(records)} 个")
+
+
+_registry: Optional[ContractRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ContractRegistry:
+    """进程内共享的合约注册表，首次使用时加载缓存"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ContractRegistry()
+            _registry.load()
+        return _registry
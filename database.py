@@ -1,68 +1,483 @@
 import sqlite3
 from sqlite3 import Connection
 from contextlib import contextmanager
+from typing import Dict, Tuple
+import atexit
+import queue
 import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+DB_PATH = 'signals.db'
+
 class DatabaseConnection:
-    """数据库连接管理器"""
-    def __init__(self):
-        self._local = threading.local()
+    """数据库连接池
+
+    所有进程共用同一套连接配置: WAL日志、busy_timeout、synchronous=NORMAL
+    以及语句缓存。只读实例的连接开启query_only, 供看板等读取方使用。
+    """
+    def __init__(self, db_path: str = DB_PATH, read_only: bool = False, pool_size: int = 4,
+                 busy_timeout: int = 5000, cached_statements: int = 256):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
         
-    def get_connection(self) -> Connection:
-        if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect('signals.db', check_same_thread=False)
-        return self._local.conn
+    def connect(self) -> Connection:
+        """创建一个按统一配置初始化的新连接，由调用方负责关闭"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
         
     @contextmanager
-    def get_cursor(self):
+    def connection(self):
+        """从连接池借出一个连接，用完自动归还"""
+        conn = self._acquire()
         try:
-            cursor = self.get_connection().cursor()
-            yield cursor
-            self.get_connection().commit()
-        except Exception as e:
-            if hasattr(self._local, 'conn') and self._local.conn:
-                self.get_connection().rollback()
-            raise e
+            yield conn
         finally:
-            cursor.close()
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+        
+    def _acquire(self) -> Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self.connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._pool.get()
+        
+    @contextmanager
+    def get_cursor(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                cursor.close()
+                
+    def close(self):
+        """关闭连接池中的空闲连接"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
 
     def init_database(self):
-        """初始化数据库表"""
+        """初始化数据库并按版本顺序执行未完成的迁移"""
         try:
-            with self.get_cursor() as c:
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS trading_signals (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        symbol TEXT NOT NULL,
-                        action TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        volume INTEGER DEFAULT 1,
-                        strategy TEXT,
-                        processed BOOLEAN DEFAULT FALSE,
-                        process_time DATETIME,
-                        order_id TEXT,
-                        status TEXT DEFAULT 'pending',
-                        message TEXT
-                    )
-                ''')
-                logger.info("交易信号表初始化成功")
-                
-                # 添加账户数据表
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS account_info (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        balance REAL NOT NULL,           -- 账户余额
-                        equity REAL NOT NULL,            -- 账户净值
-                        available REAL NOT NULL,         -- 可用资金
-                        position_profit REAL NOT NULL,   -- 持仓盈亏
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                logger.info("账户信息表初始化成功")
+            for version, description, migrate in MIGRATIONS:
+                with self.get_cursor() as c:
+                    # 立即加写锁，避免多个进程同时升级
+                    c.execute('BEGIN IMMEDIATE')
+                    current = c.execute('PRAGMA user_version').fetchone()[0]
+                    if current >= version:
+                        continue
+                    migrate(c)
+                    c.execute(f'PRAGMA user_version = {int(version)}')
+                    logger.info(f"数据库已升级到版本 {version}: {description}")
         except Exception as e:
             logger.error(f"数据库初始化失败: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+
+def now_ms() -> int:
+    """当前时间的毫秒时间戳"""
+    return int(time.time() * 1000)
+
+def _migrate_base_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS trading_signals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            action TEXT NOT NULL,
+            price REAL NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            volume INTEGER DEFAULT 1,
+            strategy TEXT,
+            processed BOOLEAN DEFAULT FALSE,
+            process_time DATETIME,
+            order_id TEXT,
+            status TEXT DEFAULT 'pending',
+            message TEXT
+        )
+    ''')
+    logger.info("交易信号表初始化成功")
+    
+    # 添加账户数据表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS account_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            balance REAL NOT NULL,           -- 账户余额
+            equity REAL NOT NULL,            -- 账户净值
+            available REAL NOT NULL,         -- 可用资金
+            position_profit REAL NOT NULL,   -- 持仓盈亏
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    logger.info("账户信息表初始化成功")
+
+def _migrate_signal_indexes(c):
+    # 毫秒时间戳，用于范围查询和排序
+    c.execute('ALTER TABLE trading_signals ADD COLUMN timestamp_ms INTEGER')
+    c.execute('''
+        UPDATE trading_signals
+        SET timestamp_ms = CAST(strftime('%s', timestamp) AS INTEGER) * 1000
+    ''')
+    # 未显式写入timestamp_ms的插入由触发器补齐
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_signals_timestamp_ms
+        AFTER INSERT ON trading_signals
+        WHEN NEW.timestamp_ms IS NULL
+        BEGIN
+            UPDATE trading_signals
+            SET timestamp_ms = CAST(strftime('%s', NEW.timestamp) AS INTEGER) * 1000
+            WHERE id = NEW.id;
+        END
+    ''')
+    # 执行器轮询的待处理信号，部分索引只包含pending行
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_pending
+        ON trading_signals (timestamp_ms)
+        WHERE processed = 0 AND status = 'pending'
+    ''')
+    # 订单回报按order_id更新
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_order_id
+        ON trading_signals (order_id)
+    ''')
+    # 盈亏统计读取的已成交信号，覆盖查询所需的全部列
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_filled
+        ON trading_signals (timestamp_ms, symbol, action, price, volume, timestamp, strategy, status)
+        WHERE status = 'filled'
+    ''')
+
+def _migrate_signal_filter_indexes(c):
+    # /api/signals 的筛选条件，索引项自带rowid，可直接按id做游标分页
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_symbol
+        ON trading_signals (symbol)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_status
+        ON trading_signals (status)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_signals_timestamp_ms
+        ON trading_signals (timestamp_ms)
+    ''')
+
+def _migrate_round_trips(c):
+    # 开平配对后的交易记录，由成交回报增量维护
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS round_trips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            open_signal_id INTEGER NOT NULL,
+            close_signal_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            direction TEXT NOT NULL,         -- LONG/SHORT
+            open_time DATETIME,
+            close_time DATETIME,
+            open_time_ms INTEGER,
+            close_time_ms INTEGER,
+            open_price REAL NOT NULL,
+            close_price REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            point_profit REAL NOT NULL,      -- 点数盈亏
+            fee REAL NOT NULL,               -- 开平总手续费
+            profit REAL NOT NULL             -- 扣除手续费后的盈亏
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_round_trips_close_time
+        ON round_trips (close_time_ms)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_round_trips_symbol
+        ON round_trips (symbol, close_time_ms)
+    ''')
+    # 尚未平仓的开仓记录，每个品种最多一条
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_open_positions (
+            symbol TEXT PRIMARY KEY,
+            direction TEXT NOT NULL,
+            signal_id INTEGER NOT NULL,
+            price REAL NOT NULL,
+            open_time DATETIME,
+            open_time_ms INTEGER,
+            volume INTEGER NOT NULL,
+            open_fee REAL NOT NULL
+        )
+    ''')
+    # 账本由版本11的成交明细重建
+
+def _migrate_events(c):
+    # 推送给客户端的变更事件，seq单调递增，客户端可从任意序号续传
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,              -- signal/order/trade/account
+            timestamp_ms INTEGER NOT NULL,
+            payload TEXT NOT NULL            -- JSON
+        )
+    ''')
+
+def _migrate_signal_idempotency(c):
+    # webhook幂等键，唯一索引拦截重试和重放的重复信号；旧数据为NULL不参与去重
+    c.execute('ALTER TABLE trading_signals ADD COLUMN idem_key TEXT')
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_signals_idem_key
+        ON trading_signals (idem_key)
+    ''')
+
+def _migrate_order_map(c):
+    # 委托与信号的映射，订单回报按网关订单号主键查找信号
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS order_map (
+            gateway_order_id TEXT PRIMARY KEY,   -- 网关订单号，如 ctp.1_123_5
+            local_order_id TEXT NOT NULL,        -- 下单时生成的本地订单号
+            signal_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            created_ms INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_map_signal
+        ON order_map (signal_id)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_map_created
+        ON order_map (created_ms)
+    ''')
+    # 已有信号的订单号迁入映射表
+    c.execute('''
+        INSERT OR IGNORE INTO order_map (gateway_order_id, local_order_id, signal_id, symbol, created_ms)
+        SELECT order_id, order_id, id, symbol, COALESCE(timestamp_ms, 0)
+        FROM trading_signals
+        WHERE order_id IS NOT NULL
+    ''')
+
+def _migrate_account_history(c):
+    # 账户采样，近期保留原始精度
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS account_history (
+            timestamp_ms INTEGER PRIMARY KEY,
+            balance REAL NOT NULL,
+            equity REAL NOT NULL,
+            available REAL NOT NULL,
+            position_profit REAL NOT NULL
+        )
+    ''')
+    # 超过保留期的采样汇总成的权益K线，resolution_ms 为周期(1分钟/1小时)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS account_bars (
+            resolution_ms INTEGER NOT NULL,
+            start_ms INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            balance REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (resolution_ms, start_ms)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_bars(c):
+    # TICK合成的K线，period 为周期分钟数
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bars (
+            symbol TEXT NOT NULL,
+            period INTEGER NOT NULL,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            volume REAL NOT NULL,
+            open_interest REAL NOT NULL,
+            PRIMARY KEY (symbol, period, start_ms)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_latency(c):
+    # 每日每合约每个区间一份延迟直方图，data 为 LatencyHistogram 的JSON
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS latency_histograms (
+            day TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            span TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            updated_ms INTEGER NOT NULL,
+            PRIMARY KEY (day, symbol, span)
+        ) WITHOUT ROWID
+    ''')
+    # 每日最慢信号的各阶段时间，stages 为 {阶段: 相对最早阶段的微秒数}
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS latency_traces (
+            signal_id INTEGER PRIMARY KEY,
+            day TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            total_us INTEGER NOT NULL,
+            stages TEXT NOT NULL,
+            created_ms INTEGER NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_latency_traces_day ON latency_traces (day, total_us)')
+
+def _migrate_fills(c):
+    # 成交明细，盈亏账本按实际成交价格和手数维护；direction 为被开或被平的持仓方向
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trade_id TEXT,                   -- 网关成交编号，由历史信号补录的为NULL
+            order_id TEXT,                   -- 网关订单号
+            signal_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            direction TEXT NOT NULL,         -- LONG/SHORT
+            offset TEXT NOT NULL,            -- OPEN/CLOSE
+            price REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            timestamp DATETIME,
+            timestamp_ms INTEGER
+        )
+    ''')
+    # 重新登录后网关会重发当日成交，按订单号和成交编号去重
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_fills_trade ON fills (order_id, trade_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_round_trips_close_signal ON round_trips (close_signal_id)')
+    # 此前只有信号级的成交状态，每条已成交信号按信号价格和手数补录为一笔成交
+    c.execute('''
+        INSERT INTO fills (order_id, signal_id, symbol, direction, offset, price, volume,
+                           timestamp, timestamp_ms)
+        SELECT order_id, id, symbol,
+               CASE WHEN UPPER(action) IN ('BUY', 'LONG', 'CLOSE_LONG', 'SELL_CLOSE')
+                    THEN 'LONG' ELSE 'SHORT' END,
+               CASE WHEN UPPER(action) IN ('BUY', 'LONG', 'SELL', 'SHORT')
+                    THEN 'OPEN' ELSE 'CLOSE' END,
+               price, COALESCE(volume, 1), timestamp, timestamp_ms
+        FROM trading_signals
+        WHERE status = 'filled'
+          AND UPPER(action) IN ('BUY', 'LONG', 'SELL', 'SHORT',
+                                'CLOSE_LONG', 'CLOSE_SHORT', 'SELL_CLOSE', 'BUY_CLOSE')
+        ORDER BY timestamp_ms ASC, id ASC
+    ''')
+    # 成交回报使用CTP合约代码，补录的信号代码(大小写、郑商所年份)按合约注册表统一
+    from contract_registry import get_registry
+    registry = get_registry()
+    for symbol, in c.execute('SELECT DISTINCT symbol FROM fills').fetchall():
+        contract = registry.get(symbol)
+        if contract is not None and contract.symbol != symbol:
+            c.execute('UPDATE fills SET symbol = ? WHERE symbol = ?', (contract.symbol, symbol))
+    # 同一品种可同时持有多空，未平仓记录改按(品种, 方向)索引
+    c.execute('DROP TABLE IF EXISTS ledger_open_positions')
+    c.execute('''
+        CREATE TABLE ledger_open_positions (
+            symbol TEXT NOT NULL,
+            direction TEXT NOT NULL,
+            signal_id INTEGER NOT NULL,
+            price REAL NOT NULL,             -- 按成交量加权的开仓均价
+            open_time DATETIME,
+            open_time_ms INTEGER,
+            volume INTEGER NOT NULL,
+            open_fee REAL NOT NULL,          -- 尚未分摊的开仓手续费
+            PRIMARY KEY (symbol, direction)
+        )
+    ''')
+    # 用成交明细重建账本；还没有合约缓存时乘数未知，留给执行器完成合约查询后重建
+    from pnl_ledger import ledger_specs_ready, rebuild_ledger
+    if ledger_specs_ready(c):
+        rebuild_ledger(c)
+    else:
+        c.execute('DELETE FROM round_trips')
+        logger.warning("合约乘数尚不可用，盈亏账本将在执行器完成合约查询后重建")
+
+# 数据库迁移：(版本号, 说明, 迁移函数)，只允许在末尾追加
+def _migrate_signal_version(c):
+    # 信号表变更计数，状态更新不改变id，/api/signals 靠它判断内容是否变化而不必执行分页查询
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS signal_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO signal_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_signals_version_{event.lower()}
+            AFTER {event} ON trading_signals
+            BEGIN
+                UPDATE signal_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+MIGRATIONS = [
+    (1, '创建基础表', _migrate_base_tables),
+    (2, '信号毫秒时间戳与热点查询索引', _migrate_signal_indexes),
+    (3, '信号列表筛选索引', _migrate_signal_filter_indexes),
+    (4, '盈亏账本', _migrate_round_trips),
+    (5, '实时推送事件表', _migrate_events),
+    (6, '信号幂等键', _migrate_signal_idempotency),
+    (7, '委托映射表', _migrate_order_map),
+    (8, '账户权益历史', _migrate_account_history),
+    (9, 'K线表', _migrate_bars),
+    (10, '信号延迟统计', _migrate_latency),
+    (11, '成交明细，盈亏账本按实际成交维护', _migrate_fills),
+    (12, '信号变更计数', _migrate_signal_version),
+]
+
+_databases: Dict[Tuple[str, bool], DatabaseConnection] = {}
+_databases_lock = threading.Lock()
+
+def get_database(read_only: bool = False, db_path: str = DB_PATH) -> DatabaseConnection:
+    """获取进程内共享的连接池"""
+    key = (db_path, read_only)
+    with _databases_lock:
+        if key not in _databases:
+            _databases[key] = DatabaseConnection(db_path, read_only=read_only)
+        return _databases[key]
+
+@atexit.register
+def close_all():
+    """进程退出时关闭所有连接池"""
+    with _databases_lock:
+        for db in _databases.values():
+            db.close()
@@ -0,0 +1,203 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每批写入的最大操作数
+MAX_BATCH = 500
+
+
+class WriterStats:
+    """写库统计"""
+    def __init__(self):
+        self.submitted = 0
+        self.coalesced = 0   # 被同一行的后续写入覆盖的操作数
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.full_waits = 0  # 队列已满时提交方等待的次数
+        self.total_flush = 0.0
+        self.max_flush = 0.0
+        self.last_flush = 0.0
+        self.max_wait = 0.0  # 操作从提交到写入的最长时间
+
+
+class DbWriter:
+    """后台写库线程
+
+    网关回调只把写操作放入有界队列，由单独的线程按固定间隔合并成一个事务写入，
+    回调线程不再等待SQLite的写锁。带key的操作写同一行时只保留最后一次，
+    并移到最后一次提交的排队位置，与其他操作的先后顺序和提交顺序一致。
+    队列满时提交方阻塞等待，不丢弃写入。
+    """
+    def __init__(self, db, max_pending: int = 10000, flush_interval: float = 0.2):
+        self.db = db
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        # key -> (写操作, 首次提交时间)
+        self._pending: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._stats = WriterStats()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: Callable, key: Optional[Hashable] = None):
+        """提交写操作，operation 接收游标并在写库线程的事务内执行
+
+        key 相同的操作尚未写入时，新操作替换旧操作并排到队尾。
+        """
+        with self._cond:
+            if key is not None and key in self._pending:
+                _, enqueued = self._pending[key]
+                self._pending[key] = (operation, enqueued)
+                self._pending.move_to_end(key)
+                self._stats.submitted += 1
+                self._stats.coalesced += 1
+                return
+            if len(self._pending) >= self.max_pending and self._thread is not None:
+                self._stats.full_waits += 1
+                logger.warning(f"写库队列已满({len(self._pending)})，等待写入")
+                while len(self._pending) >= self.max_pending and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+            if key is None:
+                key = ('_', next(self._sequence))
+            self._pending[key] = (operation, time.monotonic())
+            self._stats.submitted += 1
+            if len(self._pending) >= MAX_BATCH:
+                self._cond.notify_all()
+        if self._thread is None:
+            # 未启动写库线程时直接写入
+            self.flush()
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < MAX_BATCH:
+            _, item = self._pending.popitem(last=False)
+            batch.append(item)
+        self._in_flight += len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < MAX_BATCH and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping and not self._pending:
+                    break
+                batch = self._take_batch()
+                # 唤醒因队列已满而等待的提交方
+                self._cond.notify_all()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        start = time.monotonic()
+        try:
+            with self.db.get_cursor() as c:
+                for operation, _ in batch:
+                    operation(c)
+            written, failed = len(batch), 0
+        except Exception as e:
+            # 整批回滚后逐条重试，只跳过出错的操作
+            logger.warning(f"批量写库失败, 逐条重试: {str(e)}")
+            written, failed = 0, 0
+            for operation, _ in batch:
+                try:
+                    with self.db.get_cursor() as c:
+                        operation(c)
+                    written += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"写库失败: {str(e)}")
+                    logger.exception("详细错误信息:")
+        end = time.monotonic()
+        elapsed = end - start
+
+        with self._cond:
+            stats = self._stats
+            stats.written += written
+            stats.failed += failed
+            stats.batches += 1
+            stats.total_flush += elapsed
+            stats.max_flush = max(stats.max_flush, elapsed)
+            stats.last_flush = elapsed
+            stats.max_wait = max(stats.max_wait, end - min(enqueued for _, enqueued in batch))
+            self._in_flight -= len(batch)
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的操作全部写入，超时返回False"""
+        if self._thread is None:
+            with self._cond:
+                batch = self._take_batch()
+            while batch:
+                self._write(batch)
+                with self._cond:
+                    batch = self._take_batch()
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout: Optional[float] = 30):
+        """写入剩余的操作后停止写库线程"""
+        if self._thread is None:
+            self.flush()
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"写库线程未在 {timeout} 秒内结束，剩余 {len(self._pending)} 条未写入")
+        else:
+            logger.info(f"写库线程已停止, 共写入 {self._stats.written} 条")
+        self._thread = None
+
+    def stats(self) -> Dict:
+        """队列深度和写入耗时(毫秒)"""
+        now = time.monotonic()
+        with self._cond:
+            stats = self._stats
+            # 合并后移到队尾的操作保留首次提交时间，队首不一定最早
+            oldest = min((item[1] for item in self._pending.values()), default=None)
+            return {
+                'depth': len(self._pending),
+                'in_flight': self._in_flight,
+                'oldest_wait_ms': round((now - oldest) * 1000, 1) if oldest is not None else 0,
+                'submitted': stats.submitted,
+                'coalesced': stats.coalesced,
+                'written': stats.written,
+                'failed': stats.failed,
+                'batches': stats.batches,
+                'full_waits': stats.full_waits,
+                'avg_flush_ms': round(stats.total_flush / stats.batches * 1000, 1) if stats.batches else 0,
+                'max_flush_ms': round(stats.max_flush * 1000, 1),
+                'last_flush_ms': round(stats.last_flush * 1000, 1),
+                'max_wait_ms': round(stats.max_wait * 1000, 1),
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"写库队列: 深度={stats['depth']} 已写入={stats['written']} 合并={stats['coalesced']} "
+                    f"失败={stats['failed']} 平均耗时={stats['avg_flush_ms']}ms "
+                    f"最大耗时={stats['max_flush_ms']}ms 最长延迟={stats['max_wait_ms']}ms")
@@ -0,0 +1,94 @@
+import json
+import time
+import logging
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from database import now_ms
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_SIGNAL = 'signal'      # 收到交易信号
+EVENT_ORDER = 'order'        # 订单状态变化
+EVENT_TRADE = 'trade'        # 成交回报
+EVENT_ACCOUNT = 'account'    # 账户快照
+EVENT_TYPES = (EVENT_SIGNAL, EVENT_ORDER, EVENT_TRADE, EVENT_ACCOUNT)
+
+MAX_EVENTS_PER_READ = 500
+EVENT_RETENTION = 100000  # 事件表保留的最近事件数
+
+
+def enum_value(value):
+    """ctpbee枚举转为可序列化的值"""
+    return getattr(value, 'value', value)
+
+
+def publish_events(c, events: Iterable[Tuple[str, Dict]]):
+    """在调用方的事务内写入事件，与业务数据一起提交"""
+    timestamp = now_ms()
+    c.executemany('''
+        INSERT INTO events (type, timestamp_ms, payload)
+        VALUES (?, ?, ?)
+    ''', [(event_type, timestamp, json.dumps(payload, ensure_ascii=False, default=str))
+          for event_type, payload in events])
+
+
+def publish_event(c, event_type: str, payload: Dict):
+    publish_events(c, [(event_type, payload)])
+
+
+def prune_events(c, keep: int = EVENT_RETENTION) -> int:
+    """只保留最近keep条事件"""
+    c.execute('DELETE FROM events WHERE seq <= (SELECT MAX(seq) FROM events) - ?', (keep,))
+    return c.rowcount
+
+
+def latest_seq(c) -> int:
+    c.execute('SELECT MAX(seq) FROM events')
+    return c.fetchone()[0] or 0
+
+
+def read_events(c, since_seq: int, types: Optional[Sequence[str]] = None,
+                limit: int = MAX_EVENTS_PER_READ):
+    """读取序号大于since_seq的事件"""
+    sql = 'SELECT seq, type, timestamp_ms, payload FROM events WHERE seq > ?'
+    params = [since_seq]
+    if types:
+        sql += f" AND type IN ({', '.join('?' * len(types))})"
+        params.extend(types)
+    sql += ' ORDER BY seq LIMIT ?'
+    params.append(limit)
+    c.execute(sql, params)
+    return c.fetchall()
+
+
+def follow_events(conn, since_seq: Optional[int] = None, types: Optional[Sequence[str]] = None,
+                  poll_interval: float = 0.2, idle_timeout: float = 15) -> Iterator[Optional[tuple]]:
+    """持续输出新事件
+
+    通过 PRAGMA data_version 判断其他连接是否提交过写入，没有变化时不查询事件表。
+    since_seq为None时只输出之后的新事件；空闲超过idle_timeout秒时输出None，供调用方发送心跳。
+    """
+    c = conn.cursor()
+    if since_seq is None:
+        since_seq = latest_seq(c)
+    data_version = None
+    idle_since = time.monotonic()
+    while True:
+        current_version = c.execute('PRAGMA data_version').fetchone()[0]
+        if current_version != data_version:
+            data_version = current_version
+            while True:
+                rows = read_events(c, since_seq, types)
+                for row in rows:
+                    since_seq = row[0]
+                    yield row
+                if len(rows) < MAX_EVENTS_PER_READ:
+                    break
+            if rows:
+                idle_since = time.monotonic()
+
+        if time.monotonic() - idle_since >= idle_timeout:
+            idle_since = time.monotonic()
+            yield None
+        time.sleep(poll_interval)
@@ -0,0 +1,71 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from database import now_ms
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+
+
+def derive_key(data: Dict) -> str:
+    """由信号内容生成幂等键
+
+    同一根K线上的同一信号视为重复；告警未携带K线时间(bar_time/time)时按到达的分钟计算。
+    """
+    bar_time = data.get('bar_time') or data.get('time') or now_ms() // 60000
+    content = '|'.join(str(part) for part in (
+        data['symbol'], str(data['action']).upper(), data['price'], data['strategy'], bar_time
+    ))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def resolve_key(data: Dict, client_key: Optional[str] = None) -> str:
+    """优先使用客户端提供的幂等键，否则由信号内容生成"""
+    key = client_key or data.get('idempotency_key')
+    if key is None:
+        return derive_key(data)
+    key = str(key)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'idempotency_key must be 1-{MAX_KEY_LENGTH} characters')
+    return key
+
+
+class DedupWindow:
+    """最近写入信号的幂等键窗口
+
+    按LRU保留最近capacity个键，命中时无需访问数据库；
+    窗口之外的重复由数据库唯一索引兜底。
+    """
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.suppressed = 0  # 已拦截的重复信号数
+        self._keys: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key: str):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def record_suppressed(self, count: int = 1):
+        with self._lock:
+            self.suppressed += count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'suppressed': self.suppressed,
+                'window_size': len(self._keys),
+                'capacity': self.capacity
+            }
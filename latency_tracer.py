@@ -0,0 +1,359 @@
+"""信号全链路延迟
+
+每条信号在各处理阶段记录单调时钟时间戳(time.monotonic_ns，同一台机器上的各进程可以直接比较)：
+webhook接收、信号入库提交、执行器取出、生成委托、send_order返回、首个委托回报、首个成交回报。
+webhook进程的两个时间戳随唤醒通知发给执行器，通知丢失时该信号只有执行器内的各阶段。
+
+相邻阶段之间的耗时按合约记入HDR式直方图(按2的幂分段、段内64等分，相对误差不超过1/64)，
+直方图可以直接合并，每日一份写入数据库，查询时按日期和合约合并；
+每日最慢的N条信号保留完整的时间戳，用于定位具体是哪个阶段慢。
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from database import now_ms
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('received', 'committed', 'picked', 'order_request', 'sent', 'order', 'trade')
+STAGE_NAMES = {
+    'received': 'webhook接收',
+    'committed': '信号入库',
+    'picked': '执行器取出',
+    'order_request': '生成委托',
+    'sent': 'send_order返回',
+    'order': '委托回报',
+    'trade': '成交回报',
+}
+# 统计的区间: 相邻阶段，以及从收到webhook到委托回报、到成交回报的全程
+SPANS = tuple(zip(STAGES, STAGES[1:])) + (('received', 'order'), ('received', 'trade'))
+PERCENTILES = (50, 90, 99, 99.9)
+
+DEFAULT_SLOWEST = 100        # 每日保留完整时间戳的最慢信号数
+DEFAULT_TRACE_TIMEOUT = 600  # 超过该时间(秒)仍未成交的信号按已有阶段统计
+DEFAULT_RETENTION_DAYS = 30  # 直方图和慢信号保留天数
+MAX_ACTIVE_TRACES = 10000    # 进行中的信号上限，超出时最早的直接统计
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+
+def span_name(start: str, end: str) -> str:
+    return f"{start}->{end}"
+
+
+def today() -> str:
+    return time.strftime('%Y%m%d')
+
+
+def _bucket_index(value: int) -> int:
+    """小于128的值每个值一个桶，之后每个2的幂区间64个桶"""
+    if value < 2 * SUB_BUCKET_HALF:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * SUB_BUCKET_HALF + (value >> shift)
+
+
+def _bucket_upper(index: int) -> int:
+    """桶内最大值"""
+    if index < 2 * SUB_BUCKET_HALF:
+        return index
+    shift = index // SUB_BUCKET_HALF - 1
+    return ((index - shift * SUB_BUCKET_HALF + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """延迟直方图，单位微秒"""
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}  # 桶序号 -> 次数
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value_us: int):
+        value_us = max(int(value_us), 0)
+        index = _bucket_index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.min = value_us if not self.count else min(self.min, value_us)
+        self.max = max(self.max, value_us)
+        self.count += 1
+        self.total += value_us
+
+    def merge(self, other: 'LatencyHistogram'):
+        if not other.count:
+            return
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.min = other.min if not self.count else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q: float) -> int:
+        """第q百分位数，返回所在桶的上界且不超过最大值"""
+        if not self.count:
+            return 0
+        target = max(1, int(self.count * q / 100 + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self) -> Dict:
+        result = {
+            'count': self.count,
+            'min_us': self.min,
+            'mean_us': self.total / self.count if self.count else 0,
+            'max_us': self.max,
+        }
+        for q in PERCENTILES:
+            result[f"p{q:g}_us"] = self.percentile(q)
+        return result
+
+    def to_json(self) -> str:
+        return json.dumps({'counts': sorted(self.counts.items()), 'count': self.count,
+                           'total': self.total, 'min': self.min, 'max': self.max})
+
+    @classmethod
+    def from_json(cls, data: str) -> 'LatencyHistogram':
+        values = json.loads(data)
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in values['counts']}
+        histogram.count = values['count']
+        histogram.total = values['total']
+        histogram.min = values['min']
+        histogram.max = values['max']
+        return histogram
+
+
+class SignalTrace:
+    """一条信号各阶段的时间戳(纳秒)"""
+    __slots__ = ('signal_id', 'symbol', 'stamps', 'created')
+
+    def __init__(self, signal_id: int):
+        self.signal_id = signal_id
+        self.symbol: Optional[str] = None
+        self.stamps: Dict[str, int] = {}
+        self.created = time.monotonic()
+
+    def spans(self) -> Dict[str, int]:
+        """各统计区间的耗时(微秒)，缺少任一端的区间不统计"""
+        result = {}
+        for start, end in SPANS:
+            if start in self.stamps and end in self.stamps:
+                result[span_name(start, end)] = max(self.stamps[end] - self.stamps[start], 0) // 1000
+        return result
+
+    def offsets(self) -> Dict[str, int]:
+        """各阶段相对最早时间戳的偏移(微秒)"""
+        first = min(self.stamps.values())
+        return {stage: (self.stamps[stage] - first) // 1000 for stage in STAGES if stage in self.stamps}
+
+    @property
+    def total_us(self) -> int:
+        return (max(self.stamps.values()) - min(self.stamps.values())) // 1000
+
+
+class LatencyTracer:
+    """执行器端的延迟统计
+
+    各阶段由不同线程打点(通知监听线程、分发线程、网关回调线程)。信号收到首个成交回报，
+    或超过超时时间后完成统计；直方图由 flush 定时交给写库线程保存。
+    """
+    def __init__(self, db, writer, slowest: int = DEFAULT_SLOWEST,
+                 trace_timeout: float = DEFAULT_TRACE_TIMEOUT):
+        self.db = db
+        self.writer = writer
+        self.slowest = slowest
+        self.trace_timeout = trace_timeout
+        self._traces: OrderedDict = OrderedDict()  # 信号ID -> 进行中的SignalTrace
+        self._histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}  # (日期, 合约, 区间)
+        self._dirty: set = set()
+        self._day = today()
+        self._slow: List[Tuple[int, int]] = []  # 当日最慢信号的小顶堆 (总耗时, 信号ID)
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """载入当日已保存的直方图和慢信号，重启后接着统计而不是覆盖"""
+        day = today()
+        with self.db.get_cursor() as c:
+            c.execute('SELECT symbol, span, data FROM latency_histograms WHERE day = ?', (day,))
+            histograms = {(day, symbol, span): LatencyHistogram.from_json(data)
+                          for symbol, span, data in c.fetchall()}
+            c.execute('SELECT total_us, signal_id FROM latency_traces WHERE day = ?', (day,))
+            slow = c.fetchall()
+        with self._lock:
+            self._day = day
+            self._histograms.update(histograms)
+            self._slow = [tuple(row) for row in slow]
+            heapq.heapify(self._slow)
+        return len(histograms)
+
+    def stamp(self, signal_id: int, stage: str, symbol: Optional[str] = None,
+              ns: Optional[int] = None):
+        """记录信号到达某阶段的时间，同一阶段只记第一次"""
+        ns = ns if ns is not None else time.monotonic_ns()
+        with self._lock:
+            trace = self._traces.get(signal_id)
+            if trace is None:
+                # 下单之后的阶段只补充已有记录，统计完成后的回报不再新建
+                if stage not in ('received', 'committed', 'picked'):
+                    return
+                trace = self._traces[signal_id] = SignalTrace(signal_id)
+                if len(self._traces) > MAX_ACTIVE_TRACES:
+                    self._finish(self._traces.popitem(last=False)[1])
+            if symbol and trace.symbol is None:
+                trace.symbol = symbol
+            trace.stamps.setdefault(stage, ns)
+            if stage == 'trade':
+                self._finish(self._traces.pop(signal_id))
+
+    def on_webhook(self, first_id: int, last_id: int, received_ns: int, committed_ns: int):
+        """webhook进程随通知发来的接收和入库时间，同一请求的信号ID连续"""
+        for signal_id in range(first_id, last_id + 1):
+            self.stamp(signal_id, 'received', ns=received_ns)
+            self.stamp(signal_id, 'committed', ns=committed_ns)
+
+    def expire(self) -> int:
+        """超时的信号按已有阶段完成统计"""
+        deadline = time.monotonic() - self.trace_timeout
+        expired = 0
+        with self._lock:
+            while self._traces:
+                signal_id, trace = next(iter(self._traces.items()))
+                if trace.created > deadline:
+                    break
+                del self._traces[signal_id]
+                self._finish(trace)
+                expired += 1
+        return expired
+
+    def _finish(self, trace: SignalTrace):
+        # 没有被执行器取出的信号不知道合约，不计入统计
+        if trace.symbol is None or len(trace.stamps) < 2:
+            return
+        day = today()
+        if day != self._day:
+            self._day = day
+            self._slow = []
+        for span, value_us in trace.spans().items():
+            key = (day, trace.symbol, span)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(value_us)
+            self._dirty.add(key)
+
+        total_us = trace.total_us
+        if len(self._slow) >= self.slowest and total_us <= self._slow[0][0]:
+            return
+        evicted = None
+        if len(self._slow) >= self.slowest:
+            evicted = heapq.heapreplace(self._slow, (total_us, trace.signal_id))[1]
+        else:
+            heapq.heappush(self._slow, (total_us, trace.signal_id))
+        row = (trace.signal_id, day, trace.symbol, total_us, json.dumps(trace.offsets()), now_ms())
+        self.writer.submit(partial(_save_trace, row, evicted))
+
+    def flush(self):
+        """把有变化的直方图交给写库线程，并释放往日的直方图"""
+        with self._lock:
+            rows = [(day, symbol, span, self._histograms[(day, symbol, span)].count,
+                     self._histograms[(day, symbol, span)].to_json(), now_ms())
+                    for day, symbol, span in self._dirty]
+            self._dirty.clear()
+            for key in [key for key in self._histograms if key[0] != self._day]:
+                del self._histograms[key]
+        if rows:
+            self.writer.submit(partial(_save_histograms, rows))
+
+    def prune(self, days: int = DEFAULT_RETENTION_DAYS):
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+        self.writer.submit(partial(_prune, cutoff))
+
+    def active(self) -> int:
+        return len(self._traces)
+
+
+def _save_histograms(rows: List[Tuple], c):
+    c.executemany('''
+        INSERT OR REPLACE INTO latency_histograms (day, symbol, span, count, data, updated_ms)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def _save_trace(row: Tuple, evicted: Optional[int], c):
+    c.execute('''
+        INSERT OR REPLACE INTO latency_traces (signal_id, day, symbol, total_us, stages, created_ms)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', row)
+    if evicted is not None:
+        c.execute('DELETE FROM latency_traces WHERE signal_id = ?', (evicted,))
+
+
+def _prune(cutoff: str, c):
+    c.execute('DELETE FROM latency_histograms WHERE day < ?', (cutoff,))
+    c.execute('DELETE FROM latency_traces WHERE day < ?', (cutoff,))
+
+
+def day_range(days: int) -> Tuple[str, str]:
+    """最近 days 天(含当天)的起止日期"""
+    now = datetime.now()
+    return (now - timedelta(days=max(days, 1) - 1)).strftime('%Y%m%d'), now.strftime('%Y%m%d')
+
+
+def query_latency(c, start_day: str, end_day: str, symbol: Optional[str] = None) -> Dict:
+    """合并日期范围内(可指定合约)的直方图，返回各区间的分位数"""
+    sql = 'SELECT symbol, span, data FROM latency_histograms WHERE day >= ? AND day <= ?'
+    params = [start_day, end_day]
+    if symbol:
+        sql += ' AND symbol = ?'
+        params.append(symbol)
+    c.execute(sql, params)
+    merged: Dict[str, LatencyHistogram] = {}
+    symbols = set()
+    for row_symbol, span, data in c.fetchall():
+        symbols.add(row_symbol)
+        merged.setdefault(span, LatencyHistogram()).merge(LatencyHistogram.from_json(data))
+    spans = []
+    for start, end in SPANS:
+        histogram = merged.get(span_name(start, end))
+        if histogram is not None:
+            spans.append({'span': span_name(start, end), 'from': start, 'to': end, **histogram.summary()})
+    return {'symbols': sorted(symbols), 'spans': spans}
+
+
+def query_slowest(c, start_day: str, end_day: str, limit: int = 20,
+                  symbol: Optional[str] = None) -> List[Dict]:
+    """日期范围内最慢的信号及各阶段时间(相对最早阶段的微秒数)"""
+    sql = '''
+        SELECT signal_id, day, symbol, total_us, stages
+        FROM latency_traces
+        WHERE day >= ? AND day <= ?
+    '''
+    params = [start_day, end_day]
+    if symbol:
+        sql += ' AND symbol = ?'
+        params.append(symbol)
+    sql += ' ORDER BY total_us DESC LIMIT ?'
+    params.append(limit)
+    c.execute(sql, params)
+    return [{
+        'signal_id': signal_id,
+        'day': day,
+        'symbol': row_symbol,
+        'total_us': total_us,
+        'stages': json.loads(stages),
+    } for signal_id, day, row_symbol, total_us, stages in c.fetchall()]
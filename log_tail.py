@@ -0,0 +1,110 @@
+import os
+import time
+from typing import Iterator, List, Optional
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+def level_marker(level: Optional[str]) -> Optional[bytes]:
+    """日志格式为 '时间 - 模块 - 级别 - 内容'，按 ' - 级别 - ' 匹配"""
+    if not level:
+        return None
+    level = level.upper()
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Unknown log level: {level}")
+    return f" - {level} - ".encode()
+
+
+def tail_lines(path: str, lines: int = 100, level: Optional[str] = None,
+               block_size: int = 8192) -> List[str]:
+    """从文件末尾按块向前读取最后若干行
+
+    Args:
+        path: 日志文件路径
+        lines: 返回的行数
+        level: 只返回该级别的日志行
+        block_size: 每次向前读取的字节数
+
+    Returns:
+        按原顺序排列的日志行（保留换行符）
+    """
+    marker = level_marker(level)
+    if lines <= 0:
+        return []
+
+    matched: List[bytes] = []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = file_size = f.tell()
+        remainder = b''  # 块开头尚未确定完整的半行
+        at_end = True
+        while position > 0 and len(matched) < lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            chunk = f.read(read_size) + remainder
+            parts = chunk.split(b'\n')
+            # 第一段可能是上一块的行尾，留到下一轮拼接
+            remainder = parts[0]
+            complete = parts[1:]
+            for index in range(len(complete) - 1, -1, -1):
+                line = complete[index]
+                if at_end:
+                    at_end = False
+                    if not line:
+                        continue  # 文件末尾的换行
+                if marker is None or marker in line:
+                    matched.append(line)
+                    if len(matched) >= lines:
+                        break
+        # 读到文件开头时剩余部分就是第一行
+        if position == 0 and len(matched) < lines and file_size > 0:
+            if marker is None or marker in remainder:
+                matched.append(remainder)
+
+    return [line.decode('utf-8', errors='replace') + '\n' for line in reversed(matched)]
+
+
+def follow_lines(path: str, level: Optional[str] = None, poll_interval: float = 0.5,
+                 idle_timeout: Optional[float] = None) -> Iterator[Optional[str]]:
+    """从当前文件末尾开始持续输出新追加的日志行
+
+    只读取新增的字节，检测到日志轮转(文件被替换或截断)后从新文件开头继续。
+    空闲超过idle_timeout秒时输出None，供调用方发送心跳。
+    """
+    marker = level_marker(level)
+    f = open(path, 'rb')
+    try:
+        f.seek(0, os.SEEK_END)
+        partial = b''
+        idle_since = time.monotonic()
+        while True:
+            line = f.readline()
+            if line:
+                if not line.endswith(b'\n'):
+                    partial += line  # 写入方尚未写完整行
+                    continue
+                line = partial + line
+                partial = b''
+                idle_since = time.monotonic()
+                if marker is None or marker in line:
+                    yield line.decode('utf-8', errors='replace')
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and (stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell()):
+                # 日志已轮转，切换到新文件
+                f.close()
+                f = open(path, 'rb')
+                partial = b''
+                continue
+
+            if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                idle_since = time.monotonic()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        f.close()
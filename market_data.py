@@ -1,5 +1,9 @@
-from typing import Dict, Optional
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, List, Optional
 import logging
+import threading
+import time
 from ctpbee import CtpBee, CtpbeeApi
 from ctpbee.constant import (
     OrderRequest, 
@@ -10,29 +14,167 @@ from ctpbee.constant import (
     ContractData,
     TickData
 )
-from database import DatabaseConnection
+from database import get_database, now_ms
+from pnl_ledger import apply_trades, insert_fill, rebuild_if_empty, OPEN, CLOSE
+from position_book import PositionBook
+from order_registry import OrderRegistry
+from latency_tracer import LatencyTracer
+from db_writer import DbWriter
+from account_history import AccountSampler, record_sample
+from tick_buffer import TickBuffers
+from tick_recorder import TickRecorder
+from bar_aggregator import BarAggregator, save_bars
+from contract_registry import get_registry
+from event_bus import EVENT_ACCOUNT, EVENT_ORDER, EVENT_TRADE, enum_value, publish_event
 
 logger = logging.getLogger(__name__)
 
+# 映射登记前到达的订单回报最多暂存条数
+MAX_UNMATCHED_ORDERS = 1000
+# 持仓查询回报逐条到达，最后一条之后该时间内没有新回报视为查询已返回（秒）
+POSITION_QUIET_SECONDS = 1.0
+
+def _write_account(snapshot: Dict, c):
+    """在写库线程中更新账户信息"""
+    # 先尝试更新
+    c.execute('''
+        UPDATE account_info 
+        SET balance = ?,
+            equity = ?,
+            available = ?,
+            position_profit = ?
+        WHERE id = 1
+    ''', (snapshot['balance'], snapshot['equity'], 
+         snapshot['available'], snapshot['position_profit']))
+    
+    # 如果没有更新任何行(即记录不存在)，则插入
+    if c.rowcount == 0:
+        c.execute('''
+            INSERT INTO account_info (id, balance, equity, available, position_profit)
+            VALUES (1, ?, ?, ?, ?)
+        ''', (snapshot['balance'], snapshot['equity'], 
+             snapshot['available'], snapshot['position_profit']))
+
+
+def _record_sample(snapshot: Dict, timestamp_ms: int, c):
+    record_sample(c, snapshot, timestamp_ms)
+
+
+def trade_fill(trade, signal_id: int, timestamp_ms: int) -> Dict:
+    """成交回报转换为账本的成交明细"""
+    is_long = trade.direction == Direction.LONG
+    if trade.offset == Offset.OPEN:
+        offset, direction = OPEN, 'LONG' if is_long else 'SHORT'
+    else:
+        # 平仓成交的方向与被平持仓相反
+        offset, direction = CLOSE, 'SHORT' if is_long else 'LONG'
+    return {
+        'signal_id': signal_id,
+        'symbol': trade.symbol,
+        'direction': direction,
+        'offset': offset,
+        'price': float(trade.price),
+        'volume': int(trade.volume),
+        # 与 CURRENT_TIMESTAMP 相同的UTC时间格式
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp_ms / 1000)),
+        'timestamp_ms': timestamp_ms,
+    }
+
+
+def _write_trade(fill: Optional[Dict], trade_id: str, order_id: str, event: Optional[Dict], c):
+    """在写库线程中记录成交明细并计入盈亏账本，网关重复推送的成交不重复计入"""
+    if fill is not None and insert_fill(c, fill, trade_id, order_id):
+        apply_trades(c, [fill])
+    if event is not None:
+        publish_event(c, EVENT_TRADE, event)
+
+
+def _rebuild_pending_ledger(c):
+    count = rebuild_if_empty(c)
+    if count is not None:
+        logger.info(f"盈亏账本已按合约注册表重建, 共 {count} 笔交易")
+
+
 class MarketDataApi(CtpbeeApi):
     """行情API"""
     def __init__(self, name: str, app: CtpBee):
         super().__init__(name, app)
         self.ticks: Dict[str, TickData] = {}
         self.subscribed_symbols: set = set()  # 记录已订阅的合约
+        self.tick_buffers = TickBuffers()  # 各合约最近的TICK
+        self.tick_recorder: Optional[TickRecorder] = None  # 开启录制后把TICK写入本地文件
+        # TICK合成K线，完成的K线定时批量写库
+        self.bar_aggregator = BarAggregator()
+        self.bar_aggregator.add_listener(lambda bar: self._notify('bar', bar))
         self.inited = False
-        self.db = DatabaseConnection()
+        self.db = get_database()
+        # 回调中的写库操作交给后台线程批量写入，不阻塞网关回调线程
+        self.writer = DbWriter(self.db)
+        self.writer.start()
+        self.contracts = get_registry()  # 合约查询回报写入注册表
+        self.position_book = PositionBook()  # 按(品种, 方向)索引的实时持仓
+        self.position_received_at: Optional[float] = None  # 最近一次持仓回报的 time.monotonic()
+        self.orders = OrderRegistry(self.db)  # 网关订单号 -> 信号
+        # send_order 返回前网关已推送的订单回报，登记映射后补处理
+        self._unmatched: OrderedDict = OrderedDict()
+        # 同样情况下的成交回报: 网关订单号 -> [(成交, 收到时间毫秒)]，登记映射后计入账本
+        self._unmatched_trades: OrderedDict = OrderedDict()
+        # 订单回报与登记映射互斥，保证同一委托的回报按到达顺序生效
+        self._order_lock = threading.RLock()
+        self.latency = LatencyTracer(self.db, self.writer)  # 信号各阶段延迟统计
+        self.last_account_event = None  # 上次推送的账户快照，未变化时不重复推送
+        self.account_sampler = AccountSampler()  # 账户历史采样节流
+        # 其他组件订阅的回调: 事件名 -> 回调列表
+        self.listeners: Dict[str, List[Callable]] = {'init': [], 'trade': [], 'bar': []}
+        self.bar_aggregator.start(self._flush_bars)
         logger.info("MarketDataApi initialized")
         
     def on_init(self, init: bool):
         """行情接口初始化回调"""
         self.inited = init
         logger.info(f"MarketDataApi on_init: {init}")
+        if init:
+            # 合约查询已完成，更新本地缓存
+            try:
+                self.contracts.save()
+            except Exception as e:
+                logger.error(f"保存合约缓存失败: {str(e)}")
+            # 升级时因缺少合约乘数而跳过的账本重建在这里补做
+            self.writer.submit(_rebuild_pending_ledger)
+        self._notify('init', init)
+        
+    def add_listener(self, event: str, callback: Callable):
+        """订阅init/trade/bar回调"""
+        self.listeners[event].append(callback)
+        
+    def _notify(self, event: str, data):
+        for callback in self.listeners[event]:
+            try:
+                callback(data)
+            except Exception as e:
+                logger.error(f"{event} 回调处理失败: {str(e)}")
+                logger.exception("详细错误信息:")
+        
+    def on_contract(self, contract: ContractData) -> None:
+        """合约查询回报"""
+        self.contracts.on_contract(contract)
         
     def on_tick(self, tick: TickData) -> None:
         """处理TICK数据"""
         self.ticks[tick.symbol] = tick
         self.subscribed_symbols.add(tick.symbol)  # 记录收到TICK数据的合约
+        record = self.tick_buffers.append(tick)
+        recorder = self.tick_recorder  # 退出时会被置为None，只读一次
+        if recorder is not None:
+            try:
+                recorder.on_tick(tick, record)
+            except Exception as e:
+                logger.error(f"录制TICK失败: {str(e)}")
+        self.bar_aggregator.on_tick(tick)
+        
+    def _flush_bars(self, bars):
+        """已完成的K线合并为一次写库"""
+        self.writer.submit(lambda c: save_bars(c, bars))
         
     def get_latest_price(self, symbol: str) -> Optional[float]:
         """取最新价格"""
@@ -46,6 +188,16 @@ class MarketDataApi(CtpbeeApi):
         logger.warning(f"未找到合约 {symbol} 的TICK数据")
         return None
         
+    def on_position(self, position) -> None:
+        """处理持仓数据"""
+        self.position_book.on_position(position)
+        self.position_received_at = time.monotonic()
+        
+    def positions_settled(self, quiet: float = POSITION_QUIET_SECONDS) -> bool:
+        """持仓查询已返回: 收到过持仓回报，且最近 quiet 秒内没有新的回报"""
+        received_at = self.position_received_at
+        return received_at is not None and time.monotonic() - received_at >= quiet
+        
     def on_account(self, account) -> None:
         """处理账户数据"""
         try:
@@ -55,25 +207,23 @@ class MarketDataApi(CtpbeeApi):
             for pos in positions:
                 total_float_pnl += pos.float_pnl if pos.float_pnl is not None else 0
 
-            with DatabaseConnection().get_cursor() as c:
-                # 先尝试更新
-                c.execute('''
-                    UPDATE account_info 
-                    SET balance = ?,
-                        equity = ?,
-                        available = ?,
-                        position_profit = ?
-                    WHERE id = 1
-                ''', (account.balance, account.balance + total_float_pnl, 
-                     account.available, total_float_pnl))
-                
-                # 如果没有更新任何行(即记录不存在)，则插入
-                if c.rowcount == 0:
-                    c.execute('''
-                        INSERT INTO account_info (id, balance, equity, available, position_profit)
-                        VALUES (1, ?, ?, ?, ?)
-                    ''', (account.balance, account.balance + total_float_pnl, 
-                         account.available, total_float_pnl))
+            snapshot = {
+                'balance': account.balance,
+                'equity': account.balance + total_float_pnl,
+                'available': account.available,
+                'position_profit': total_float_pnl
+            }
+
+            timestamp_ms = now_ms()
+            # 账户表只保留最新一次推送
+            self.writer.submit(partial(_write_account, snapshot), key='account')
+            # 是否推送事件、是否采样在这里决定一次，写库操作不带副作用，
+            # 整批失败逐条重试时不会再次改变节流状态
+            if snapshot != self.last_account_event:
+                self.last_account_event = snapshot
+                self.writer.submit(lambda c: publish_event(c, EVENT_ACCOUNT, snapshot))
+            if self.account_sampler.due(timestamp_ms):
+                self.writer.submit(partial(_record_sample, snapshot, timestamp_ms))
                      
         except Exception as e:
             logger.error(f"更新账户数据失败: {str(e)}")
@@ -81,6 +231,11 @@ class MarketDataApi(CtpbeeApi):
 
     def on_order(self, order) -> None:
         """处理订单状态更新"""
+        received_ns = time.monotonic_ns()
+        with self._order_lock:
+            self._apply_order(order, received_ns)
+
+    def _apply_order(self, order, received_ns: int):
         try:
             # 映射订单状态到我们的状态系统
             status_map = {
@@ -99,36 +254,120 @@ class MarketDataApi(CtpbeeApi):
             
             # logger.info(f"订单状态: {order.status}")
             
-            # 更新数据库中的订单状态
-            with self.db.get_cursor() as c:
-                c.execute('''
-                    UPDATE trading_signals 
-                    SET status = ?,
-                        process_time = CASE 
-                            WHEN status IN ('filled', 'cancelled', 'rejected', 'failed') 
-                            THEN CURRENT_TIMESTAMP 
-                            ELSE process_time 
-                        END,
-                        processed = CASE 
-                            WHEN status IN ('filled', 'cancelled', 'rejected', 'failed') 
-                            THEN TRUE 
-                            ELSE processed 
-                        END
-                    WHERE order_id = ?
-                ''', (current_status, "ctp."+order.order_id))
+            record = self.orders.get(order.local_order_id)
+            if record is None:
+                # 下单线程尚未登记映射，或不是本程序发出的委托
+                self._unmatched[order.local_order_id] = (order, received_ns)
+                self._unmatched.move_to_end(order.local_order_id)
+                if len(self._unmatched) > MAX_UNMATCHED_ORDERS:
+                    self._unmatched.popitem(last=False)
+                logger.debug(f"订单 {order.local_order_id} 未找到对应信号")
+                return
+            
+            if order_status != "SUBMITTING":
+                # 提交中是网关在 send_order 内部推送的，不算回报
+                self.latency.stamp(record.signal_id, 'order', ns=received_ns)
+            
+            event = {
+                'order_id': order.local_order_id,
+                'signal_id': record.signal_id,
+                'symbol': order.symbol,
+                'status': current_status,
+                'direction': enum_value(order.direction),
+                'offset': enum_value(order.offset),
+                'price': order.price,
+                'volume': order.volume,
+                'traded': order.traded
+            }
+            # 同一委托尚未写入的状态被最新状态替换
+            self.writer.submit(partial(self._write_order, record.signal_id, current_status, event),
+                               key=('order', order.local_order_id))
 
         except Exception as e:
             logger.error(f"处理订单状态更新失败: {str(e)}")
             logger.exception("详细错误信息:")
 
+    def _write_order(self, signal_id: int, current_status: str, event: Dict, c):
+        """在写库线程中更新信号状态，盈亏账本由成交回报维护"""
+        c.execute('''
+            UPDATE trading_signals 
+            SET status = ?,
+                process_time = CASE 
+                    WHEN status IN ('filled', 'cancelled', 'rejected', 'failed') 
+                    THEN CURRENT_TIMESTAMP 
+                    ELSE process_time 
+                END,
+                processed = CASE 
+                    WHEN status IN ('filled', 'cancelled', 'rejected', 'failed') 
+                    THEN TRUE 
+                    ELSE processed 
+                END
+            WHERE id = ?
+        ''', (current_status, signal_id))
+        
+        publish_event(c, EVENT_ORDER, event)
+
+    def register_order(self, local_order_id: str, signal_id: int, gateway_order_id: str,
+                       symbol: str):
+        """登记下单结果并更新信号状态，补处理登记前已到达的订单回报"""
+        with self._order_lock:
+            # 内存中登记后即可匹配回报；写库交给写库线程，先于补处理的回报状态写入
+            record = self.orders.register(local_order_id, signal_id, gateway_order_id, symbol)
+            self.writer.submit(partial(self._write_registration, record))
+            unmatched = self._unmatched.pop(gateway_order_id, None)
+            if unmatched is not None:
+                self._apply_order(*unmatched)
+            # 登记前到达的成交已推送过事件，这里只计入账本
+            for trade, timestamp_ms in self._unmatched_trades.pop(gateway_order_id, ()):
+                self.writer.submit(partial(_write_trade, trade_fill(trade, signal_id, timestamp_ms),
+                                           trade.tradeid, trade.local_order_id, None))
+
+    def _write_registration(self, record, c):
+        """在写库线程中保存委托映射并更新信号状态"""
+        self.orders.save(record, c)
+        c.execute('''
+            UPDATE trading_signals 
+            SET order_id = ?, status = 'submitted'
+            WHERE id = ?
+        ''', (record.gateway_order_id, record.signal_id))
+
     def on_trade(self, trade) -> None:
         """处理成交回报"""
+        received_ns = time.monotonic_ns()
         try:
+            self.position_book.on_trade(trade)
+            self._notify('trade', trade)
             logger.info(f"收到成交回报: 订单ID={trade.order_id} "
                        f"价格={trade.price} "
                        f"数量={trade.volume} "
                        f"方向={trade.direction} "
                        f"开平={trade.offset}")
+            
+            timestamp_ms = now_ms()
+            with self._order_lock:
+                record = self.orders.get(trade.local_order_id)
+                if record is not None:
+                    self.latency.stamp(record.signal_id, 'trade', ns=received_ns)
+                    fill = trade_fill(trade, record.signal_id, timestamp_ms)
+                else:
+                    # 下单线程尚未登记映射，或不是本程序发出的委托；登记后再计入账本
+                    fill = None
+                    self._unmatched_trades.setdefault(trade.local_order_id, []).append((trade, timestamp_ms))
+                    if len(self._unmatched_trades) > MAX_UNMATCHED_ORDERS:
+                        self._unmatched_trades.popitem(last=False)
+            event = {
+                'order_id': trade.local_order_id,
+                'signal_id': record.signal_id if record else None,
+                'trade_id': trade.tradeid,
+                'symbol': trade.symbol,
+                'direction': enum_value(trade.direction),
+                'offset': enum_value(trade.offset),
+                'price': trade.price,
+                'volume': trade.volume,
+                'time': str(trade.time) if trade.time else None
+            }
+            # 成交明细、账本和事件在同一事务内写入
+            self.writer.submit(partial(_write_trade, fill, trade.tradeid, trade.local_order_id, event))
 
         except Exception as e:
             logger.error(f"处理成交回报失败: {str(e)}")
@@ -5,6 +5,8 @@ import atexit
 from pathlib import Path
 from ctpbee import CtpBee, CtpbeeApi
 from ctpbee.constant import OrderRequest, Direction, Offset, OrderType, Exchange
+from contract_registry import get_registry
+import sim_gateway
 import pandas as pd
 import time
 from queue import Queue
@@ -23,45 +25,8 @@ if 'account_manager' not in st.session_state:
 if 'order_records' not in st.session_state:
     st.session_state['order_records'] = []
 
-# 合约规格信息
-CONTRACT_SPECS = {    
-    # 上期所
-    'FU': {'size': 10, 'exchange': Exchange.SHFE, 'name': '燃油'}, 
-    'AG': {'size': 15, 'exchange': Exchange.SHFE, 'name': '白银'},
-    'RU': {'size': 50, 'exchange': Exchange.SHFE, 'name': '橡胶'},
-    'AL': {'size': 5, 'exchange': Exchange.SHFE, 'name': '铝'},
-    'ZN': {'size': 5, 'exchange': Exchange.SHFE, 'name': '锌'},
-    'AO': {'size': 20, 'exchange': Exchange.SHFE, 'name': '氧化铝'},
-    'RB': {'size': 10, 'exchange': Exchange.SHFE, 'name': '螺纹钢'},
-    'BU': {'size': 10, 'exchange': Exchange.SHFE, 'name': '沥青'},
-    'SP': {'size': 20, 'exchange': Exchange.SHFE, 'name': '纸浆'},
-    'HC': {'size': 10, 'exchange': Exchange.SHFE, 'name': '热卷'},
-    'NI': {'size': 1, 'exchange': Exchange.SHFE, 'name': '镍'},
-    
-    # 大商所
-    'M': {'size': 10, 'exchange': Exchange.DCE, 'name': '豆粕'},
-    'Y': {'size': 10, 'exchange': Exchange.DCE, 'name': '豆油'},
-    'C': {'size': 10, 'exchange': Exchange.DCE, 'name': '玉米'},
-    'I': {'size': 100, 'exchange': Exchange.DCE, 'name': '铁矿'},
-    'PP': {'size': 5, 'exchange': Exchange.DCE, 'name': '聚丙烯'},
-    'V': {'size': 5, 'exchange': Exchange.DCE, 'name': 'PVC'},
-    'EB': {'size': 5, 'exchange': Exchange.DCE, 'name': '苯乙烯'},
-    'L': {'size': 5, 'exchange': Exchange.DCE, 'name': '塑料'},
-    'JD': {'size': 5, 'exchange': Exchange.DCE, 'name': '鸡蛋'},
-    'LH': {'size': 16, 'exchange': Exchange.DCE, 'name': '生猪'},
-    
-    # 郑商所
-    'SR': {'size': 10, 'exchange': Exchange.CZCE, 'name': '白糖'},
-    'MA': {'size': 10, 'exchange': Exchange.CZCE, 'name': '甲醇'},
-    'TA': {'size': 5, 'exchange': Exchange.CZCE, 'name': 'PTA'},
-    'SA': {'size': 20, 'exchange': Exchange.CZCE, 'name': '纯碱'},
-    'FG': {'size': 20, 'exchange': Exchange.CZCE, 'name': '玻璃'},
-    'UR': {'size': 20, 'exchange': Exchange.CZCE, 'name': '尿素'},
-    'RM': {'size': 10, 'exchange': Exchange.CZCE, 'name': '菜粕'},
-    'OI': {'size': 10, 'exchange': Exchange.CZCE, 'name': '菜油'},
-    'PX': {'size': 5, 'exchange': Exchange.CZCE, 'name': '对二甲苯'},
-    'SM': {'size': 50, 'exchange': Exchange.CZCE, 'name': '锰硅'},
-}
+# 合约规格以CTP合约查询结果为准，见 contract_registry.py
+contract_registry = get_registry()
 
 # 合约列表
 CONTRACTS = ["RB2510", "MA2505", "SA2505", "RM2509", "FU2507", "FG2505", 
@@ -73,9 +38,9 @@ CONTRACTS = ["RB2510", "MA2505", "SA2505", "RM2509", "FU2507", "FG2505",
 
 def get_contract_display_name(contract_code):
     """获取合约的显示名称（带中文名）"""
-    product_code = ''.join(filter(str.isalpha, contract_code.upper()))
-    if product_code in CONTRACT_SPECS:
-        return f"{CONTRACT_SPECS[product_code]['name']}：{contract_code}"
+    contract = contract_registry.get(contract_code)
+    if contract is not None and contract.name:
+        return f"{contract.name}：{contract_code}"
     return contract_code
 
 # 按交易所分类的合约（带中文名）
@@ -107,6 +72,15 @@ class TraderApi(CtpbeeApi):
         order_queue.put(record)
         print(f"订单回报 - {self.account_name}: {record}")
         
+    def on_contract(self, contract):
+        """合约查询回报"""
+        contract_registry.on_contract(contract)
+        
+    def on_init(self, init):
+        """接口初始化完成，更新合约缓存"""
+        if init:
+            contract_registry.save()
+        
     def on_trade(self, trade):
         """成交回报"""
         record = {
@@ -185,8 +159,12 @@ class AccountManager:
             # 使用原始配置
             config = account['config'].copy()
             # 只添加必要的配置
+            # 账户配置为模拟网关时保留，其余一律使用CTP
+            interface = "sim" if config.get("INTERFACE") == sim_gateway.INTERFACE_NAME else "ctp"
+            if interface == sim_gateway.INTERFACE_NAME:
+                sim_gateway.register()
             config.update({
-                "INTERFACE": "ctp",
+                "INTERFACE": interface,
                 "TD_FUNC": True,
                 "MD_FUNC": True
             })
@@ -263,32 +241,18 @@ class AccountManager:
             actual_symbol = symbol.split("：")[-1].strip() if "：" in symbol else symbol.strip()
             print(f"处理合约代码: 原始={symbol}, 提取后={actual_symbol}")
             
-            # 获取合约信息（只取字母部分作为品种代码）
-            product_code = ''.join(c for c in actual_symbol.upper() if c.isalpha())
-            print(f"提取品种代码: {product_code}")
-            
-            if product_code not in CONTRACT_SPECS:
-                return False, f"未知合约品种: {product_code}"
-                
-            contract_info = CONTRACT_SPECS[product_code]
-            
-            # 处理合约代码
-            if contract_info['exchange'] == Exchange.CZCE:
-                # 郑商所合约去掉年份中的20
-                # if len(actual_symbol) > 6:
-                # actual_symbol = actual_symbol.upper()
-                # actual_symbol = actual_symbol.replace('2', '')
-                pass
-            else:
-                # 大商所合约转换为大写
-                actual_symbol = actual_symbol.lower()
+            # 获取合约信息，注册表统一处理大小写和郑商所年份写法
+            contract = contract_registry.get(actual_symbol)
+            if contract is None:
+                return False, f"未知合约: {actual_symbol}"
+            actual_symbol = contract.symbol
                 
             print(f"最终合约代码: {actual_symbol}")
             
             # 构建订单请求
             req = OrderRequest(
                 symbol=actual_symbol,  # 使用处理后的合约代码
-                exchange=contract_info['exchange'],
+                exchange=Exchange(contract.exchange),
                 direction=Direction.LONG if direction == "买入" else Direction.SHORT,
                 offset=Offset.OPEN if offset == "开仓" else Offset.CLOSE,
                 type=OrderType.LIMIT,
@@ -297,7 +261,7 @@ class AccountManager:
                 gateway_name="ctp"
             )
             
-            print(f"发送订单 - {account_name}: 合约={actual_symbol}, 品种={product_code}, 交易所={contract_info['exchange']}, 方向={direction}, 开平={offset}, 价格={price}, 数量={volume}")
+            print(f"发送订单 - {account_name}: 合约={actual_symbol}, 品种={contract.product_code}, 交易所={contract.exchange}, 方向={direction}, 开平={offset}, 价格={price}, 数量={volume}")
             # 发送订单
             order_id = app.send_order(req)
             return True, f"订单已发送，订单号: {order_id}"
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from database import now_ms
+
+logger = logging.getLogger(__name__)
+
+MEMORY_HOURS = 72  # 内存中保留映射的时长（小时），启动时载入同样时长的映射
+
+
+class OrderRecord:
+    """一笔委托的映射: 本地订单号 -> 信号ID -> 网关订单号"""
+    __slots__ = ('local_order_id', 'signal_id', 'gateway_order_id', 'symbol', 'created_ms')
+
+    def __init__(self, local_order_id: str, signal_id: int, gateway_order_id: str,
+                 symbol: str, created_ms: int):
+        self.local_order_id = local_order_id
+        self.signal_id = signal_id
+        self.gateway_order_id = gateway_order_id
+        self.symbol = symbol
+        self.created_ms = created_ms
+
+
+class OrderRegistry:
+    """委托与信号的映射
+
+    内存中按网关订单号(即 OrderData.local_order_id, 如 ctp.1_123_5)和本地订单号索引，
+    并写入带主键的 order_map 表。查询只读内存，不在网关回调线程上访问数据库；
+    重启时载入与内存保留时长相同的最近映射。一个信号可能对应多笔委托(分别平昨、平今)。
+    """
+    def __init__(self, db):
+        self.db = db
+        self._by_gateway: Dict[str, OrderRecord] = {}
+        self._by_local: Dict[str, OrderRecord] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_gateway)
+
+    def _add(self, record: OrderRecord):
+        with self._lock:
+            self._by_gateway[record.gateway_order_id] = record
+            self._by_local[record.local_order_id] = record
+
+    def register(self, local_order_id: str, signal_id: int, gateway_order_id: str,
+                 symbol: str) -> OrderRecord:
+        """在内存中记录新委托，写库由调用方交给 save"""
+        record = OrderRecord(local_order_id, signal_id, gateway_order_id, symbol, now_ms())
+        self._add(record)
+        return record
+
+    @staticmethod
+    def save(record: OrderRecord, c):
+        """写入 order_map，在调用方(写库线程)的事务内执行"""
+        c.execute('''
+            INSERT OR REPLACE INTO order_map (gateway_order_id, local_order_id, signal_id, symbol, created_ms)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (record.gateway_order_id, record.local_order_id, record.signal_id, record.symbol,
+              record.created_ms))
+
+    def get(self, gateway_order_id: str) -> Optional[OrderRecord]:
+        """按网关订单号查找，只查内存"""
+        return self._by_gateway.get(gateway_order_id)
+
+    def by_local(self, local_order_id: str) -> Optional[OrderRecord]:
+        return self._by_local.get(local_order_id)
+
+    def load_recent(self, hours: float = MEMORY_HOURS) -> int:
+        """载入最近的映射，返回条数"""
+        since = now_ms() - int(hours * 3600 * 1000)
+        with self.db.get_cursor() as c:
+            c.execute('''
+                SELECT local_order_id, signal_id, gateway_order_id, symbol, created_ms
+                FROM order_map WHERE created_ms >= ?
+            ''', (since,))
+            rows = c.fetchall()
+        for row in rows:
+            self._add(OrderRecord(*row))
+        return len(rows)
+
+    def prune(self, hours: float = MEMORY_HOURS) -> int:
+        """从内存中移除较早的映射，数据库中的记录保留"""
+        since = (time.time() - hours * 3600) * 1000
+        with self._lock:
+            expired = [record for record in self._by_gateway.values() if record.created_ms < since]
+            for record in expired:
+                self._by_gateway.pop(record.gateway_order_id, None)
+                self._by_local.pop(record.local_order_id, None)
+        return len(expired)
@@ -0,0 +1,239 @@
+"""向量化盈亏引擎
+
+与 pnl_ledger.match_fill 使用相同的按信号开平配对规则, 但以列数组批量计算,
+用于对大规模历史信号做离线分析。盈亏账本本身按实际成交维护, 见 pnl_ledger.match_trade。
+
+配对规则可以写成游程形式: 同一品种内把连续的开仓/平仓动作合并为游程,
+空仓时的平仓游程被忽略, 之后开仓游程与平仓游程严格交替, 每个游程只有
+第一笔生效, 相邻的一对(开, 平)即一笔round trip。
+"""
+import argparse
+import logging
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from pnl_ledger import CLOSE_ACTIONS, OPEN_ACTIONS, get_contract_spec, replay_fills
+
+logger = logging.getLogger(__name__)
+
+FILL_FIELDS = ['id', 'symbol', 'action', 'price', 'timestamp', 'timestamp_ms', 'volume']
+
+ROUND_TRIP_FIELDS = ['open_signal_id', 'close_signal_id', 'symbol', 'direction', 'open_time',
+                     'close_time', 'open_time_ms', 'close_time_ms', 'open_price', 'close_price',
+                     'volume', 'point_profit', 'fee', 'profit']
+
+OPEN_POSITION_FIELDS = ['symbol', 'direction', 'signal_id', 'price', 'open_time',
+                        'open_time_ms', 'volume', 'open_fee']
+
+
+def fills_frame(ids: Sequence, symbols: Sequence, actions: Sequence, prices: Sequence,
+                volumes: Sequence, timestamps: Optional[Sequence] = None,
+                timestamps_ms: Optional[Sequence] = None) -> pd.DataFrame:
+    """由列数组构造成交表, 行顺序即成交顺序"""
+    n = len(ids)
+    return pd.DataFrame({
+        'id': np.asarray(ids),
+        'symbol': np.asarray(symbols, dtype=object),
+        'action': np.asarray(actions, dtype=object),
+        'price': np.asarray(prices, dtype=np.float64),
+        'timestamp': np.asarray(timestamps if timestamps is not None else [None] * n, dtype=object),
+        'timestamp_ms': np.asarray(timestamps_ms if timestamps_ms is not None else [None] * n, dtype=object),
+        'volume': np.asarray(volumes, dtype=np.int64),
+    })
+
+
+def compute_round_trips(fills: pd.DataFrame):
+    """批量配对开平仓
+
+    Args:
+        fills: 含FILL_FIELDS列的成交表, 行顺序即成交顺序
+
+    Returns:
+        (round trip表, 未平仓表), 列分别为ROUND_TRIP_FIELDS和OPEN_POSITION_FIELDS
+    """
+    if fills.empty:
+        return pd.DataFrame(columns=ROUND_TRIP_FIELDS), pd.DataFrame(columns=OPEN_POSITION_FIELDS)
+
+    actions = fills['action'].astype(str).str.upper().to_numpy()
+    # 1: 开仓, -1: 平仓, 0: 不影响配对的动作
+    kind = np.where(np.isin(actions, list(OPEN_ACTIONS)), 1,
+                    np.where(np.isin(actions, list(CLOSE_ACTIONS)), -1, 0))
+    keep = kind != 0
+    frame = fills.loc[keep].reset_index(drop=True)
+    kind = kind[keep]
+    actions = actions[keep]
+    if frame.empty:
+        return pd.DataFrame(columns=ROUND_TRIP_FIELDS), pd.DataFrame(columns=OPEN_POSITION_FIELDS)
+
+    # 品种编码, 合约规格只对去重后的品种查一次
+    symbol_codes, symbols = pd.factorize(frame['symbol'])
+    specs = [get_contract_spec(symbol) for symbol in symbols]
+    size_by_code = np.array([spec['size'] for spec in specs], dtype=np.float64)
+    open_fee_by_code = np.array([spec['fee']['open'] for spec in specs], dtype=np.float64)
+    close_fee_by_code = np.array([spec['fee']['close'] for spec in specs], dtype=np.float64)
+
+    # 按品种稳定排序, 同一品种内保持成交顺序
+    order = np.argsort(symbol_codes, kind='stable')
+    codes = symbol_codes[order]
+    kind = kind[order]
+
+    new_symbol = np.empty(len(order), dtype=bool)
+    new_symbol[0] = True
+    new_symbol[1:] = codes[1:] != codes[:-1]
+    run_start = new_symbol.copy()
+    run_start[1:] |= kind[1:] != kind[:-1]
+    # 空仓时的平仓游程(品种的第一个游程为平仓)不生效
+    effective = run_start & ~(new_symbol & (kind == -1))
+
+    rows = order[effective]
+    codes = codes[effective]
+    kind = kind[effective]
+
+    # 生效事件在品种内开/平严格交替, 开仓后紧跟同品种平仓即配对成功
+    paired = np.zeros(len(rows), dtype=bool)
+    paired[:-1] = (kind[:-1] == 1) & (kind[1:] == -1) & (codes[:-1] == codes[1:])
+    open_idx = rows[paired]
+    close_idx = rows[np.flatnonzero(paired) + 1]
+    still_open = rows[(kind == 1) & ~paired]
+
+    price = frame['price'].to_numpy(dtype=np.float64)
+    volume = frame['volume'].to_numpy()
+    direction = np.where(np.isin(actions, ['BUY', 'LONG']), 'LONG', 'SHORT')
+
+    open_code = symbol_codes[open_idx]
+    open_volume = volume[open_idx]
+    is_long = direction[open_idx] == 'LONG'
+    point_profit = np.where(is_long, price[close_idx] - price[open_idx], price[open_idx] - price[close_idx])
+    open_fee = open_fee_by_code[open_code] * open_volume
+    total_fee = open_fee + close_fee_by_code[open_code] * open_volume
+    # 实际盈亏 = 点数 * 合约规模 * 手数 - 总手续费
+    profit = (point_profit * size_by_code[open_code] * open_volume) - total_fee
+
+    round_trips = pd.DataFrame({
+        'open_signal_id': frame['id'].to_numpy()[open_idx],
+        'close_signal_id': frame['id'].to_numpy()[close_idx],
+        'symbol': np.asarray(symbols, dtype=object)[open_code],
+        'direction': direction[open_idx],
+        'open_time': frame['timestamp'].to_numpy()[open_idx],
+        'close_time': frame['timestamp'].to_numpy()[close_idx],
+        'open_time_ms': frame['timestamp_ms'].to_numpy()[open_idx],
+        'close_time_ms': frame['timestamp_ms'].to_numpy()[close_idx],
+        'open_price': price[open_idx],
+        'close_price': price[close_idx],
+        'volume': open_volume,
+        'point_profit': point_profit,
+        'fee': total_fee,
+        'profit': profit,
+    })
+    # 与逐笔重放一致, 按平仓发生的先后排列
+    round_trips = round_trips.iloc[np.argsort(close_idx, kind='stable')].reset_index(drop=True)
+
+    still_open = np.sort(still_open)
+    open_positions = pd.DataFrame({
+        'symbol': frame['symbol'].to_numpy()[still_open],
+        'direction': direction[still_open],
+        'signal_id': frame['id'].to_numpy()[still_open],
+        'price': price[still_open],
+        'open_time': frame['timestamp'].to_numpy()[still_open],
+        'open_time_ms': frame['timestamp_ms'].to_numpy()[still_open],
+        'volume': volume[still_open],
+        'open_fee': open_fee_by_code[symbol_codes[still_open]] * volume[still_open],
+    })
+    return round_trips, open_positions
+
+
+def summarize(round_trips: pd.DataFrame) -> pd.DataFrame:
+    """按品种汇总交易次数、胜率和盈亏, 末行为合计"""
+    columns = ['trades', 'wins', 'win_rate', 'point_profit', 'fee', 'profit']
+    if round_trips.empty:
+        return pd.DataFrame(columns=columns)
+    wins = round_trips['profit'] > 0
+    grouped = round_trips.assign(wins=wins).groupby('symbol', sort=True)
+    summary = pd.DataFrame({
+        'trades': grouped.size(),
+        'wins': grouped['wins'].sum(),
+        'point_profit': grouped['point_profit'].sum(),
+        'fee': grouped['fee'].sum(),
+        'profit': grouped['profit'].sum(),
+    })
+    summary.loc['TOTAL'] = [len(round_trips), int(wins.sum()), round_trips['point_profit'].sum(),
+                            round_trips['fee'].sum(), round_trips['profit'].sum()]
+    summary[['trades', 'wins']] = summary[['trades', 'wins']].astype(int)
+    summary['win_rate'] = summary['wins'] / summary['trades']
+    return summary[columns]
+
+
+def to_records(frame: pd.DataFrame, fields: Sequence[str] = ROUND_TRIP_FIELDS) -> Iterable[Dict]:
+    """转换为字典, 数值转为Python原生类型"""
+    for row in frame[list(fields)].itertuples(index=False):
+        yield {field: (value.item() if isinstance(value, np.generic) else value)
+               for field, value in zip(fields, row)}
+
+
+def load_filled_signals(c) -> pd.DataFrame:
+    """读取已成交信号, 顺序与账本重建一致"""
+    c.execute(f'''
+        SELECT {', '.join(FILL_FIELDS)}
+        FROM trading_signals
+        WHERE status = 'filled'
+        ORDER BY timestamp_ms ASC, id ASC
+    ''')
+    return pd.DataFrame(c.fetchall(), columns=FILL_FIELDS)
+
+
+def verify(fills: pd.DataFrame) -> bool:
+    """与逐笔重放结果逐字段比对"""
+    expected, expected_open = replay_fills(fills[FILL_FIELDS].itertuples(index=False, name=None))
+    round_trips, open_positions = compute_round_trips(fills)
+    actual = list(to_records(round_trips))
+    actual_open = list(to_records(open_positions, OPEN_POSITION_FIELDS))
+
+    if actual != expected:
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            if left != right:
+                logger.error(f"第 {index} 笔交易不一致: 逐笔={left} 向量化={right}")
+                break
+        else:
+            logger.error(f"交易笔数不一致: 逐笔={len(expected)} 向量化={len(actual)}")
+        return False
+    if sorted(actual_open, key=lambda p: p['signal_id']) != sorted(expected_open, key=lambda p: p['signal_id']):
+        logger.error("未平仓记录不一致")
+        return False
+    logger.info(f"校验通过: {len(actual)} 笔交易, {len(actual_open)} 笔未平仓")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量化盈亏计算')
+    parser.add_argument('command', choices=['report', 'verify'],
+                        help='report: 输出按品种汇总; verify: 与逐笔重放结果比对')
+    parser.add_argument('--input', help=f"CSV成交文件(列: {', '.join(FILL_FIELDS)}), 默认读取数据库")
+    parser.add_argument('--output', help='把每笔交易明细写入CSV')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.input:
+        fills = pd.read_csv(args.input)
+        for column in ('timestamp', 'timestamp_ms'):
+            if column not in fills:
+                fills[column] = None
+    else:
+        from database import get_database
+        with get_database(read_only=True).get_cursor() as c:
+            fills = load_filled_signals(c)
+
+    if args.command == 'verify':
+        raise SystemExit(0 if verify(fills) else 1)
+
+    round_trips, open_positions = compute_round_trips(fills)
+    if args.output:
+        round_trips.to_csv(args.output, index=False)
+    with pd.option_context('display.width', 200, 'display.max_rows', 500):
+        print(summarize(round_trips))
+    print(f"未平仓: {len(open_positions)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+import argparse
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import get_database
+from contract_registry import get_registry, product_code
+
+logger = logging.getLogger(__name__)
+
+# 手续费（按手数收费），未配置的品种按0计算；合约乘数取自合约注册表
+FEE_SPECS = {
+    # 上期所
+    'AO': {'open': 24.17, 'close': 23.99},   # 氧化铝
+    'RB': {'open': 3.35, 'close': 3.36},     # 螺纹钢
+    'BU': {'open': 1.67, 'close': 0.01},     # 沥青
+    'SP': {'open': 2.92, 'close': 0.01},     # 纸浆
+}
+
+NO_FEE = {'open': 0, 'close': 0}
+
+OPEN_ACTIONS = {'BUY': 'LONG', 'LONG': 'LONG', 'SELL': 'SHORT', 'SHORT': 'SHORT'}
+CLOSE_ACTIONS = {'CLOSE_LONG', 'CLOSE_SHORT', 'SELL_CLOSE', 'BUY_CLOSE'}
+
+# 成交明细(fills 表)字段: direction 为被开或被平的持仓方向 LONG/SHORT，offset 为 OPEN/CLOSE
+TRADE_COLUMNS = ('signal_id', 'symbol', 'direction', 'offset', 'price', 'volume',
+                 'timestamp', 'timestamp_ms')
+OPEN = 'OPEN'
+CLOSE = 'CLOSE'
+
+
+_unknown_symbols = set()
+
+
+def get_contract_spec(symbol: str) -> Dict:
+    """获取合约乘数和手续费，未配置手续费的品种按0计算
+
+    合约乘数取自合约注册表(含本地缓存)，合约本身不在表中时用同品种合约的乘数。
+    """
+    contract = get_registry().lookup(symbol)
+    if contract is None:
+        if symbol not in _unknown_symbols:
+            _unknown_symbols.add(symbol)
+            logger.warning(f"合约注册表中没有 {symbol} 及其品种，盈亏按合约乘数1计算")
+        return {'size': 1, 'fee': FEE_SPECS.get(product_code(symbol), NO_FEE)}
+    return {'size': contract.size, 'fee': FEE_SPECS.get(contract.product_code, NO_FEE)}
+
+
+def unresolved_symbols(symbols: Iterable[str]) -> List[str]:
+    """合约注册表中既没有该合约、也没有同品种合约的代码"""
+    registry = get_registry()
+    return sorted({symbol for symbol in symbols if registry.lookup(symbol) is None})
+
+
+def match_fill(open_position: Optional[Dict], fill: Dict) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """按信号的开平配对规则处理一笔已成交信号，供 pnl_engine 离线分析和校验使用
+
+    账本本身按实际成交维护，见 match_trade。
+
+    Returns:
+        (处理后的开仓记录, 新完成的一笔round trip)
+    """
+    spec = get_contract_spec(fill['symbol'])
+    action = fill['action'].upper()
+
+    if action in OPEN_ACTIONS:
+        if open_position is None:
+            open_position = {
+                'symbol': fill['symbol'],
+                'direction': OPEN_ACTIONS[action],
+                'signal_id': fill['id'],
+                'price': fill['price'],
+                'open_time': fill['timestamp'],
+                'open_time_ms': fill['timestamp_ms'],
+                'volume': fill['volume'],
+                'open_fee': spec['fee']['open'] * fill['volume'],
+            }
+        return open_position, None
+
+    if action in CLOSE_ACTIONS and open_position is not None:
+        if open_position['direction'] == 'LONG':
+            point_profit = fill['price'] - open_position['price']
+        else:
+            point_profit = open_position['price'] - fill['price']
+
+        close_fee = spec['fee']['close'] * open_position['volume']
+        total_fee = open_position['open_fee'] + close_fee
+        # 实际盈亏 = 点数 * 合约规模 * 手数 - 总手续费
+        profit = (point_profit * spec['size'] * open_position['volume']) - total_fee
+
+        round_trip = {
+            'open_signal_id': open_position['signal_id'],
+            'close_signal_id': fill['id'],
+            'symbol': fill['symbol'],
+            'direction': open_position['direction'],
+            'open_time': open_position['open_time'],
+            'close_time': fill['timestamp'],
+            'open_time_ms': open_position['open_time_ms'],
+            'close_time_ms': fill['timestamp_ms'],
+            'open_price': open_position['price'],
+            'close_price': fill['price'],
+            'volume': open_position['volume'],
+            'point_profit': point_profit,
+            'fee': total_fee,
+            'profit': profit,
+        }
+        return None, round_trip
+
+    return open_position, None
+
+
+def _fill_from_row(row) -> Dict:
+    return dict(zip(('id', 'symbol', 'action', 'price', 'timestamp', 'timestamp_ms', 'volume'), row))
+
+
+INSERT_ROUND_TRIP_SQL = '''
+    INSERT INTO round_trips (
+        open_signal_id, close_signal_id, symbol, direction, open_time, close_time,
+        open_time_ms, close_time_ms, open_price, close_price, volume, point_profit, fee, profit
+    ) VALUES (
+        :open_signal_id, :close_signal_id, :symbol, :direction, :open_time, :close_time,
+        :open_time_ms, :close_time_ms, :open_price, :close_price, :volume, :point_profit, :fee, :profit
+    )
+'''
+
+ROUND_TRIP_COLUMNS = ('open_signal_id', 'close_signal_id', 'symbol', 'direction', 'open_time',
+                      'close_time', 'open_time_ms', 'close_time_ms', 'open_price', 'close_price',
+                      'volume', 'point_profit', 'fee', 'profit')
+
+OPEN_POSITION_COLUMNS = ('symbol', 'direction', 'signal_id', 'price', 'open_time',
+                         'open_time_ms', 'volume', 'open_fee')
+
+
+def match_trade(open_position: Optional[Dict], fill: Dict) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """按实际成交价格和手数处理一笔成交
+
+    同方向的开仓成交按成交量加权合并为一笔持仓；平仓成交按手数平掉持仓的一部分，
+    开仓手续费按比例分摊。没有对应开仓的平仓(如程序外开的仓)不计入账本。
+
+    Returns:
+        (处理后的开仓记录, 这笔平仓对应的round trip)
+    """
+    spec = get_contract_spec(fill['symbol'])
+    volume = fill['volume']
+
+    if fill['offset'] == OPEN:
+        open_fee = spec['fee']['open'] * volume
+        if open_position is None:
+            return {
+                'symbol': fill['symbol'],
+                'direction': fill['direction'],
+                'signal_id': fill['signal_id'],
+                'price': fill['price'],
+                'open_time': fill['timestamp'],
+                'open_time_ms': fill['timestamp_ms'],
+                'volume': volume,
+                'open_fee': open_fee,
+            }, None
+        total = open_position['volume'] + volume
+        price = (open_position['price'] * open_position['volume'] + fill['price'] * volume) / total
+        return dict(open_position, price=price, volume=total,
+                    open_fee=open_position['open_fee'] + open_fee), None
+
+    if open_position is None:
+        return None, None
+
+    closed = min(volume, open_position['volume'])
+    open_fee = open_position['open_fee'] * closed / open_position['volume']
+    close_fee = spec['fee']['close'] * closed
+    if open_position['direction'] == 'LONG':
+        point_profit = fill['price'] - open_position['price']
+    else:
+        point_profit = open_position['price'] - fill['price']
+    # 实际盈亏 = 点数 * 合约规模 * 手数 - 总手续费
+    profit = point_profit * spec['size'] * closed - (open_fee + close_fee)
+
+    round_trip = {
+        'open_signal_id': open_position['signal_id'],
+        'close_signal_id': fill['signal_id'],
+        'symbol': fill['symbol'],
+        'direction': open_position['direction'],
+        'open_time': open_position['open_time'],
+        'close_time': fill['timestamp'],
+        'open_time_ms': open_position['open_time_ms'],
+        'close_time_ms': fill['timestamp_ms'],
+        'open_price': open_position['price'],
+        'close_price': fill['price'],
+        'volume': closed,
+        'point_profit': point_profit,
+        'fee': open_fee + close_fee,
+        'profit': profit,
+    }
+    remaining = open_position['volume'] - closed
+    if not remaining:
+        return None, round_trip
+    return dict(open_position, volume=remaining, open_fee=open_position['open_fee'] - open_fee), round_trip
+
+
+def merge_round_trip(previous: Optional[Dict], round_trip: Dict) -> Optional[Dict]:
+    """同一笔持仓被同一信号的多笔成交(部分成交、平昨和平今)平掉时合并为一笔交易
+
+    不能合并时返回None。
+    """
+    if (previous is None or previous['open_signal_id'] != round_trip['open_signal_id']
+            or previous['close_signal_id'] != round_trip['close_signal_id']):
+        return None
+    volume = previous['volume'] + round_trip['volume']
+
+    def weighted(field):
+        return (previous[field] * previous['volume'] + round_trip[field] * round_trip['volume']) / volume
+
+    return dict(previous,
+                close_time=round_trip['close_time'],
+                close_time_ms=round_trip['close_time_ms'],
+                close_price=weighted('close_price'),
+                volume=volume,
+                point_profit=weighted('point_profit'),
+                fee=previous['fee'] + round_trip['fee'],
+                profit=previous['profit'] + round_trip['profit'])
+
+
+def insert_fill(c, fill: Dict, trade_id: Optional[str] = None, order_id: Optional[str] = None) -> bool:
+    """记录一笔成交明细，网关重复推送的成交返回False"""
+    c.execute(f'''
+        INSERT OR IGNORE INTO fills (trade_id, order_id, {', '.join(TRADE_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' * len(TRADE_COLUMNS))})
+    ''', (trade_id, order_id) + tuple(fill[column] for column in TRADE_COLUMNS))
+    return c.rowcount == 1
+
+
+def apply_trades(c, fills: Iterable[Dict]) -> int:
+    """把新成交配对进账本，在调用方的事务内执行
+
+    Args:
+        c: 数据库游标
+        fills: 含TRADE_COLUMNS字段的成交
+
+    Returns:
+        新增的round trip数量
+    """
+    count = 0
+    for fill in fills:
+        key = (fill['symbol'], fill['direction'])
+        c.execute(f'''
+            SELECT {', '.join(OPEN_POSITION_COLUMNS)} FROM ledger_open_positions
+            WHERE symbol = ? AND direction = ?
+        ''', key)
+        found = c.fetchone()
+        open_position = dict(zip(OPEN_POSITION_COLUMNS, found)) if found else None
+
+        new_position, round_trip = match_trade(open_position, fill)
+        if round_trip:
+            c.execute(f'''
+                SELECT id, {', '.join(ROUND_TRIP_COLUMNS)} FROM round_trips
+                WHERE close_signal_id = ? AND open_signal_id = ? AND symbol = ? AND direction = ?
+                ORDER BY id DESC LIMIT 1
+            ''', (round_trip['close_signal_id'], round_trip['open_signal_id']) + key)
+            found = c.fetchone()
+            merged = merge_round_trip(dict(zip(ROUND_TRIP_COLUMNS, found[1:])) if found else None, round_trip)
+            if merged is not None:
+                c.execute(f'''
+                    UPDATE round_trips SET {', '.join(f'{column} = :{column}' for column in ROUND_TRIP_COLUMNS)}
+                    WHERE id = :id
+                ''', dict(merged, id=found[0]))
+            else:
+                c.execute(INSERT_ROUND_TRIP_SQL, round_trip)
+                count += 1
+        if new_position is None:
+            if open_position is not None:
+                c.execute('DELETE FROM ledger_open_positions WHERE symbol = ? AND direction = ?', key)
+        else:
+            c.execute(f'''
+                INSERT OR REPLACE INTO ledger_open_positions ({', '.join(OPEN_POSITION_COLUMNS)})
+                VALUES ({', '.join('?' * len(OPEN_POSITION_COLUMNS))})
+            ''', tuple(new_position[column] for column in OPEN_POSITION_COLUMNS))
+    return count
+
+
+def replay_trades(fills: Iterable[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """在内存中按到达顺序重放成交明细，返回(round trip列表, 未平仓列表)"""
+    open_positions: Dict[Tuple[str, str], Dict] = {}
+    last_round_trip: Dict[Tuple[str, str], int] = {}  # 持仓 -> 最近一笔round trip的下标
+    round_trips = []
+    for fill in fills:
+        key = (fill['symbol'], fill['direction'])
+        new_position, round_trip = match_trade(open_positions.get(key), fill)
+        if new_position is None:
+            open_positions.pop(key, None)
+        else:
+            open_positions[key] = new_position
+        if round_trip:
+            index = last_round_trip.get(key)
+            merged = merge_round_trip(round_trips[index] if index is not None else None, round_trip)
+            if merged is not None:
+                round_trips[index] = merged
+            else:
+                last_round_trip[key] = len(round_trips)
+                round_trips.append(round_trip)
+    return round_trips, list(open_positions.values())
+
+
+def replay_fills(rows: Iterable) -> Tuple[List[Dict], List[Dict]]:
+    """在内存中按信号的配对规则逐笔重放，返回(round trip列表, 未平仓列表)"""
+    open_positions = {}
+    round_trips = []
+    for row in rows:
+        fill = _fill_from_row(row)
+        new_position, round_trip = match_fill(open_positions.get(fill['symbol']), fill)
+        if new_position is None:
+            open_positions.pop(fill['symbol'], None)
+        else:
+            open_positions[fill['symbol']] = new_position
+        if round_trip:
+            round_trips.append(round_trip)
+    return round_trips, list(open_positions.values())
+
+
+def rebuild_ledger(c) -> int:
+    """清空账本并按到达顺序重放全部成交明细"""
+    c.execute(f"SELECT {', '.join(TRADE_COLUMNS)} FROM fills ORDER BY id")
+    fills = [dict(zip(TRADE_COLUMNS, row)) for row in c.fetchall()]
+    round_trips, open_positions = replay_trades(fills)
+    c.execute('DELETE FROM round_trips')
+    c.execute('DELETE FROM ledger_open_positions')
+    c.executemany(INSERT_ROUND_TRIP_SQL, round_trips)
+    c.executemany(f'''
+        INSERT INTO ledger_open_positions ({', '.join(OPEN_POSITION_COLUMNS)})
+        VALUES ({', '.join(':' + column for column in OPEN_POSITION_COLUMNS)})
+    ''', open_positions)
+    return len(round_trips)
+
+
+def ledger_specs_ready(c) -> bool:
+    """已成交的品种是否都能从合约注册表取得乘数，不能时重建的账本盈亏不可信"""
+    c.execute('SELECT DISTINCT symbol FROM fills')
+    missing = unresolved_symbols(row[0] for row in c.fetchall())
+    if missing:
+        logger.warning(f"合约注册表中缺少 {len(missing)} 个已成交品种: {', '.join(missing[:10])}")
+    return not missing
+
+
+def rebuild_if_empty(c) -> Optional[int]:
+    """账本为空而已有成交时重建，返回新增的交易笔数，无需重建时返回None
+
+    升级时若还没有合约缓存，迁移中会跳过重建；执行器完成合约查询后调用本函数补做。
+    """
+    c.execute('SELECT EXISTS (SELECT 1 FROM round_trips) OR EXISTS (SELECT 1 FROM ledger_open_positions)')
+    if c.fetchone()[0]:
+        return None
+    c.execute('SELECT EXISTS (SELECT 1 FROM fills)')
+    if not c.fetchone()[0]:
+        return None
+    return rebuild_ledger(c)
+
+
+def query_round_trips(c, start: Optional[int] = None, end: Optional[int] = None,
+                      symbol: Optional[str] = None) -> List[Dict]:
+    """按平仓时间和品种查询已完成的round trip"""
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append('close_time_ms >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('close_time_ms < ?')
+        params.append(end)
+    if symbol:
+        conditions.append('symbol = ?')
+        params.append(symbol)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    c.execute(f'''
+        SELECT open_signal_id, symbol, direction, open_time, close_time, open_price,
+               close_price, volume, point_profit, fee, profit
+        FROM round_trips
+        {where}
+        ORDER BY close_time_ms ASC, id ASC
+    ''', params)
+    return [{
+        'id': row[0],
+        'symbol': row[1],
+        'direction': row[2],
+        'openTime': row[3],
+        'closeTime': row[4],
+        'openPrice': row[5],
+        'closePrice': row[6],
+        'volume': row[7],
+        'pointProfit': round(row[8], 2),
+        'fee': round(row[9], 2),
+        'profit': round(row[10], 2)
+    } for row in c.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='盈亏账本维护')
+    parser.add_argument('command', choices=['rebuild'], help='rebuild: 按原始成交记录重建账本')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = get_database()
+    db.init_database()
+    if args.command == 'rebuild':
+        with db.get_cursor() as c:
+            c.execute('BEGIN IMMEDIATE')
+            count = rebuild_ledger(c)
+        logger.info(f"账本重建完成, 共 {count} 笔交易")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from ctpbee.constant import Direction, Offset
+
+logger = logging.getLogger(__name__)
+
+
+class PositionEntry:
+    """单个(品种, 方向)的持仓，分今仓和昨仓"""
+    __slots__ = ('symbol', 'direction', 'today', 'yd')
+
+    def __init__(self, symbol: str, direction: Direction):
+        self.symbol = symbol
+        self.direction = direction
+        self.today = 0
+        self.yd = 0
+
+    @property
+    def volume(self) -> int:
+        return self.today + self.yd
+
+    def __repr__(self):
+        return f"PositionEntry({self.symbol} {self.direction.value} 今:{self.today} 昨:{self.yd})"
+
+
+class PositionBook:
+    """按(品种, 方向)索引的实时持仓
+
+    由持仓回报(全量覆盖)和成交回报(增量)维护，下单路径上的查询都是字典查找，
+    不会像 app.center.positions 那样每次重新生成全部持仓对象。
+    持仓查询回报与成交回报可能交错到达，因此定期用网关的完整持仓做一次核对。
+    """
+    def __init__(self):
+        # 品种 -> 方向 -> 持仓，条目创建后只修改不删除
+        self._book: Dict[str, Dict[Direction, PositionEntry]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, direction: Direction) -> Optional[PositionEntry]:
+        directions = self._book.get(symbol)
+        if directions is None:
+            return None
+        return directions.get(direction)
+
+    def volume(self, symbol: str, direction: Direction) -> int:
+        entry = self.get(symbol, direction)
+        return entry.volume if entry is not None else 0
+
+    def positions(self) -> Iterable[PositionEntry]:
+        """所有持仓不为0的条目"""
+        with self._lock:
+            return [entry for directions in self._book.values()
+                    for entry in directions.values() if entry.volume]
+
+    def _entry(self, symbol: str, direction: Direction) -> PositionEntry:
+        directions = self._book.setdefault(symbol, {})
+        entry = directions.get(direction)
+        if entry is None:
+            entry = directions[direction] = PositionEntry(symbol, direction)
+        return entry
+
+    def on_position(self, position):
+        """持仓回报是该方向的完整持仓，直接覆盖"""
+        yd = int(position.yd_volume or 0)
+        with self._lock:
+            entry = self._entry(position.symbol, position.direction)
+            entry.yd = yd
+            entry.today = max(int(position.volume or 0) - yd, 0)
+
+    def on_trade(self, trade):
+        """按成交回报增量更新"""
+        volume = int(trade.volume)
+        with self._lock:
+            if trade.offset == Offset.OPEN:
+                self._entry(trade.symbol, trade.direction).today += volume
+                return
+
+            # 平仓成交的方向与被平持仓相反
+            direction = Direction.SHORT if trade.direction == Direction.LONG else Direction.LONG
+            entry = self._entry(trade.symbol, direction)
+            if trade.offset == Offset.CLOSETODAY:
+                entry.today = max(entry.today - volume, 0)
+            elif trade.offset == Offset.CLOSEYESTERDAY:
+                entry.yd = max(entry.yd - volume, 0)
+            else:
+                # 普通平仓先平昨仓
+                from_yd = min(entry.yd, volume)
+                entry.yd -= from_yd
+                entry.today = max(entry.today - (volume - from_yd), 0)
+
+    def snapshot(self) -> List[Dict]:
+        """导出持仓，用于下次启动时预热"""
+        return [{'symbol': entry.symbol, 'direction': entry.direction.value,
+                 'today': entry.today, 'yd': entry.yd} for entry in self.positions()]
+
+    def restore(self, records: Iterable[Dict]):
+        """载入上次运行的持仓，网关就绪后由 reconcile 校正"""
+        with self._lock:
+            for record in records:
+                entry = self._entry(record['symbol'], Direction(record['direction']))
+                entry.today = record['today']
+                entry.yd = record['yd']
+
+    def reconcile(self, positions) -> int:
+        """用网关的完整持仓核对，返回被修正的条目数"""
+        expected = {}
+        for position in positions:
+            yd = int(position.yd_volume or 0)
+            expected[(position.symbol, position.direction)] = (max(int(position.volume or 0) - yd, 0), yd)
+
+        corrected = 0
+        with self._lock:
+            for symbol, direction in expected:
+                self._entry(symbol, direction)
+            for symbol, directions in self._book.items():
+                for direction, entry in directions.items():
+                    today, yd = expected.get((symbol, direction), (0, 0))
+                    if (entry.today, entry.yd) != (today, yd):
+                        logger.warning(f"持仓核对不一致: {symbol} {direction.value} "
+                                       f"本地 今:{entry.today} 昨:{entry.yd} 网关 今:{today} 昨:{yd}")
+                        entry.today, entry.yd = today, yd
+                        corrected += 1
+        return corrected
@@ -0,0 +1,102 @@
+"""积压信号合并
+
+执行器断线或处理变慢时，同一品种可能积压多条来回开平的信号。这里按
+process_signal 的规则在模拟持仓上依次推演这些信号，得到最终的目标持仓，
+再用一条信号(必要时改写其strategy)一次到位，其余信号标记为superseded。
+"""
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUPERSEDED_STATUS = 'superseded'
+
+# 持仓状态: (多头手数, 空头手数)
+PositionState = Tuple[int, int]
+
+
+def apply_signal(state: PositionState, action: str, strategy: str, volume: int) -> PositionState:
+    """按 SignalMonitor.process_signal 的规则推演一条信号后的持仓"""
+    long_volume, short_volume = state
+    action = action.upper()
+    strategy = (strategy or '').upper()
+    if strategy == 'SHORT' and action == 'BUY':
+        short_volume = 0  # 平空
+    elif strategy == 'LONG' and action == 'SELL':
+        long_volume = 0   # 平多
+
+    # 同方向已有持仓时不再开仓
+    if action == 'BUY' and long_volume == 0:
+        long_volume = volume
+    elif action == 'SELL' and short_volume == 0:
+        short_volume = volume
+    return long_volume, short_volume
+
+
+def _replacement_strategies(action: str, strategy: str) -> List[str]:
+    """最后一条信号可改写成的strategy，优先保留原值"""
+    closing = 'SHORT' if action == 'BUY' else 'LONG'
+    candidates = [strategy, closing, 'FLAT']
+    return [candidate for index, candidate in enumerate(candidates) if candidate not in candidates[:index]]
+
+
+def coalesce_symbol(signals: List[Dict], state: PositionState):
+    """合并同一品种的积压信号
+
+    Args:
+        signals: 按时间顺序排列的待处理信号
+        state: 当前实际持仓
+
+    Returns:
+        (需要执行的信号列表, 被取代的信号列表)
+    """
+    if len(signals) < 2 or any(signal['action'].upper() not in ('BUY', 'SELL') for signal in signals):
+        return signals, []
+
+    target = state
+    for signal in signals:
+        target = apply_signal(target, signal['action'], signal['strategy'], signal['volume'])
+
+    if target == state:
+        # 来回开平后回到原持仓，无需下单
+        return [], signals
+
+    last = signals[-1]
+    action = last['action'].upper()
+    for strategy in _replacement_strategies(action, (last['strategy'] or '').upper()):
+        if apply_signal(state, action, strategy, last['volume']) == target:
+            if strategy != (last['strategy'] or '').upper():
+                last = dict(last, strategy=strategy)
+            return [last], signals[:-1]
+
+    # 目标持仓无法由单条信号达到(如同时持有多空)，按原顺序逐条执行
+    return signals, []
+
+
+def coalesce(signals: List[Dict], positions: Dict[str, PositionState]):
+    """按品种合并积压信号
+
+    Args:
+        signals: 按时间顺序排列的待处理信号，symbol 须已换成CTP合约代码
+        positions: CTP合约代码 -> 当前实际持仓(多头手数, 空头手数)
+
+    Returns:
+        (需要执行的信号列表(按时间顺序), [(被取代的信号, 取代它的信号ID或None)])
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for signal in signals:
+        groups.setdefault(signal['symbol'], []).append(signal)
+
+    effective = []
+    superseded = []
+    for symbol, group in groups.items():
+        kept, dropped = coalesce_symbol(group, positions.get(symbol, (0, 0)))
+        effective.extend(kept)
+        replaced_by = kept[-1]['id'] if kept else None
+        superseded.extend((signal, replaced_by) for signal in dropped)
+        if dropped:
+            logger.info(f"合并积压信号: {symbol} {len(group)} 条 -> {len(kept)} 条")
+
+    order = {signal['id']: index for index, signal in enumerate(signals)}
+    effective.sort(key=lambda signal: order[signal['id']])
+    return effective, superseded
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolStats:
+    """单个品种的排队统计"""
+    def __init__(self):
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, wait: float):
+        self.processed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.last_wait = wait
+
+
+class SymbolDispatcher:
+    """按品种分发交易信号
+
+    同一品种的信号进入各自的队列并严格按顺序执行，不同品种在线程池中并行。
+    每个任务只执行一条信号，执行完再把该品种重新排入线程池，
+    品种数多于线程数时各品种轮流执行，不会被单个品种的长队列占满。
+    队列按 key(signal) 区分，默认为信号中的合约代码；同一合约有多种写法时
+    由调用方传入归一化的 key，保证同一合约的信号进入同一队列。
+    """
+    def __init__(self, handler: Callable[[Dict], object], max_workers: int = 4,
+                 key: Optional[Callable[[Dict], str]] = None):
+        self.handler = handler
+        self.key = key or (lambda signal: signal['symbol'])
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='signal')
+        self._queues: Dict[str, Deque[Tuple[Dict, float]]] = {}
+        self._running: Set[str] = set()   # 已排入线程池的品种
+        self._pending_ids: Set[int] = set()  # 排队或执行中的信号
+        self._stats: Dict[str, SymbolStats] = {}
+        self._paused = False  # 暂停时信号只排队不执行
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, signal: Dict) -> bool:
+        """提交信号，已在排队或执行中的信号返回False"""
+        symbol = self.key(signal)
+        with self._lock:
+            if signal['id'] in self._pending_ids:
+                return False
+            self._pending_ids.add(signal['id'])
+            self._queues.setdefault(symbol, deque()).append((signal, time.monotonic()))
+            if symbol in self._running or self._paused:
+                return True
+            self._running.add(symbol)
+        self._executor.submit(self._run_next, symbol)
+        return True
+
+    def pause(self):
+        """暂停执行，之后提交的信号只排队"""
+        with self._lock:
+            self._paused = True
+
+    def resume(self):
+        """恢复执行，开始处理暂停期间排队的信号"""
+        with self._lock:
+            self._paused = False
+            symbols = [symbol for symbol in self._queues if symbol not in self._running]
+            self._running.update(symbols)
+        for symbol in symbols:
+            self._executor.submit(self._run_next, symbol)
+
+    def is_pending(self, signal_id: int) -> bool:
+        with self._lock:
+            return signal_id in self._pending_ids
+
+    def pending_ids(self) -> Set[int]:
+        """当前排队或执行中的信号ID快照"""
+        with self._lock:
+            return set(self._pending_ids)
+
+    def _run_next(self, symbol: str):
+        with self._lock:
+            signal, enqueued = self._queues[symbol].popleft()
+            wait = time.monotonic() - enqueued
+            self._stats.setdefault(symbol, SymbolStats()).record(wait)
+        try:
+            self.handler(signal)
+        except Exception as e:
+            logger.error(f"处理信号 {signal['id']} 失败: {str(e)}")
+            logger.exception("详细错误信息:")
+        finally:
+            with self._lock:
+                self._pending_ids.discard(signal['id'])
+                if self._queues[symbol] and not self._paused:
+                    resubmit = True
+                else:
+                    resubmit = False
+                    self._running.discard(symbol)
+                    del self._queues[symbol]
+                    if not self._running:
+                        self._idle.notify_all()
+            if resubmit:
+                self._executor.submit(self._run_next, symbol)
+
+    def stats(self) -> Dict[str, Dict]:
+        """各品种当前队列深度和排队等待时间(毫秒)"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for symbol in set(self._stats) | set(self._queues):
+                queue = self._queues.get(symbol, ())
+                stats = self._stats.get(symbol, SymbolStats())
+                result[symbol] = {
+                    'depth': len(queue),
+                    'oldest_wait_ms': round((now - queue[0][1]) * 1000, 1) if queue else 0,
+                    'processed': stats.processed,
+                    'avg_wait_ms': round(stats.total_wait / stats.processed * 1000, 1) if stats.processed else 0,
+                    'max_wait_ms': round(stats.max_wait * 1000, 1),
+                    'last_wait_ms': round(stats.last_wait * 1000, 1),
+                }
+            return result
+
+    def log_stats(self):
+        for symbol, stats in sorted(self.stats().items()):
+            logger.info(f"信号队列 {symbol}: 深度={stats['depth']} 已处理={stats['processed']} "
+                        f"平均等待={stats['avg_wait_ms']}ms 最大等待={stats['max_wait_ms']}ms")
+
+    def shutdown(self, wait: bool = True):
+        """停止线程池，wait为True时先执行完所有已排队的信号"""
+        if wait:
+            with self._lock:
+                while self._running:
+                    self._idle.wait()
+        self._executor.shutdown(wait=wait)
@@ -1,8 +1,11 @@
 import logging
 import json
+import threading
 import time
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from ctpbee import CtpBee
 from ctpbee.constant import (
     OrderRequest, 
@@ -11,59 +14,87 @@ from ctpbee.constant import (
     OrderType,
     Exchange
 )
-from database import DatabaseConnection
-from position_manager import PositionManager
+from database import get_database
+from contract_registry import get_registry, ContractSpec
 from market_data import MarketDataApi
+from signal_notifier import SignalListener
+from event_bus import prune_events
+import account_history
+import latency_tracer
+import sim_gateway
+from signal_coalescer import coalesce, SUPERSEDED_STATUS
+from signal_dispatcher import SymbolDispatcher
+from tick_recorder import TickRecorder, TICK_DIR
+from warm_snapshot import load_snapshot, save_snapshot
 
 logger = logging.getLogger(__name__)
 
+
+# 信号状态都交给写库线程，与回调中的委托登记、订单状态按提交顺序落库，
+# 不会被稍后才写入的 submitted 覆盖
+def _write_failed(signal_id: int, c):
+    c.execute('''
+        UPDATE trading_signals 
+        SET status = 'failed',
+            process_time = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (signal_id,))
+
+
+def _write_processed(signal_id: int, status: str, c):
+    c.execute('''
+        UPDATE trading_signals
+        SET processed = TRUE, 
+            process_time = CURRENT_TIMESTAMP,
+            status = ?
+        WHERE id = ?
+    ''', (status, signal_id))
+
+
 class SignalMonitor:
     def __init__(self):
+        self.started_at = time.perf_counter()
+        self.startup_phases: List[Tuple[str, float]] = []  # 启动各阶段耗时
+        self.ready = threading.Event()  # 接口登录完成且持仓已同步
+        self.gateway_started_at = None
         self.app = CtpBee("signal_trader", __name__, refresh=True)
         self.market_api = MarketDataApi("market", self.app)
         self.app.add_extension(self.market_api)
-        self.contract_specs = self.load_contract_specs()
+        self.contracts = get_registry()
         self.load_config()
-        self.db = DatabaseConnection()
-        self.position_manager = PositionManager(self.app)
+        self.db = get_database()
+        self.position_book = self.market_api.position_book
+        self.reconcile_interval = 30  # 持仓核对间隔（秒）
+        self.next_reconcile_time = 0.0  # 下次核对持仓的时间
         self.max_position = 2  # 添加最大持仓限制
+        # webhook随通知发来的接收、入库时间计入延迟统计
+        self.signal_listener = SignalListener(on_traces=self.market_api.latency.on_webhook)
+        self.catch_up_interval = 5  # 未收到通知时的补偿扫描间隔（秒）
+        # 是否合并同一品种的积压信号，默认关闭
+        self.coalesce_signals = self.config.get('COALESCE_SIGNALS', False)
+        # 同一合约顺序执行，不同合约并行；按CTP合约代码分队列，rb2505/RB2505、MA2505/MA505 同队
+        self.dispatcher = SymbolDispatcher(self.process_signal,
+                                           max_workers=self.config.get('SIGNAL_WORKERS', 4),
+                                           key=lambda signal: self.resolve_symbol(signal['symbol']))
+        self.startup_timeout = self.config.get('STARTUP_TIMEOUT', 300)  # 等待接口就绪的最长时间（秒）
+        # 每个合约保留的最近TICK条数
+        self.market_api.tick_buffers.capacity = self.config.get('TICK_BUFFER_SIZE', 4096)
+        # 录制TICK到本地文件，默认关闭
+        if self.config.get('RECORD_TICKS', False):
+            self.market_api.tick_recorder = TickRecorder(self.config.get('TICK_DIR', TICK_DIR))
+        # K线周期（分钟）
+        self.market_api.bar_aggregator.periods = self.config.get('BAR_PERIODS', [1, 5])
+        # 账户历史：采样间隔（秒）、原始采样保留（小时）、1分钟K线保留（天）
+        self.market_api.account_sampler.interval = self.config.get(
+            'ACCOUNT_SAMPLE_INTERVAL', account_history.DEFAULT_SAMPLE_INTERVAL)
+        self.account_raw_hours = self.config.get('ACCOUNT_RAW_HOURS', account_history.DEFAULT_RAW_HOURS)
+        self.account_minute_days = self.config.get('ACCOUNT_MINUTE_DAYS', account_history.DEFAULT_MINUTE_DAYS)
+        # 延迟统计：每日保留完整时间戳的最慢信号数、直方图保留天数
+        self.market_api.latency.slowest = self.config.get('LATENCY_SLOWEST', latency_tracer.DEFAULT_SLOWEST)
+        self.latency_retention_days = self.config.get('LATENCY_RETENTION_DAYS',
+                                                      latency_tracer.DEFAULT_RETENTION_DAYS)
+        self.startup_phases.append(('初始化', time.perf_counter() - self.started_at))
         
-    def load_contract_specs(self):
-        """加载合约规格"""
-        return {
-            # 中金所
-            'IF': {'size': 300, 'exchange': Exchange.CFFEX},   # 沪深300股指
-            'IC': {'size': 200, 'exchange': Exchange.CFFEX},   # 中证500股指
-            'IH': {'size': 300, 'exchange': Exchange.CFFEX},   # 上证50股指
-            'IM': {'size': 200, 'exchange': Exchange.CFFEX},   # 中证1000股指
-            
-            # 上期所
-            'FU': {'size': 10, 'exchange': Exchange.SHFE}, 
-            'AG': {'size': 15, 'exchange': Exchange.SHFE},     # 白银
-            'RU': {'size': 50, 'exchange': Exchange.SHFE},      # 橡胶
-            'AL': {'size': 5, 'exchange': Exchange.SHFE},      # 铝
-            'ZN': {'size': 5, 'exchange': Exchange.SHFE},      # 锌
-            'AO': {'size': 20, 'exchange': Exchange.SHFE},      # 氧化铝
-            'RB': {'size': 10, 'exchange': Exchange.SHFE},     # 螺纹钢
-            'BU': {'size': 10, 'exchange': Exchange.SHFE},     # 沥青
-            'SP': {'size': 20, 'exchange': Exchange.SHFE},     # 纸浆
-            'HC': {'size': 10, 'exchange': Exchange.SHFE},     # 热卷
-            
-            # 大商所
-            'M': {'size': 10, 'exchange': Exchange.DCE},       # 豆粕
-            'Y': {'size': 10, 'exchange': Exchange.DCE},       # 豆油
-            'C': {'size': 10, 'exchange': Exchange.DCE},       # 玉米
-            'I': {'size': 100, 'exchange': Exchange.DCE},      # 铁矿石
-            'PP': {'size': 5, 'exchange': Exchange.DCE},       # 聚丙烯
-            
-            # 郑商所
-            'SR': {'size': 10, 'exchange': Exchange.CZCE},     # 白糖
-            'MA': {'size': 10, 'exchange': Exchange.CZCE},     # 甲醇
-            'TA': {'size': 5, 'exchange': Exchange.CZCE},      # PTA
-            'AP': {'size': 10, 'exchange': Exchange.CZCE},     # 苹果
-            'CF': {'size': 5, 'exchange': Exchange.CZCE},      # 棉花
-        }
-    
     def load_config(self):
         """加载配置文件"""
         try:
@@ -95,71 +126,134 @@ class SignalMonitor:
                 
             # 只订阅尚未订阅的合约
             for symbol in symbols:
-                full_symbol = f"{symbol}.{self.get_contract_info(symbol)['exchange'].value}"
-                base_symbol = symbol.split('.')[0]  # 获取基础合约代码
+                contract = self.contracts.get(symbol)
+                if contract is None:
+                    logger.warning(f"合约注册表中没有 {symbol}，暂不订阅")
+                    continue
+                full_symbol = f"{contract.symbol}.{contract.exchange}"
                 
                 # 检查是否已经订阅
-                if base_symbol not in self.market_api.subscribed_symbols:
+                if contract.symbol not in self.market_api.subscribed_symbols:
                     self.app.subscribe(full_symbol)
                     logger.info(f"尝试订阅新合约: {full_symbol}")
                 
         except Exception as e:
             logger.error(f"订阅合约行情失败: {str(e)}")
             
+    @contextmanager
+    def startup_phase(self, name: str):
+        """记录启动阶段耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_phases.append((name, time.perf_counter() - started))
+            
     def setup(self):
-        """初始化交易系统"""
+        """初始化交易系统
+
+        启动接口后立即返回，不等待登录完成；接口就绪前信号照常校验并排队，
+        就绪后(on_gateway_ready)再开始下单。
+        """
         try:
-            self.app.config.from_mapping(self.config)
-            self.db.init_database()
+            with self.startup_phase('数据库'):
+                self.app.config.from_mapping(self.config)
+                self.db.init_database()
             
-            # 启动应用
-            self.app.start(log_output=True)
+            with self.startup_phase('载入快照'):
+                self.load_warm_snapshot()
             
-            # 等待行情接口初始化
-            wait_count = 0
-            while not self.market_api.inited and wait_count < 30:
-                time.sleep(10)
-                wait_count += 1
-                logger.info("等待行情接口初始化...")
-                
-            if not self.market_api.inited:
-                raise RuntimeError("行情接口初化超时")
-                
-            # 订阅合约行情
-            self.subscribe_contracts()
+            # 接口就绪前信号只排队不下单
+            self.dispatcher.pause()
+            self.market_api.add_listener('init', self.on_gateway_ready)
             
-            logger.info("交易系统启动成功")
+            # 启动应用
+            with self.startup_phase('启动接口'):
+                if self.config['INTERFACE'] == sim_gateway.INTERFACE_NAME:
+                    sim_gateway.register()
+                    logger.info("使用本地模拟网关")
+                self.app.start(log_output=True)
+            self.gateway_started_at = time.perf_counter()
+            logger.info("交易系统已启动，等待接口就绪")
         except Exception as e:
             logger.error(f"交易系统启动失败: {str(e)}")
             raise
             
-    def get_contract_info(self, symbol: str) -> Dict:
-        """获取合约信息"""
-        # 提取合约品种代码（去除月份）
-        product_code = ''.join(filter(str.isalpha, symbol.upper()))
+    def load_warm_snapshot(self):
+        """载入上次运行的合约和持仓，接口就绪前即可校验信号"""
+        snapshot = load_snapshot()
+        self.position_book.restore(snapshot.get('positions', []))
+        orders = self.market_api.orders.load_recent()
+        self.market_api.latency.load()
+        logger.info(f"预热完成: 合约 {len(self.contracts)} 个, "
+                    f"持仓 {len(snapshot.get('positions', []))} 条, 委托映射 {orders} 条")
+            
+    def save_warm_snapshot(self):
+        try:
+            save_snapshot({'positions': self.position_book.snapshot()})
+        except Exception as e:
+            logger.error(f"保存启动快照失败: {str(e)}")
+            
+    def on_gateway_ready(self, init: bool):
+        """接口登录完成: 同步持仓、订阅行情，然后开始执行排队的信号"""
+        if not init or self.ready.is_set():
+            return
+        self.startup_phases.append(('等待接口就绪', time.perf_counter() - self.gateway_started_at))
+        try:
+            with self.startup_phase('同步持仓'):
+                self.reconcile_on_ready()
+            
+            # 订阅合约行情
+            with self.startup_phase('订阅行情'):
+                self.subscribe_contracts()
+        finally:
+            self.ready.set()
+            self.dispatcher.resume()
         
-        if product_code in self.contract_specs:
-            contract_info = self.contract_specs[product_code].copy()
-            contract_info['product_code'] = product_code
-            return contract_info
-        else:
-            logger.warning(f"未找到合约 {symbol} 的规格信息，使用默认值")
-            return {
-                'size': 10, 
-                'exchange': Exchange.SHFE,
-                'product_code': product_code
-            }
+        self.save_warm_snapshot()
+        self.log_startup_report()
+        logger.info("交易系统启动成功")
+            
+    def reconcile_on_ready(self):
+        """就绪时用网关持仓核对预热的持仓
+
+        尚未收到持仓回报或回报仍在陆续到达，或网关持仓为空而本地有持仓时跳过，
+        避免不完整的网关视图清掉预热持仓；由一个核对周期后的定时核对修正。
+        """
+        # 首次核对放在一个周期之后，届时持仓查询已经返回
+        self.next_reconcile_time = time.time() + self.reconcile_interval
+        # 先判断回报是否已停止，再取网关持仓
+        settled = self.market_api.positions_settled()
+        positions = list(self.app.center.positions)
+        has_local = bool(self.position_book.positions())
+        if not settled or (not positions and has_local):
+            logger.warning(f"网关持仓尚未返回，暂不核对预热持仓，{self.reconcile_interval}秒后再核对")
+            return
+        self.position_book.reconcile(positions)
+            
+    def log_startup_report(self):
+        total = time.perf_counter() - self.started_at
+        phases = ' '.join(f"{name}={elapsed:.3f}s" for name, elapsed in self.startup_phases)
+        logger.info(f"启动耗时 {total:.3f}s: {phases}")
+            
+    def resolve_symbol(self, symbol: str) -> str:
+        """信号中的合约代码转换为CTP合约代码(大小写、郑商所年份)，未知合约原样返回"""
+        contract = self.contracts.get(symbol)
+        return contract.symbol if contract is not None else symbol
         
     def generate_order_id(self) -> str:
         """生成唯一的订单ID"""
         return f"ORDER_{int(time.time()*1000)}_{int(time.perf_counter()*1000000)}"
 
     def create_order_request(self, symbol: str, price: float, volume: int, direction: str, 
-                             force_offset: Optional[Offset] = None) -> Tuple[OrderRequest, Dict]:
+                             force_offset: Optional[Offset] = None) -> Tuple[OrderRequest, ContractSpec]:
         """创建标准化的下单请求"""
         try:
             # 获取合约信息
-            contract_info = self.get_contract_info(symbol)
+            contract = self.contracts.get(symbol)
+            if contract is None:
+                raise ValueError(f"未知合约: {symbol}")
+            symbol = contract.symbol
             
             # 扩展方向和开平映射
             if direction == 'BUY':  # 开多
@@ -171,20 +265,18 @@ class SignalMonitor:
             elif direction in ['BUY_CLOSE', 'SELL_CLOSE']:  # 平仓
                 order_direction = Direction.SHORT if direction == 'SELL_CLOSE' else Direction.LONG
                 # 获取持仓信息来决定平仓方式
-                positions = self.app.center.positions
-                for pos in positions:
-                    if pos.symbol == symbol and (
-                        (direction == 'SELL_CLOSE' and pos.direction == Direction.LONG) or
-                        (direction == 'BUY_CLOSE' and pos.direction == Direction.SHORT)
-                    ):
-                        # 如果有昨仓，优先平昨
-                        if pos.yd_volume > 0:
-                            order_offset = Offset.CLOSEYESTERDAY
-                            logger.info(f"使用平昨仓: {symbol} 昨仓数量:{pos.yd_volume}")
-                        else:
-                            order_offset = Offset.CLOSETODAY
-                            logger.info(f"使用平今仓: {symbol} 今仓数量:{pos.volume}")
-                        break
+                pos = self.position_book.get(
+                    symbol, Direction.LONG if direction == 'SELL_CLOSE' else Direction.SHORT)
+                if force_offset is not None:
+                    order_offset = force_offset
+                elif pos is not None and pos.volume > 0:
+                    # 如果有昨仓，优先平昨
+                    if pos.yd > 0:
+                        order_offset = Offset.CLOSEYESTERDAY
+                        logger.info(f"使用平昨仓: {symbol} 昨仓数量:{pos.yd}")
+                    else:
+                        order_offset = Offset.CLOSETODAY
+                        logger.info(f"使用平今仓: {symbol} 今仓数量:{pos.today}")
                 else:
                     # 如果没找到对应持仓，使用普通平仓
                     order_offset = Offset.CLOSE
@@ -195,7 +287,7 @@ class SignalMonitor:
             # 创建订单请求
             order_req = OrderRequest(
                 symbol=symbol,
-                exchange=contract_info['exchange'],
+                exchange=Exchange(contract.exchange),
                 price=price,
                 volume=volume,
                 direction=order_direction,
@@ -204,7 +296,7 @@ class SignalMonitor:
                 order_id=self.generate_order_id()
             )
             logger.info(f"创建订单请求: {order_req}")
-            return order_req, contract_info
+            return order_req, contract
             
         except Exception as e:
             logger.error(f"创建订单请求失败: {str(e)}")
@@ -217,12 +309,14 @@ class SignalMonitor:
             use_price = price
             
             # 创建下单请求和获取合约信息，传入强制开平标志
-            order_req, contract_info = self.create_order_request(
+            order_req, contract = self.create_order_request(
                 symbol, use_price, volume, direction, force_offset
             )
+            self.market_api.latency.stamp(signal_id, 'order_request')
             
             # 发送订单并获取结果
             order_result = self.app.send_order(order_req)
+            self.market_api.latency.stamp(signal_id, 'sent')
             # logger.info(f"订单发送结果: {order_result}")
             
             # 判断订单是否成功
@@ -239,28 +333,16 @@ class SignalMonitor:
             
             if success:
                 logger.info(f"订单发送成功: {direction} {symbol} 价格:{use_price} 数量:{volume} "
-                          f"订单ID:{order_id} 合约乘数:{contract_info['size']}")
+                          f"订单ID:{order_id} 合约乘数:{contract.size}")
                 
-                # 更新数据库中的订单状态
-                with self.db.get_cursor() as c:
-                    c.execute('''
-                        UPDATE trading_signals 
-                        SET order_id = ?, status = 'submitted'
-                        WHERE id = ?
-                    ''', (order_id, signal_id))
+                # 登记委托映射并更新信号状态，订单回报按网关订单号找到信号
+                self.market_api.register_order(order_req.order_id, signal_id, order_id, symbol)
                 
-                # 只有在订单真正成功时才更新持仓信息
-                self.position_manager.update_position(symbol, direction, volume)
+                # 持仓在成交回报到达时更新，这里不再预先计入
                 return True
             else:
                 # 更新数据库中的订单状态为失败
-                with self.db.get_cursor() as c:
-                    c.execute('''
-                        UPDATE trading_signals 
-                        SET status = 'failed',
-                            process_time = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (signal_id,))
+                self.market_api.writer.submit(partial(_write_failed, signal_id))
                 return False
                 
         except Exception as e:
@@ -274,7 +356,7 @@ class SignalMonitor:
     def process_signal(self, signal):
         """处理交易信号"""
         try:
-            symbol = signal['symbol']
+            symbol = self.resolve_symbol(signal['symbol'])
             action = signal['action'].upper()
             strategy = signal['strategy']
             price = float(signal['price'])
@@ -285,81 +367,67 @@ class SignalMonitor:
                 # 只平空
                 close_action = 'BUY_CLOSE'
                 close_success = True
-                positions = self.app.center.positions
-                for pos in positions:
-                    if pos.symbol == symbol and pos.direction == Direction.SHORT:
-                        if pos.yd_volume > 0:
-                            logger.info(f"平昨仓: {symbol} {close_action} 数量:{pos.yd_volume}")
-                            close_success &= self.execute_order(
-                                symbol=symbol,
-                                price=price,
-                                volume=pos.yd_volume,
-                                direction=close_action,
-                                signal_id=signal_id,
-                                force_offset=Offset.CLOSEYESTERDAY
-                            )
+                pos = self.position_book.get(symbol, Direction.SHORT)
+                if pos is not None:
+                    # 先读出手数，下单后成交回报会更新持仓
+                    yd_volume, today_volume = pos.yd, pos.today
+                    if yd_volume > 0:
+                        logger.info(f"平昨仓: {symbol} {close_action} 数量:{yd_volume}")
+                        close_success &= self.execute_order(
+                            symbol=symbol,
+                            price=price,
+                            volume=yd_volume,
+                            direction=close_action,
+                            signal_id=signal_id,
+                            force_offset=Offset.CLOSEYESTERDAY
+                        )
 
-                        today_volume = pos.volume - pos.yd_volume
-                        if today_volume > 0:
-                            logger.info(f"平今仓: {symbol} {close_action} 数量:{today_volume}")
-                            close_success &= self.execute_order(
-                                symbol=symbol,
-                                price=price,
-                                volume=today_volume,
-                                direction=close_action,
-                                signal_id=signal_id,
-                                force_offset=Offset.CLOSETODAY
-                            )
+                    if today_volume > 0:
+                        logger.info(f"平今仓: {symbol} {close_action} 数量:{today_volume}")
+                        close_success &= self.execute_order(
+                            symbol=symbol,
+                            price=price,
+                            volume=today_volume,
+                            direction=close_action,
+                            signal_id=signal_id,
+                            force_offset=Offset.CLOSETODAY
+                        )
 
                 status = 'processed' if close_success else 'failed'
-                with self.db.get_cursor() as c:
-                    c.execute('''
-                        UPDATE trading_signals
-                        SET processed = TRUE, 
-                            process_time = CURRENT_TIMESTAMP,
-                            status = ?
-                        WHERE id = ?
-                    ''', (status, signal_id,))
+                self.market_api.writer.submit(partial(_write_processed, signal_id, status))
 
             elif strategy.upper() == 'LONG' and action == 'SELL':
                 # 只平多
                 close_action = 'SELL_CLOSE'
                 close_success = True
-                positions = self.app.center.positions
-                for pos in positions:
-                    if pos.symbol == symbol and pos.direction == Direction.LONG:
-                        if pos.yd_volume > 0:
-                            logger.info(f"平昨仓: {symbol} {close_action} 数量:{pos.yd_volume}")
-                            close_success &= self.execute_order(
-                                symbol=symbol,
-                                price=price,
-                                volume=pos.yd_volume,
-                                direction=close_action,
-                                signal_id=signal_id,
-                                force_offset=Offset.CLOSEYESTERDAY
-                            )
+                pos = self.position_book.get(symbol, Direction.LONG)
+                if pos is not None:
+                    # 先读出手数，下单后成交回报会更新持仓
+                    yd_volume, today_volume = pos.yd, pos.today
+                    if yd_volume > 0:
+                        logger.info(f"平昨仓: {symbol} {close_action} 数量:{yd_volume}")
+                        close_success &= self.execute_order(
+                            symbol=symbol,
+                            price=price,
+                            volume=yd_volume,
+                            direction=close_action,
+                            signal_id=signal_id,
+                            force_offset=Offset.CLOSEYESTERDAY
+                        )
 
-                        today_volume = pos.volume - pos.yd_volume
-                        if today_volume > 0:
-                            logger.info(f"平今仓: {symbol} {close_action} 数量:{today_volume}")
-                            close_success &= self.execute_order(
-                                symbol=symbol,
-                                price=price,
-                                volume=today_volume,
-                                direction=close_action,
-                                signal_id=signal_id,
-                                force_offset=Offset.CLOSETODAY
-                            )
+                    if today_volume > 0:
+                        logger.info(f"平今仓: {symbol} {close_action} 数量:{today_volume}")
+                        close_success &= self.execute_order(
+                            symbol=symbol,
+                            price=price,
+                            volume=today_volume,
+                            direction=close_action,
+                            signal_id=signal_id,
+                            force_offset=Offset.CLOSETODAY
+                        )
 
                 status = 'processed' if close_success else 'failed'
-                with self.db.get_cursor() as c:
-                    c.execute('''
-                        UPDATE trading_signals
-                        SET processed = TRUE, 
-                            process_time = CURRENT_TIMESTAMP,
-                            status = ?
-                        WHERE id = ?
-                    ''', (status, signal_id,))
+                self.market_api.writer.submit(partial(_write_processed, signal_id, status))
 
 
             # 开仓操作
@@ -367,12 +435,8 @@ class SignalMonitor:
                 raise ValueError(f"无效的交易动作: {action}")
             
             # 检查当前持仓
-            current_position = 0
-            for pos in self.app.center.positions:
-                if pos.symbol == symbol:
-                    if ((action == 'BUY' and pos.direction == Direction.LONG) or
-                        (action == 'SELL' and pos.direction == Direction.SHORT)):
-                        current_position += pos.volume
+            current_position = self.position_book.volume(
+                symbol, Direction.LONG if action == 'BUY' else Direction.SHORT)
                         
             if current_position > 0:
                 logger.warning(f"当前已有持仓，跳过开仓: {symbol} {action}")
@@ -384,46 +448,161 @@ class SignalMonitor:
             logger.error(f"处理信号失败: {str(e)}")
             return False
 
+    def current_positions(self) -> Dict[str, Tuple[int, int]]:
+        """当前实际持仓: 品种 -> (多头手数, 空头手数)"""
+        positions = {}
+        for pos in self.position_book.positions():
+            long_volume, short_volume = positions.get(pos.symbol, (0, 0))
+            if pos.direction == Direction.LONG:
+                long_volume += pos.volume
+            else:
+                short_volume += pos.volume
+            positions[pos.symbol] = (long_volume, short_volume)
+        return positions
+
+    def coalesce_pending(self, signals):
+        """合并积压信号，被取代的信号标记为superseded，返回需要执行的信号"""
+        # 按CTP合约代码分组，与 current_positions 的键一致，同一合约的不同写法合并推演
+        resolved = [dict(signal, symbol=self.resolve_symbol(signal['symbol'])) for signal in signals]
+        effective, superseded = coalesce(resolved, self.current_positions())
+        if superseded:
+            rows = [(SUPERSEDED_STATUS,
+                     f"合并到信号 {replaced_by}" if replaced_by else "积压信号相互抵消",
+                     signal['id'])
+                    for signal, replaced_by in superseded]
+            self.market_api.writer.submit(lambda c: c.executemany('''
+                UPDATE trading_signals
+                SET processed = TRUE,
+                    process_time = CURRENT_TIMESTAMP,
+                    status = ?,
+                    message = ?
+                WHERE id = ? AND status = 'pending'
+            ''', rows))
+        for signal in effective:
+            original = next((s for s in signals if s['id'] == signal['id']), signal)
+            if signal['strategy'] != original['strategy']:
+                logger.info(f"合并后改写信号 {signal['id']} 的strategy: "
+                            f"{original['strategy']} -> {signal['strategy']}")
+        return effective
+
+    def reject_unknown_contracts(self, signals):
+        """合约注册表中不存在的信号直接标记失败，注册表为空(首次启动)时不校验"""
+        if not len(self.contracts):
+            return signals
+        unknown = [signal for signal in signals if self.contracts.get(signal['symbol']) is None]
+        if not unknown:
+            return signals
+        rows = [(f"未知合约: {signal['symbol']}", signal['id']) for signal in unknown]
+        self.market_api.writer.submit(lambda c: c.executemany('''
+            UPDATE trading_signals
+            SET processed = TRUE,
+                process_time = CURRENT_TIMESTAMP,
+                status = 'failed',
+                message = ?
+            WHERE id = ?
+        ''', rows))
+        for signal in unknown:
+            logger.warning(f"未知合约，信号 {signal['id']} 标记为失败: {signal['symbol']}")
+        return [signal for signal in signals if self.contracts.get(signal['symbol']) is not None]
+
+    def shutdown(self):
+        """执行完已排队的信号，写入回调中尚未落库的数据"""
+        logger.info("交易执行器退出")
+        self.signal_listener.stop()
+        self.dispatcher.shutdown(wait=True)
+        self.market_api.bar_aggregator.stop()
+        self.market_api.latency.flush()
+        self.market_api.writer.stop()
+        recorder = self.market_api.tick_recorder
+        if recorder is not None:
+            # 先摘下录制器，仍在到达的TICK不再写入，再关闭文件
+            self.market_api.tick_recorder = None
+            recorder.close()
+        self.save_warm_snapshot()
+
     def monitor_signals(self):
         """监控交易信号"""
         logger.info("开始监控交易信号")
+        self.signal_listener.start()
         last_subscribe_time = 0
         subscribe_interval = 60  # 订阅检查间隔（秒）
+        last_prune_time = 0
+        prune_interval = 3600  # 推送事件表清理间隔（秒）
         
         while True:
+            if (not self.ready.is_set() and self.gateway_started_at is not None
+                    and time.perf_counter() - self.gateway_started_at > self.startup_timeout):
+                raise RuntimeError("行情接口初化超时")
+            
             try:
                 current_time = time.time()
-                if current_time - last_subscribe_time >= subscribe_interval:
+                if self.ready.is_set() and current_time - last_subscribe_time >= subscribe_interval:
                     self.subscribe_contracts()
+                    self.dispatcher.log_stats()
+                    self.market_api.writer.log_stats()
+                    self.market_api.latency.expire()
+                    self.market_api.latency.flush()
                     last_subscribe_time = current_time
+                
+                if self.ready.is_set() and current_time >= self.next_reconcile_time:
+                    # 用网关的完整持仓核对本地持仓
+                    self.position_book.reconcile(self.app.center.positions)
+                    self.save_warm_snapshot()
+                    self.next_reconcile_time = current_time + self.reconcile_interval
+                
+                if current_time - last_prune_time >= prune_interval:
+                    with self.db.get_cursor() as c:
+                        pruned = prune_events(c)
+                    if pruned:
+                        logger.info(f"清理推送事件 {pruned} 条")
+                    with self.db.get_cursor() as c:
+                        rolled = account_history.rollup(c, self.account_raw_hours, self.account_minute_days)
+                    if any(rolled.values()):
+                        logger.info(f"账户历史汇总: 采样 {rolled['raw']} 条, 1分钟K线 {rolled['1m']} 条")
+                    self.market_api.orders.prune()
+                    self.market_api.latency.prune(self.latency_retention_days)
+                    last_prune_time = current_time
 
                 # 处理交易信号
+                # 先记下排队或执行中的信号，再等回调中的写库完成后查询：
+                # 查询前执行完的信号状态已落库，查询期间执行完的信号在快照中，都不会重复提交
+                dispatched = self.dispatcher.pending_ids()
+                self.market_api.writer.flush()
                 with self.db.get_cursor() as c:
                     # 只获取未处理且未提交的信号
                     c.execute('''
                         SELECT id, symbol, action, price, timestamp, 
                                volume, strategy, processed, status
                         FROM trading_signals
-                        WHERE processed = FALSE 
+                        WHERE processed = 0 
                         AND status = 'pending'
-                        ORDER BY timestamp ASC
+                        ORDER BY timestamp_ms ASC
                     ''')
-                    
-                    signals = c.fetchall()
-                    for signal in signals:
-                        signal_dict = {
-                            'id': signal[0],
-                            'symbol': signal[1],
-                            'action': signal[2],
-                            'price': signal[3],
-                            'timestamp': signal[4],
-                            'volume': signal[5] if signal[5] is not None else 1,
-                            'strategy': signal[6],
-                            'status': signal[8]
-                        }
-                        self.process_signal(signal_dict)
+                    signals = [{
+                        'id': signal[0],
+                        'symbol': signal[1],
+                        'action': signal[2],
+                        'price': signal[3],
+                        'timestamp': signal[4],
+                        'volume': signal[5] if signal[5] is not None else 1,
+                        'strategy': signal[6],
+                        'status': signal[8]
+                    } for signal in c.fetchall()]
+                
+                # 已在排队或执行中的信号状态尚未更新，跳过
+                signals = [signal for signal in signals
+                           if signal['id'] not in dispatched and not self.dispatcher.is_pending(signal['id'])]
+                signals = self.reject_unknown_contracts(signals)
+                # 合并依赖实际持仓，接口就绪后才进行
+                if self.coalesce_signals and self.ready.is_set() and len(signals) > 1:
+                    signals = self.coalesce_pending(signals)
+                for signal_dict in signals:
+                    self.market_api.latency.stamp(signal_dict['id'], 'picked',
+                                                  symbol=self.resolve_symbol(signal_dict['symbol']))
+                    self.dispatcher.submit(signal_dict)
                         
-                time.sleep(1)
+                # 等待webhook通知, 超时则做一次补偿扫描
+                self.signal_listener.wait(self.catch_up_interval)
                 
             except Exception as e:
                 logger.error(f"信号监控出错: {str(e)}")
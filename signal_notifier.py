@@ -0,0 +1,126 @@
+import os
+import socket
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# webhook 与交易执行器约定的本地套接字路径
+SIGNAL_SOCKET_PATH = os.environ.get('SIGNAL_SOCKET_PATH', '/tmp/tradingview_ctp_signal.sock')
+# 单条通知最多附带的时间戳组数, 控制报文在64KB以内
+MAX_TRACE_RANGES = 500
+MAX_MESSAGE_SIZE = 65536
+
+
+def notify_signal(signal_id=None, path: str = SIGNAL_SOCKET_PATH, traces=None) -> bool:
+    """通知交易执行器有新信号入库
+
+    只是唤醒信号, 信号本身仍以数据库记录为准。执行器未运行或缓冲区已满时
+    直接返回False, 执行器会在下一次补偿扫描中取到该信号。
+
+    traces 为 [(首个信号ID, 最后信号ID, 接收时间, 提交时间)], 时间为 time.monotonic_ns(),
+    随通知一起发给执行器用于延迟统计。
+    """
+    message = str(signal_id if signal_id is not None else '')
+    if traces:
+        message += ''.join(f";{first},{last},{received},{committed}"
+                           for first, last, received, committed in traces[:MAX_TRACE_RANGES])
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.sendto(message.encode(), path)
+        return True
+    except OSError:
+        return False
+
+
+def parse_traces(message: bytes):
+    """解析通知中附带的时间戳, 格式不对的部分忽略"""
+    traces = []
+    for part in message.decode(errors='ignore').split(';')[1:]:
+        try:
+            first, last, received, committed = (int(value) for value in part.split(','))
+        except ValueError:
+            continue
+        traces.append((first, last, received, committed))
+    return traces
+
+
+class SignalListener:
+    """信号唤醒监听器（交易执行器端）"""
+    def __init__(self, path: str = SIGNAL_SOCKET_PATH, retry_interval: float = 1.0, on_traces=None):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.on_traces = on_traces  # 收到webhook时间戳的回调, 参数同 parse_traces 的每一项
+        self._event = threading.Event()
+        self._sock = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """启动监听线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='signal-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听并清理套接字文件"""
+        self._running = False
+        self._close()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def wait(self, timeout: float) -> bool:
+        """等待新信号通知, 超时返回False
+
+        返回后立即清除标志, 之后到达的通知会让下一次等待立即返回。
+        """
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+    def _bind(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 清理上次异常退出残留的套接字
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.settimeout(1.0)
+        self._sock = sock
+        logger.info(f"信号通知通道已就绪: {self.path}")
+        # 通道(重新)建立期间可能漏掉通知, 触发一次补偿扫描
+        self._event.set()
+
+    def _close(self):
+        sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        try:
+            sock.close()
+        finally:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _run(self):
+        while self._running:
+            try:
+                if self._sock is None:
+                    self._bind()
+                message = self._sock.recv(MAX_MESSAGE_SIZE)
+                self._event.set()
+                if self.on_traces is not None:
+                    for trace in parse_traces(message):
+                        self.on_traces(*trace)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self._running:
+                    break
+                logger.error(f"信号通知通道异常, 准备重建: {str(e)}")
+                self._close()
+                time.sleep(self.retry_interval)
@@ -0,0 +1,664 @@
+"""本地模拟网关
+
+配置文件中 "INTERFACE": "sim" 时，CtpBee 加载本模块的行情/交易接口代替CTP，
+不需要连接SimNow即可在本机跑通 webhook -> 下单 -> 成交 的完整流程，用于压测和回归。
+
+行情来自 tick_recorder 录制的文件(指定交易日回放)，或按随机游走生成；
+限价单在接受延迟之后与每条TICK的对手价撮合，可成交数量不超过对手盘挂单量，
+因此会出现部分成交；成交后更新持仓和资金，并像CTP一样推送委托、成交、持仓、账户回报。
+
+模拟参数写在 CONNECT_INFO 中(均可选):
+    sim_trading_day   回放的交易日，如 "20250103"；不填则生成随机行情
+    sim_tick_dir      录制目录，默认 ticks
+    sim_symbols       合约列表；回放时默认为该交易日录制的全部合约
+    sim_speed         回放速度倍数，默认1(按原始时间间隔)，0为不等待
+    sim_tick_interval 随机行情的TICK间隔(秒)，默认0.5
+    sim_prices        随机行情的起始价格，{合约: 价格}，默认3000
+    sim_latency_ms    委托/撤单的接受延迟(毫秒)，默认10
+    sim_max_fill      每条TICK单笔委托最多成交的手数，0为只受对手盘挂单量限制
+    sim_balance       初始资金，默认1000000
+    sim_margin_ratio  保证金比例，默认0.1
+    sim_seed          随机行情的种子
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import ctpbee.signals
+from ctpbee.constant import (
+    AccountData,
+    CancelRequest,
+    ContractData,
+    Direction,
+    Event,
+    Exchange,
+    Offset,
+    OrderData,
+    OrderRequest,
+    PositionData,
+    Product,
+    Status,
+    TickData,
+    TradeData,
+    EVENT_ACCOUNT,
+    EVENT_CONTRACT,
+    EVENT_INIT_FINISHED,
+    EVENT_LOG,
+    EVENT_ORDER,
+    EVENT_POSITION,
+    EVENT_TICK,
+    EVENT_TRADE,
+)
+from ctpbee.interface import Interface
+
+from contract_registry import ContractSpec, get_registry
+from tick_recorder import TICK_DIR, TickReader, list_symbols
+
+logger = logging.getLogger(__name__)
+
+INTERFACE_NAME = 'sim'
+GATEWAY_NAME = 'sim'
+FRONT_ID = 1
+SESSION_ID = 1
+
+DEFAULT_EXCHANGE = 'SHFE'
+DEFAULT_PRICE = 3000
+DEFAULT_SIZE = 10
+DEFAULT_PRICETICK = 1
+
+_registered = False
+_exchanges: Dict[int, 'SimExchange'] = {}
+_exchanges_lock = threading.Lock()
+
+
+def register():
+    """把 sim 加入 ctpbee 的接口表，其余接口仍由原来的 load_interface 加载"""
+    global _registered
+    if _registered:
+        return
+    original = Interface.load_interface
+
+    def load_interface(cls, interface):
+        if interface == INTERFACE_NAME:
+            return SimMdApi, SimTdApi
+        return original(interface)
+
+    Interface.load_interface = classmethod(load_interface)
+    _registered = True
+
+
+def get_exchange(app_signal) -> 'SimExchange':
+    """同一个 CtpBee 的行情和交易接口共用一个模拟交易所"""
+    with _exchanges_lock:
+        exchange = _exchanges.get(id(app_signal))
+        if exchange is None:
+            exchange = _exchanges[id(app_signal)] = SimExchange()
+        return exchange
+
+
+class SimOrder:
+    __slots__ = ('order_id', 'symbol', 'exchange', 'direction', 'offset', 'price', 'volume',
+                 'traded', 'status', 'accepted', 'time')
+
+    def __init__(self, order_id: str, req: OrderRequest):
+        self.order_id = order_id
+        self.symbol = req.symbol
+        self.exchange = req.exchange
+        self.direction = req.direction
+        self.offset = req.offset
+        self.price = req.price
+        self.volume = int(req.volume)
+        self.traded = 0
+        self.status = Status.SUBMITTING
+        self.accepted = False  # 经过接受延迟后才参与撮合
+        self.time = datetime.now().strftime('%H:%M:%S')
+
+    @property
+    def remaining(self) -> int:
+        return self.volume - self.traded
+
+    def to_order_data(self) -> OrderData:
+        return OrderData(
+            symbol=self.symbol,
+            exchange=self.exchange,
+            order_id=self.order_id,
+            direction=self.direction,
+            offset=self.offset,
+            price=self.price,
+            volume=self.volume,
+            traded=self.traded,
+            status=self.status,
+            time=self.time,
+            gateway_name=GATEWAY_NAME,
+        )
+
+
+class SimPosition:
+    __slots__ = ('symbol', 'exchange', 'direction', 'today', 'yd', 'price', 'frozen')
+
+    def __init__(self, symbol: str, exchange: Exchange, direction: Direction):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.direction = direction
+        self.today = 0
+        self.yd = 0
+        self.price = 0.0   # 持仓均价
+        self.frozen = 0    # 未成交平仓委托占用的数量
+
+    @property
+    def volume(self) -> int:
+        return self.today + self.yd
+
+
+class SimExchange:
+    """模拟交易所: 行情源、委托撮合、持仓和资金"""
+    def __init__(self):
+        self.md = None
+        self.td = None
+        self.info: Dict = {}
+        self.contracts: Dict[str, ContractData] = {}
+        self.subscribed: set = set()
+        self.last_prices: Dict[str, float] = {}
+        self.orders: Dict[str, SimOrder] = {}
+        self.active: Dict[str, List[SimOrder]] = {}  # 合约 -> 未完成委托，按提交顺序
+        self.positions: Dict[Tuple[str, Direction], SimPosition] = {}
+        self.balance = 0.0
+        self.order_ref = 0
+        self.trade_ref = 0
+        self._lock = threading.RLock()
+        self._configured = False
+        self._running = False
+        self._feed: Optional[threading.Thread] = None
+        # 延迟任务: (到期时间, 序号, 函数, 参数)
+        self._tasks: List = []
+        self._task_seq = itertools.count()
+        self._task_cond = threading.Condition()
+        self._scheduler: Optional[threading.Thread] = None
+
+    # ---------- 配置与启动 ----------
+
+    def configure(self, info: Dict):
+        with self._lock:
+            if self._configured:
+                return
+            self.info = info
+            self.latency = float(info.get('sim_latency_ms', 10)) / 1000
+            self.max_fill = int(info.get('sim_max_fill', 0))
+            self.margin_ratio = float(info.get('sim_margin_ratio', 0.1))
+            self.balance = float(info.get('sim_balance', 1000000))
+            self.speed = float(info.get('sim_speed', 1))
+            self.trading_day = info.get('sim_trading_day')
+            self.tick_dir = info.get('sim_tick_dir', TICK_DIR)
+            symbols = info.get('sim_symbols')
+            if not symbols and self.trading_day:
+                symbols = list_symbols(self.trading_day, self.tick_dir)
+            self.symbols = list(symbols or [])
+            self._load_contracts()
+            self._running = True
+            self._scheduler = threading.Thread(target=self._run_tasks, name='sim-scheduler', daemon=True)
+            self._scheduler.start()
+            self._configured = True
+
+    def _load_contracts(self):
+        """合约规格取自本地合约缓存，缓存中没有的合约使用默认规格"""
+        registry = get_registry()
+        for symbol in self.symbols:
+            spec = registry.get(symbol) or ContractSpec(symbol, self.info.get('sim_exchange', DEFAULT_EXCHANGE),
+                                                        name=symbol, size=DEFAULT_SIZE,
+                                                        pricetick=DEFAULT_PRICETICK)
+            self.contracts[spec.symbol] = ContractData(
+                symbol=spec.symbol,
+                exchange=Exchange(spec.exchange),
+                name=spec.name or spec.symbol,
+                product=Product.FUTURES,
+                size=spec.size,
+                pricetick=spec.pricetick or DEFAULT_PRICETICK,
+                gateway_name=GATEWAY_NAME,
+            )
+
+    def start_feed(self):
+        with self._lock:
+            if self._feed is not None:
+                return
+            self._feed = threading.Thread(target=self._run_feed, name='sim-feed', daemon=True)
+            self._feed.start()
+
+    def close(self):
+        self._running = False
+        with self._task_cond:
+            self._task_cond.notify_all()
+
+    # ---------- 延迟任务 ----------
+
+    def schedule(self, delay: float, func, *args):
+        with self._task_cond:
+            heapq.heappush(self._tasks, (time.monotonic() + delay, next(self._task_seq), func, args))
+            self._task_cond.notify()
+
+    def _run_tasks(self):
+        while self._running:
+            with self._task_cond:
+                if not self._tasks:
+                    self._task_cond.wait(0.5)
+                    continue
+                due = self._tasks[0][0] - time.monotonic()
+                if due > 0:
+                    self._task_cond.wait(due)
+                    continue
+                _, _, func, args = heapq.heappop(self._tasks)
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"模拟网关任务失败: {str(e)}")
+                logger.exception("详细错误信息:")
+
+    # ---------- 行情 ----------
+
+    def _run_feed(self):
+        source = self._recorded_ticks() if self.trading_day else self._synthetic_ticks()
+        started = time.monotonic()
+        first_ms = None
+        count = 0
+        try:
+            for tick in source:
+                if not self._running:
+                    break
+                if self.trading_day and self.speed > 0:
+                    # 按录制时的时间间隔回放
+                    timestamp_ms = tick.datetime.timestamp() * 1000
+                    if first_ms is None:
+                        first_ms = timestamp_ms
+                    wait = (timestamp_ms - first_ms) / 1000 / self.speed - (time.monotonic() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+                self.on_tick(tick)
+                count += 1
+        except Exception as e:
+            logger.error(f"模拟行情出错: {str(e)}")
+            logger.exception("详细错误信息:")
+        logger.info(f"模拟行情结束, 共 {count} 条")
+
+    def _make_tick(self, symbol: str, dt: datetime, last: float, bid: float, ask: float,
+                   bid_volume: float, ask_volume: float, volume: float, open_interest: float) -> TickData:
+        contract = self.contracts[symbol]
+        return TickData(
+            symbol=symbol,
+            exchange=contract.exchange,
+            name=contract.name,
+            datetime=dt,
+            trading_day=self.trading_day or dt.strftime('%Y%m%d'),
+            last_price=last,
+            bid_price_1=bid,
+            ask_price_1=ask,
+            bid_volume_1=bid_volume,
+            ask_volume_1=ask_volume,
+            volume=volume,
+            open_interest=open_interest,
+            gateway_name=GATEWAY_NAME,
+        )
+
+    def _recorded_ticks(self) -> Iterator[TickData]:
+        """按时间顺序合并各合约的录制文件"""
+        def records(symbol):
+            for chunk in TickReader.open(self.trading_day, symbol, self.tick_dir).iter_chunks():
+                for record in chunk.tolist():
+                    yield record[0], symbol, record
+
+        streams = [records(symbol) for symbol in self.symbols
+                   if symbol in list_symbols(self.trading_day, self.tick_dir)]
+        for timestamp_ms, symbol, record in heapq.merge(*streams):
+            _, _, last, bid, ask, bid_volume, ask_volume, volume, open_interest = record
+            yield self._make_tick(symbol, datetime.fromtimestamp(timestamp_ms / 1000), last, bid, ask,
+                                  bid_volume, ask_volume, volume, open_interest)
+
+    def _synthetic_ticks(self) -> Iterator[TickData]:
+        """各合约按最小变动价位随机游走，买卖价差一跳"""
+        rng = random.Random(self.info.get('sim_seed'))
+        interval = float(self.info.get('sim_tick_interval', 0.5))
+        prices = dict(self.info.get('sim_prices') or {})
+        state = {symbol: [float(prices.get(symbol, DEFAULT_PRICE)), 0, 10000] for symbol in self.symbols}
+        while True:
+            now = datetime.now()
+            for symbol, values in state.items():
+                tick_size = self.contracts[symbol].pricetick
+                values[0] = max(tick_size, values[0] + rng.choice((-1, 0, 0, 1)) * tick_size)
+                values[1] += rng.randint(0, 20)
+                values[2] += rng.randint(-5, 5)
+                yield self._make_tick(symbol, now, values[0], values[0] - tick_size, values[0] + tick_size,
+                                      rng.randint(1, 30), rng.randint(1, 30), values[1], values[2])
+            time.sleep(interval)
+
+    def on_tick(self, tick: TickData):
+        with self._lock:
+            self.last_prices[tick.symbol] = tick.last_price
+            if tick.symbol in self.subscribed and self.md is not None:
+                self.md.on_event(EVENT_TICK, tick)
+            self._match(tick)
+
+    # ---------- 委托 ----------
+
+    def send_order(self, req: OrderRequest) -> str:
+        with self._lock:
+            self.order_ref += 1
+            order_id = f"{FRONT_ID}_{SESSION_ID}_{self.order_ref}"
+            order = SimOrder(order_id, req)
+            self.orders[order_id] = order
+            # 与CTP一样，先同步推送提交中的委托
+            self._emit_order(order)
+
+            reason = self._check_order(order)
+            if reason:
+                logger.warning(f"模拟网关拒绝委托 {order_id}: {reason}")
+                self.schedule(self.latency, self._finish, order_id, Status.REJECTED)
+            else:
+                position = self._close_position(order)
+                if position is not None:
+                    position.frozen += order.volume
+                self.active.setdefault(order.symbol, []).append(order)
+                self.schedule(self.latency, self._accept, order_id)
+            return f"{GATEWAY_NAME}.{order_id}"
+
+    def _check_order(self, order: SimOrder) -> Optional[str]:
+        if order.symbol not in self.contracts:
+            return f"未知合约 {order.symbol}"
+        if order.volume <= 0 or order.price <= 0:
+            return "委托价格或数量无效"
+        position = self._close_position(order)
+        if position is None:
+            return None
+        if order.offset == Offset.CLOSETODAY:
+            available = position.today
+        elif order.offset == Offset.CLOSEYESTERDAY:
+            available = position.yd
+        else:
+            available = position.volume
+        if order.volume > available - position.frozen:
+            return f"可平仓数量不足 {available - position.frozen}"
+        return None
+
+    def _close_position(self, order: SimOrder) -> Optional[SimPosition]:
+        """平仓委托对应的持仓，开仓委托返回None"""
+        if order.offset == Offset.OPEN:
+            return None
+        direction = Direction.SHORT if order.direction == Direction.LONG else Direction.LONG
+        return self._position(order.symbol, order.exchange, direction)
+
+    def _position(self, symbol: str, exchange: Exchange, direction: Direction) -> SimPosition:
+        position = self.positions.get((symbol, direction))
+        if position is None:
+            position = self.positions[(symbol, direction)] = SimPosition(symbol, exchange, direction)
+        return position
+
+    def _accept(self, order_id: str):
+        with self._lock:
+            order = self.orders[order_id]
+            if order.status != Status.SUBMITTING:
+                return
+            order.status = Status.NOTTRADED
+            order.accepted = True
+            self._emit_order(order)
+
+    def cancel_order(self, req: CancelRequest):
+        # 兼容带网关前缀的本地委托号
+        order_id = req.order_id.split('.', 1)[-1]
+        self.schedule(self.latency, self._finish, order_id, Status.CANCELLED)
+
+    def _finish(self, order_id: str, status: Status):
+        """撤单或拒绝，释放平仓冻结"""
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None or order.status in (Status.ALLTRADED, Status.CANCELLED, Status.REJECTED):
+                return
+            if order in self.active.get(order.symbol, ()):
+                self.active[order.symbol].remove(order)
+                position = self._close_position(order)
+                if position is not None:
+                    position.frozen -= order.remaining
+            order.status = status
+            self._emit_order(order)
+
+    def _match(self, tick: TickData):
+        """限价单与对手价撮合，同一条TICK的挂单量在各委托间依次扣减"""
+        orders = self.active.get(tick.symbol)
+        if not orders:
+            return
+        ask_left = tick.ask_volume_1 or 0
+        bid_left = tick.bid_volume_1 or 0
+        for order in list(orders):
+            if not order.accepted:
+                continue
+            if order.direction == Direction.LONG:
+                if not tick.ask_price_1 or order.price < tick.ask_price_1:
+                    continue
+                price, available = tick.ask_price_1, ask_left
+            else:
+                if not tick.bid_price_1 or order.price > tick.bid_price_1:
+                    continue
+                price, available = tick.bid_price_1, bid_left
+            volume = min(order.remaining, int(available))
+            if self.max_fill:
+                volume = min(volume, self.max_fill)
+            if volume <= 0:
+                continue
+            if order.direction == Direction.LONG:
+                ask_left -= volume
+            else:
+                bid_left -= volume
+            self._fill(order, price, volume)
+
+    def _fill(self, order: SimOrder, price: float, volume: int):
+        size = self.contracts[order.symbol].size
+        order.traded += volume
+        order.status = Status.ALLTRADED if order.remaining == 0 else Status.PARTTRADED
+        if order.status == Status.ALLTRADED:
+            self.active[order.symbol].remove(order)
+
+        if order.offset == Offset.OPEN:
+            position = self._position(order.symbol, order.exchange, order.direction)
+            total = position.volume + volume
+            position.price = (position.price * position.volume + price * volume) / total
+            position.today += volume
+        else:
+            position = self._close_position(order)
+            position.frozen -= volume
+            if order.offset == Offset.CLOSETODAY:
+                position.today -= volume
+            elif order.offset == Offset.CLOSEYESTERDAY:
+                position.yd -= volume
+            else:
+                from_yd = min(position.yd, volume)
+                position.yd -= from_yd
+                position.today -= volume - from_yd
+            sign = 1 if position.direction == Direction.LONG else -1
+            self.balance += (price - position.price) * volume * size * sign
+            if position.volume == 0:
+                position.price = 0.0
+
+        self.trade_ref += 1
+        trade = TradeData(
+            symbol=order.symbol,
+            exchange=order.exchange,
+            order_id=order.order_id,
+            tradeid=str(self.trade_ref),
+            direction=order.direction,
+            offset=order.offset,
+            price=price,
+            volume=volume,
+            time=datetime.now().strftime('%H:%M:%S'),
+            order_time=order.time,
+            gateway_name=GATEWAY_NAME,
+        )
+        self._emit_order(order)
+        if self.td is not None:
+            self.td.on_event(EVENT_TRADE, trade)
+            self.td.on_event(EVENT_POSITION, self._position_data(position))
+
+    # ---------- 持仓与资金 ----------
+
+    def _position_data(self, position: SimPosition) -> PositionData:
+        size = self.contracts[position.symbol].size
+        last = self.last_prices.get(position.symbol, position.price)
+        sign = 1 if position.direction == Direction.LONG else -1
+        float_pnl = (last - position.price) * position.volume * size * sign if position.volume else 0
+        return PositionData(
+            symbol=position.symbol,
+            exchange=position.exchange,
+            direction=position.direction,
+            volume=position.volume,
+            yd_volume=position.yd,
+            frozen=position.frozen,
+            price=position.price,
+            open_price=position.price,
+            pnl=float_pnl,
+            float_pnl=float_pnl,
+            gateway_name=GATEWAY_NAME,
+        )
+
+    def query_position(self):
+        with self._lock:
+            if self.td is None:
+                return
+            for position in list(self.positions.values()):
+                self.td.on_event(EVENT_POSITION, self._position_data(position))
+
+    def query_account(self):
+        """balance 为静态权益(初始资金+平仓盈亏)，与CTP回报中持仓盈亏单列的口径一致"""
+        with self._lock:
+            if self.td is None:
+                return
+            float_pnl = 0.0
+            margin = 0.0
+            for position in self.positions.values():
+                if not position.volume:
+                    continue
+                data = self._position_data(position)
+                float_pnl += data.float_pnl
+                last = self.last_prices.get(position.symbol, position.price)
+                margin += last * position.volume * self.contracts[position.symbol].size * self.margin_ratio
+            self.td.on_event(EVENT_ACCOUNT, AccountData(
+                accountid=self.info.get('userid') or GATEWAY_NAME,
+                balance=self.balance,
+                frozen=margin,
+                available=self.balance + float_pnl - margin,
+                gateway_name=GATEWAY_NAME,
+            ))
+
+    def _emit_order(self, order: SimOrder):
+        if self.td is not None:
+            self.td.on_event(EVENT_ORDER, order.to_order_data())
+
+    def login(self):
+        """交易接口登录: 推送合约、持仓、资金，然后通知初始化完成"""
+        with self._lock:
+            for contract in self.contracts.values():
+                self.td.on_event(EVENT_CONTRACT, contract)
+            self.td.on_event(EVENT_LOG, "合约信息查询成功")
+        self.query_position()
+        self.query_account()
+        self.td.login_done()
+
+
+class SimMdApi:
+    """模拟行情接口"""
+    def __init__(self, app_signal):
+        self.app_signal = app_signal
+        self.gateway_name = GATEWAY_NAME
+        self.exchange = get_exchange(app_signal)
+        self.connected = False
+
+    @property
+    def md_status(self):
+        return self.connected
+
+    def on_event(self, type_, data):
+        event = Event(type=type_, data=data)
+        if type_ == EVENT_TICK:
+            signal = getattr(ctpbee.signals.common_signals, f"{type_}_signal")
+        else:
+            signal = getattr(self.app_signal, f"{type_}_signal")
+        signal.send(event)
+
+    def connect(self, info: dict):
+        self.exchange.configure(info)
+        self.exchange.md = self
+        self.connected = True
+        self.on_event(EVENT_LOG, "模拟行情连接成功")
+        self.exchange.start_feed()
+
+    def subscribe(self, local_symbol: str):
+        symbol = local_symbol.split(".")[0]
+        with self.exchange._lock:
+            self.exchange.subscribed.add(symbol)
+
+    def unsubscribe(self, local_symbol: str):
+        symbol = local_symbol.split(".")[0]
+        with self.exchange._lock:
+            self.exchange.subscribed.discard(symbol)
+
+    def close(self):
+        self.connected = False
+        self.exchange.close()
+
+
+class SimTdApi:
+    """模拟交易接口，登录状态字段与 ctpbee 的 LoginRequired 一致"""
+    def __init__(self, app_signal):
+        self.app_signal = app_signal
+        self.gateway_name = GATEWAY_NAME
+        self.exchange = get_exchange(app_signal)
+        self.connect_required = False
+        self.login_required = False
+        self.position_required = False
+        self.account_required = False
+        self.contract_required = False
+        self.init_local = False
+
+    @property
+    def ready(self):
+        return (self.connect_required and self.login_required and self.position_required
+                and self.account_required and self.contract_required)
+
+    @property
+    def td_status(self):
+        return self.login_required
+
+    def on_event(self, type_, data):
+        event = Event(type=type_, data=data)
+        signal = getattr(self.app_signal, f"{type_}_signal")
+        signal.send(event)
+
+    def connect(self, info: dict):
+        self.exchange.configure(info)
+        self.exchange.td = self
+        self.connect_required = True
+        self.on_event(EVENT_LOG, "模拟交易连接成功")
+        # 与CTP一样异步完成登录，connect 立即返回
+        self.exchange.schedule(self.exchange.latency, self.exchange.login)
+
+    def login_done(self):
+        self.login_required = self.contract_required = True
+        self.position_required = self.account_required = True
+        self.init_local = True  # 由本接口发出初始化完成事件，定时查询线程不再重复发送
+        self.on_event(EVENT_LOG, "模拟交易接口初始化完成")
+        self.on_event(EVENT_INIT_FINISHED, True)
+
+    def send_order(self, req: OrderRequest, **kwargs) -> str:
+        return self.exchange.send_order(req)
+
+    def cancel_order(self, req: CancelRequest, **kwargs):
+        self.exchange.cancel_order(req)
+
+    def query_account(self):
+        self.exchange.query_account()
+
+    def query_position(self):
+        self.exchange.query_position()
+
+    def close(self):
+        self.login_required = False
+        self.exchange.close()
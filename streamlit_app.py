@@ -1,9 +1,11 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
+from database import get_database, now_ms
+from account_history import query_equity
+from latency_tracer import STAGE_NAMES, day_range, query_latency, query_slowest
 
 # 设置页面配置
 st.set_page_config(
@@ -12,36 +14,49 @@ st.set_page_config(
     layout="wide"
 )
 
-# 数据库连接函数
-def get_db_connection():
-    conn = sqlite3.connect('signals.db')
-    return conn
+# 看板只读取数据，使用只读连接池避免阻塞交易执行器写入
+read_db = get_database(read_only=True)
 
 # 获取交易信号数据
 def get_trading_signals():
-    conn = get_db_connection()
     query = '''
     SELECT id, symbol, action, price, volume, timestamp, status, processed, process_time, strategy
     FROM trading_signals 
     ORDER BY timestamp DESC
     '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with read_db.connection() as conn:
+        df = pd.read_sql_query(query, conn)
     return df
 
 # 获取账户数据
 def get_account_data():
-    conn = get_db_connection()
     query = '''
     SELECT balance, equity, available, position_profit, timestamp
     FROM account_info
     ORDER BY timestamp DESC
     LIMIT 1
     '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with read_db.connection() as conn:
+        df = pd.read_sql_query(query, conn)
     return df
 
+# 获取权益曲线，精度按时间跨度自动选择
+def get_equity_curve(start_ms):
+    with read_db.get_cursor() as c:
+        bars = query_equity(c, start_ms, now_ms())
+    df = pd.DataFrame(bars)
+    if not df.empty:
+        df['time'] = pd.to_datetime(df['timestamp_ms'], unit='ms', utc=True).dt.tz_convert('Asia/Shanghai')
+    return df
+
+# 获取信号延迟统计和最慢信号
+def get_latency(days, symbol=None):
+    start_day, end_day = day_range(days)
+    with read_db.get_cursor() as c:
+        stats = query_latency(c, start_day, end_day, symbol)
+        traces = query_slowest(c, start_day, end_day, 20, symbol)
+    return stats, traces
+
 # 主页面标题
 st.title("📈 交易信号仪表板")
 
@@ -93,6 +108,41 @@ with col3:
             value=f"¥{account_df['position_profit'].iloc[0]:,.2f}"
         )
 
+# 权益曲线
+st.subheader("权益曲线")
+range_days = {"最近24小时": 1, "最近7天": 7, "最近30天": 30}
+equity_start = now_ms() - range_days[time_range] * 86400 * 1000 if time_range in range_days else 0
+equity_df = get_equity_curve(equity_start)
+if not equity_df.empty:
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=equity_df['time'],
+        y=equity_df['close'],
+        mode='lines',
+        name='权益',
+        line=dict(color='#1f77b4', width=2)
+    ))
+    # 汇总后的K线显示区间内的最高/最低权益
+    fig.add_trace(go.Scatter(
+        x=pd.concat([equity_df['time'], equity_df['time'][::-1]]),
+        y=pd.concat([equity_df['high'], equity_df['low'][::-1]]),
+        fill='toself',
+        fillcolor='rgba(31, 119, 180, 0.15)',
+        line=dict(width=0),
+        name='区间高低',
+        hoverinfo='skip'
+    ))
+    fig.update_layout(
+        xaxis_title='时间',
+        yaxis_title='权益',
+        template='plotly_white',
+        hovermode='x unified',
+        showlegend=True
+    )
+    st.plotly_chart(fig, use_container_width=True)
+else:
+    st.info("暂无账户历史数据")
+
 # 交易信号统计
 st.subheader("交易信号概览")
 signal_stats = signals_df.groupby('action').size().reset_index(name='count')
@@ -183,4 +233,54 @@ if not signals_df.empty:
     # 显示图表
     st.plotly_chart(fig, use_container_width=True)
 else:
-    st.info("当前时间段内没有交易信号数据") 
\ No newline at end of file
+    st.info("当前时间段内没有交易信号数据") 
+# 信号延迟
+st.subheader("信号延迟")
+latency_days = range_days.get(time_range, 30)
+latency_stats, latency_traces = get_latency(latency_days)
+latency_symbol = st.selectbox("合约", ["全部"] + latency_stats['symbols'])
+if latency_symbol != "全部":
+    latency_stats, latency_traces = get_latency(latency_days, latency_symbol)
+if latency_stats['spans']:
+    latency_df = pd.DataFrame(latency_stats['spans'])
+    latency_df['区间'] = latency_df.apply(
+        lambda row: f"{STAGE_NAMES[row['from']]} → {STAGE_NAMES[row['to']]}", axis=1)
+    # 微秒换算为毫秒显示
+    for column in ['mean_us', 'p50_us', 'p90_us', 'p99_us', 'p99.9_us', 'max_us']:
+        latency_df[column.replace('_us', '')] = latency_df[column] / 1000
+    fig = go.Figure()
+    for column, color in [('p50', '#1f77b4'), ('p99', '#ff7f0e')]:
+        fig.add_trace(go.Bar(x=latency_df['区间'], y=latency_df[column], name=column, marker_color=color))
+    fig.update_layout(
+        xaxis_title='区间',
+        yaxis_title='延迟 (毫秒)',
+        yaxis_type='log',
+        template='plotly_white',
+        barmode='group'
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(
+        latency_df[['区间', 'count', 'mean', 'p50', 'p90', 'p99', 'p99.9', 'max']],
+        column_config={
+            "count": "信号数",
+            "mean": st.column_config.NumberColumn("平均(ms)", format="%.2f"),
+            "p50": st.column_config.NumberColumn("p50(ms)", format="%.2f"),
+            "p90": st.column_config.NumberColumn("p90(ms)", format="%.2f"),
+            "p99": st.column_config.NumberColumn("p99(ms)", format="%.2f"),
+            "p99.9": st.column_config.NumberColumn("p99.9(ms)", format="%.2f"),
+            "max": st.column_config.NumberColumn("最大(ms)", format="%.2f"),
+        },
+        hide_index=True
+    )
+    if latency_traces:
+        # 最慢信号各阶段相对最早阶段的时间
+        traces_df = pd.DataFrame([{
+            '信号ID': trace['signal_id'],
+            '合约': trace['symbol'],
+            '总耗时(ms)': trace['total_us'] / 1000,
+            **{STAGE_NAMES[stage]: offset / 1000 for stage, offset in trace['stages'].items()}
+        } for trace in latency_traces])
+        st.caption("最慢信号 (各阶段相对最早阶段的毫秒数)")
+        st.dataframe(traces_df, hide_index=True)
+else:
+    st.info("暂无信号延迟数据")
@@ -0,0 +1,124 @@
+"""按合约保存最近的TICK
+
+每个合约一个定长环形缓冲区，各字段存放在NumPy结构化数组中。
+数组长度为容量的两倍，每条TICK同时写入 i 和 i + capacity 两个位置，
+任意最近 n 条数据在数组中总是连续的，读取窗口时直接返回视图，不拷贝、不拼接。
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 4096
+
+# TICK的定长记录格式，录制文件(tick_recorder.py)使用同一格式
+TICK_DTYPE = np.dtype([
+    ('timestamp_ms', '<i8'),   # 行情时间
+    ('recv_ns', '<i8'),        # 本地收到的时间
+    ('last_price', '<f8'),
+    ('bid_price', '<f8'),
+    ('ask_price', '<f8'),
+    ('bid_volume', '<f8'),
+    ('ask_volume', '<f8'),
+    ('volume', '<f8'),         # 当日累计成交量
+    ('open_interest', '<f8'),
+])
+
+
+def tick_record(tick, recv_ns: Optional[int] = None) -> tuple:
+    """TickData 转为 TICK_DTYPE 的一条记录"""
+    return (
+        int(tick.datetime.timestamp() * 1000) if tick.datetime else 0,
+        recv_ns if recv_ns is not None else time.time_ns(),
+        tick.last_price or 0,
+        tick.bid_price_1 or 0,
+        tick.ask_price_1 or 0,
+        tick.bid_volume_1 or 0,
+        tick.ask_volume_1 or 0,
+        tick.volume or 0,
+        tick.open_interest or 0,
+    )
+
+
+class TickBuffer:
+    """单个合约的TICK环形缓冲区
+
+    只有行情回调线程写入。读取返回的是底层数组的视图，后续写入会覆盖其中最早的数据，
+    需要长期持有时调用方自行 copy()。
+    """
+    def __init__(self, symbol: str, capacity: int = DEFAULT_CAPACITY):
+        self.symbol = symbol
+        self.capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=TICK_DTYPE)
+        self.count = 0  # 累计写入条数
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, record: tuple):
+        pos = self.count % self.capacity
+        self._data[pos] = record
+        self._data[pos + self.capacity] = record
+        self.count += 1
+
+    def window(self, n: Optional[int] = None) -> np.ndarray:
+        """最近 n 条(默认全部)，按时间从早到晚排列的只读视图"""
+        count = self.count
+        available = min(count, self.capacity)
+        n = available if n is None else min(n, available)
+        end = count % self.capacity + self.capacity
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def column(self, field: str, n: Optional[int] = None) -> np.ndarray:
+        """单个字段最近 n 条的视图，如 column('last_price', 100)"""
+        return self.window(n)[field]
+
+    def since(self, timestamp_ms: int) -> np.ndarray:
+        """行情时间不早于 timestamp_ms 的数据"""
+        window = self.window()
+        start = np.searchsorted(window['timestamp_ms'], timestamp_ms, side='left')
+        return window[start:]
+
+    def last(self) -> Optional[np.void]:
+        if not self.count:
+            return None
+        return self._data[(self.count - 1) % self.capacity]
+
+
+class TickBuffers:
+    """各合约的TICK缓冲区，收到合约的第一条TICK时创建"""
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._buffers: Dict[str, TickBuffer] = {}
+        self._lock = threading.Lock()
+
+    def append(self, tick, recv_ns: Optional[int] = None) -> tuple:
+        """写入一条TICK，返回转换后的记录"""
+        buffer = self._buffers.get(tick.symbol)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(tick.symbol, TickBuffer(tick.symbol, self.capacity))
+        record = tick_record(tick, recv_ns)
+        buffer.append(record)
+        return record
+
+    def get(self, symbol: str) -> Optional[TickBuffer]:
+        return self._buffers.get(symbol)
+
+    def window(self, symbol: str, n: Optional[int] = None) -> Optional[np.ndarray]:
+        buffer = self._buffers.get(symbol)
+        return buffer.window(n) if buffer is not None else None
+
+    def symbols(self):
+        with self._lock:
+            return list(self._buffers)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(buffer._data.nbytes for buffer in self._buffers.values())
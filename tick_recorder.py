@@ -0,0 +1,250 @@
+"""TICK录制
+
+每个合约每个交易日一个只追加的二进制文件 {目录}/{交易日}/{合约}.ticks，
+文件头之后是 TICK_DTYPE 格式的定长记录。写入通过内存映射完成，回调线程上只有一次
+结构化数组赋值和文件头计数的更新，不做任何序列化。文件按块预分配，写满后扩大并重新映射，
+关闭时截断到实际长度。
+
+文件头中的记录数在记录写入之后才更新，读取方(包括录制进行中的文件)只会看到完整的记录。
+读取时把文件映射为NumPy数组，切片和按时间查询都不拷贝数据。
+"""
+import argparse
+import logging
+import mmap
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from tick_buffer import TICK_DTYPE
+
+logger = logging.getLogger(__name__)
+
+TICK_DIR = 'ticks'
+FILE_SUFFIX = '.ticks'
+MAGIC = b'TVCTICK1'
+VERSION = 1
+CHUNK_RECORDS = 65536  # 每次扩大文件时增加的记录数
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('count', '<u8'),
+    ('reserved', 'V40'),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize  # 64
+
+
+def tick_path(directory: str, trading_day: str, symbol: str) -> str:
+    return os.path.join(directory, trading_day, f"{symbol}{FILE_SUFFIX}")
+
+
+def trading_day_of(tick) -> str:
+    """TICK所属交易日，夜盘归入下一交易日；网关未提供时取行情日期"""
+    trading_day = getattr(tick, 'trading_day', '')
+    if trading_day:
+        return trading_day
+    return (tick.datetime or datetime.now()).strftime('%Y%m%d')
+
+
+def _check_header(header: np.ndarray, path: str):
+    if header['magic'] != MAGIC or header['record_size'] != TICK_DTYPE.itemsize:
+        raise ValueError(f"不是有效的TICK录制文件: {path}")
+
+
+class TickFile:
+    """单个合约单个交易日的录制文件，已存在时接着写"""
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER_SIZE:
+            header = np.zeros(1, dtype=HEADER_DTYPE)
+            header['magic'] = MAGIC
+            header['version'] = VERSION
+            header['record_size'] = TICK_DTYPE.itemsize
+            self._file.write(header.tobytes())
+            self._file.flush()
+            size = HEADER_SIZE
+        self._map(max(size, HEADER_SIZE + CHUNK_RECORDS * TICK_DTYPE.itemsize))
+        _check_header(self._header[0], path)
+        self.count = int(self._header[0]['count'])
+
+    def _map(self, size: int):
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self._mmap)
+        self.capacity = (size - HEADER_SIZE) // TICK_DTYPE.itemsize
+        self._records = np.ndarray(self.capacity, dtype=TICK_DTYPE, buffer=self._mmap, offset=HEADER_SIZE)
+
+    def _unmap(self):
+        # 先释放指向映射的数组，否则 mmap 无法关闭
+        self._header = self._records = None
+        self._mmap.close()
+
+    def append(self, record: tuple):
+        if self.count >= self.capacity:
+            self._grow()
+        self._records[self.count] = record
+        self.count += 1
+        self._header[0]['count'] = self.count
+
+    def _grow(self):
+        size = HEADER_SIZE + (self.capacity + CHUNK_RECORDS) * TICK_DTYPE.itemsize
+        self._mmap.flush()
+        self._unmap()
+        self._map(size)
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+        """写回磁盘并把文件截断到实际长度"""
+        if self._mmap.closed:
+            return
+        self._mmap.flush()
+        self._unmap()
+        self._file.truncate(HEADER_SIZE + self.count * TICK_DTYPE.itemsize)
+        self._file.close()
+
+
+class TickRecorder:
+    """按合约、交易日录制TICK，交易日变化时自动切换文件"""
+    def __init__(self, directory: str = TICK_DIR):
+        self.directory = directory
+        self._files: Dict[str, TickFile] = {}
+        self._days: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.recorded = 0
+
+    def record(self, symbol: str, trading_day: str, record: tuple):
+        with self._lock:
+            # 关闭后仍在到达的TICK直接丢弃，不再打开新文件
+            if self._closed:
+                return
+            tick_file = self._files.get(symbol)
+            if tick_file is None or self._days[symbol] != trading_day:
+                tick_file = self._open(symbol, trading_day)
+            tick_file.append(record)
+            self.recorded += 1
+
+    def on_tick(self, tick, record: tuple):
+        """record 为 tick_buffer.tick_record 转换后的记录"""
+        self.record(tick.symbol, trading_day_of(tick), record)
+
+    def _open(self, symbol: str, trading_day: str) -> TickFile:
+        """切换到新交易日的文件，调用方需持有 _lock"""
+        previous = self._files.pop(symbol, None)
+        if previous is not None:
+            previous.close()
+        tick_file = self._files[symbol] = TickFile(tick_path(self.directory, trading_day, symbol))
+        self._days[symbol] = trading_day
+        logger.info(f"开始录制 {symbol} 交易日 {trading_day}, 已有 {tick_file.count} 条")
+        return tick_file
+
+    def flush(self):
+        with self._lock:
+            for tick_file in self._files.values():
+                tick_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for tick_file in self._files.values():
+                tick_file.close()
+            self._files.clear()
+            self._days.clear()
+
+
+class TickReader:
+    """只读映射一个录制文件，数据以 TICK_DTYPE 结构化数组的视图返回"""
+    def __init__(self, path: str):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if not len(header):
+            raise ValueError(f"不是有效的TICK录制文件: {path}")
+        _check_header(header[0], path)
+        self._records = np.memmap(path, dtype=TICK_DTYPE, mode='r', offset=HEADER_SIZE)
+        self._header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))
+
+    @classmethod
+    def open(cls, trading_day: str, symbol: str, directory: str = TICK_DIR) -> 'TickReader':
+        return cls(tick_path(directory, trading_day, symbol))
+
+    def __len__(self):
+        # 录制中的文件记录数会增长，读取时以文件头为准
+        return min(int(self._header[0]['count']), len(self._records))
+
+    @property
+    def ticks(self) -> np.ndarray:
+        """全部已写入的记录"""
+        return self._records[:len(self)]
+
+    def __getitem__(self, index):
+        return self.ticks[index]
+
+    def between(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> np.ndarray:
+        """行情时间在 [start_ms, end_ms) 内的记录"""
+        ticks = self.ticks
+        times = ticks['timestamp_ms']
+        start = np.searchsorted(times, start_ms, side='left') if start_ms is not None else 0
+        end = np.searchsorted(times, end_ms, side='left') if end_ms is not None else len(ticks)
+        return ticks[start:end]
+
+    def iter_chunks(self, size: int = CHUNK_RECORDS) -> Iterator[np.ndarray]:
+        ticks = self.ticks
+        for start in range(0, len(ticks), size):
+            yield ticks[start:start + size]
+
+
+def list_days(directory: str = TICK_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+
+
+def list_symbols(trading_day: str, directory: str = TICK_DIR) -> List[str]:
+    day_dir = os.path.join(directory, trading_day)
+    if not os.path.isdir(day_dir):
+        return []
+    return sorted(name[:-len(FILE_SUFFIX)] for name in os.listdir(day_dir) if name.endswith(FILE_SUFFIX))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TICK录制文件')
+    parser.add_argument('command', choices=['list', 'show'],
+                        help='list: 列出各交易日的录制合约和条数; show: 输出某合约某日的TICK')
+    parser.add_argument('--dir', default=TICK_DIR, help=f"录制目录, 默认 {TICK_DIR}")
+    parser.add_argument('--day', help='交易日, 如 20250103')
+    parser.add_argument('--symbol', help='合约代码')
+    parser.add_argument('--output', help='show 时把TICK写入CSV')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for day in ([args.day] if args.day else list_days(args.dir)):
+            for symbol in list_symbols(day, args.dir):
+                reader = TickReader.open(day, symbol, args.dir)
+                print(f"{day} {symbol}: {len(reader)}")
+        return
+
+    if not args.day or not args.symbol:
+        parser.error('show 需要 --day 和 --symbol')
+    import pandas as pd
+    df = pd.DataFrame(TickReader.open(args.day, args.symbol, args.dir).ticks)
+    df['time'] = pd.to_datetime(df['timestamp_ms'], unit='ms', utc=True).dt.tz_convert('Asia/Shanghai')
+    # 本地收到行情与行情时间之差，包含网络延迟和两端时钟偏差
+    df['delay_ms'] = df['recv_ns'] / 1e6 - df['timestamp_ms']
+    if args.output:
+        df.to_csv(args.output, index=False)
+    with pd.option_context('display.width', 200, 'display.max_rows', 100):
+        print(df)
+        print(df['delay_ms'].describe())
+
+
+if __name__ == '__main__':
+    main()
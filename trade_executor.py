@@ -1,4 +1,6 @@
 import os
+import signal
+import sys
 import logging
 from signal_monitor import SignalMonitor
 
@@ -17,6 +19,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def main():
+    # kill 发送的 SIGTERM 按正常退出处理，保证回调数据写入数据库
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    monitor = None
     try:
         monitor = SignalMonitor()
         monitor.setup()
@@ -24,6 +29,9 @@ def main():
     except Exception as e:
         logger.error(f"程序启动失败: {str(e)}")
         exit(1)
+    finally:
+        if monitor is not None:
+            monitor.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,34 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = 'executor_snapshot.json'
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Dict:
+    """读取上次运行保存的状态，文件不存在或损坏时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        age = time.time() - snapshot.get('saved_at', 0)
+        logger.info(f"载入启动快照, 保存于 {age:.0f} 秒前")
+        return snapshot
+    except Exception as e:
+        logger.error(f"读取启动快照失败: {str(e)}")
+        return {}
+
+
+def save_snapshot(state: Dict, path: str = SNAPSHOT_PATH):
+    """保存当前状态，先写临时文件再替换"""
+    snapshot = dict(state, saved_at=time.time())
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)